@@ -1,6 +1,14 @@
+import 'dart:async';
+import 'dart:collection';
 import 'dart:convert';
 import 'dart:io';
+import 'dart:isolate';
+import 'dart:math';
+import 'dart:typed_data';
+import 'dart:ui' show FrameTiming;
 import 'package:flutter/material.dart';
+import 'package:flutter/rendering.dart';
+import 'package:flutter/scheduler.dart';
 import 'package:image_picker/image_picker.dart';
 import 'package:socket_io_client/socket_io_client.dart' as IO;
 import 'package:geolocator/geolocator.dart';
@@ -8,11 +16,12 @@ import 'package:flutter_webrtc/flutter_webrtc.dart';
 import 'package:crypto/crypto.dart';
 import 'package:uuid/uuid.dart';
 import 'package:flutter/material.dart';
-import 'socket_service.dart';
 import 'package:permission_handler/permission_handler.dart';
 import 'package:contacts_service/contacts_service.dart';
-import 'package:encrypt/encrypt.dart' as encrypt;
+import 'package:pointycastle/export.dart' as pc;
 import 'package:intl_phone_number_input/intl_phone_number_input.dart';
+import 'package:path_provider/path_provider.dart';
+import 'package:image/image.dart' as img;
 
 void main() => runApp(MyApp());
 
@@ -104,6 +113,110 @@ class _HomeScreenState extends State<HomeScreen> with SingleTickerProviderStateM
       );
 }
 
+/// Yazıyor bilgisinin gönderimi ve takibi.
+///
+/// Giden "yazıyor / bıraktı" olayları konuşma başına en fazla [throttle]
+/// aralıkla bir kez gönderilir. Gelen olaylar kullanıcı başına bir bitiş
+/// zamanıyla tutulur ve hepsi için tek bir zamanlayıcı kullanılır.
+/// Dinleyiciler yalnızca yazan kullanıcı kümesi değiştiğinde uyarılır.
+class TypingPresence extends ChangeNotifier {
+  final String conversationId;
+  final String username;
+  final void Function(Map<String, dynamic> event) emit;
+  final Duration throttle;
+  final Duration idle;
+  final Duration expiry;
+
+  final Map<String, DateTime> _remote = {};
+  DateTime _lastSent = DateTime.fromMillisecondsSinceEpoch(0);
+  bool _sentTyping = false;
+  Timer? _idleTimer;
+  Timer? _expiryTimer;
+
+  TypingPresence({
+    required this.conversationId,
+    required this.username,
+    required this.emit,
+    this.throttle = const Duration(seconds: 2),
+    this.idle = const Duration(seconds: 3),
+    this.expiry = const Duration(seconds: 5),
+  });
+
+  Iterable<String> get typingUsers => _remote.keys;
+  bool get anyoneTyping => _remote.isNotEmpty;
+
+  /// Metin kutusundaki her değişiklikte çağrılır.
+  void onLocalInput(String text) {
+    if (text.isEmpty) {
+      stop();
+      return;
+    }
+    // Yazmaya devam edildikçe "yazıyor" bilgisi pencere başına bir kez tazelenir
+    if (DateTime.now().difference(_lastSent) >= throttle) _send(true);
+    _idleTimer?.cancel();
+    _idleTimer = Timer(idle, stop);
+  }
+
+  /// Yazmayı bıraktığını bildirir; son gönderimden beri [throttle] dolmadıysa
+  /// bildirim pencere sonuna ertelenir.
+  void stop() {
+    _idleTimer?.cancel();
+    if (!_sentTyping) return;
+    final wait = throttle - DateTime.now().difference(_lastSent);
+    if (wait > Duration.zero) {
+      _idleTimer = Timer(wait, stop);
+      return;
+    }
+    _send(false);
+  }
+
+  void _send(bool typing) {
+    _sentTyping = typing;
+    _lastSent = DateTime.now();
+    emit({'conversation': conversationId, 'username': username, 'typing': typing});
+  }
+
+  /// Sunucudan gelen `typing` olayı. Eski istemciler yalnızca kullanıcı adını
+  /// gönderir; bu durumda "yazıyor" kabul edilir.
+  void onRemote(dynamic data) {
+    final user = data is Map ? data['username'] : '$data';
+    if (user is! String || user.isEmpty || user == username) return;
+    if (data is Map && data['conversation'] != null && data['conversation'] != conversationId) return;
+    final typing = data is Map ? data['typing'] != false : true;
+    final wasTyping = _remote.containsKey(user);
+    if (typing) {
+      _remote[user] = DateTime.now().add(expiry);
+    } else {
+      _remote.remove(user);
+    }
+    _scheduleExpiry();
+    if (wasTyping != typing) notifyListeners();
+  }
+
+  void _scheduleExpiry() {
+    _expiryTimer?.cancel();
+    if (_remote.isEmpty) return;
+    final next = _remote.values.reduce((a, b) => a.isBefore(b) ? a : b);
+    _expiryTimer = Timer(next.difference(DateTime.now()), _expire);
+  }
+
+  void _expire() {
+    final now = DateTime.now();
+    final before = _remote.length;
+    _remote.removeWhere((_, until) => !until.isAfter(now));
+    _scheduleExpiry();
+    if (_remote.length != before) notifyListeners();
+  }
+
+  @override
+  void dispose() {
+    _idleTimer?.cancel();
+    _expiryTimer?.cancel();
+    if (_sentTyping) _send(false);
+    super.dispose();
+  }
+}
+
 class ChatScreen extends StatefulWidget {
   final String username;
   ChatScreen({required this.username});
@@ -113,106 +226,432 @@ class ChatScreen extends StatefulWidget {
 }
 
 class _ChatScreenState extends State<ChatScreen> {
-  late IO.Socket socket;
+  late final ChannelSubscription _channel;
   final _ctrl = TextEditingController();
-  List<String> _msgs = [];
-  bool _typing = false;
+  late final MessageRepository _msgs;
+  late final IngestBuffer<ChatMessage> _ingest;
+  late final TypingPresence _presence;
+  final Outbox _outbox = Outbox.instance;
 
   @override
   void initState() {
     super.initState();
-    socket = IO.io('http://10.0.2.2:3000', {
-      'transports': ['websocket'],
-      'autoConnect': true,
-    });
-
-    socket.onConnect((_) => print('🔗 Bağlandı'));
-
-    socket.on('receiveMessage', (data) {
-      setState(() => _msgs.add('${data['username']}: ${data['msg']}'));
-    });
-
-    socket.on('typing', (user) {
-      setState(() => _typing = true);
-      Future.delayed(Duration(seconds: 1), () {
-        setState(() => _typing = false);
-      });
+    _msgs = MessageRepository.of('chat:${widget.username}')..addListener(_onMessagesChanged);
+    _ingest = IngestBuffer(onFlush: _msgs.addAll);
+    _channel = ConnectionManager.instance.subscribe('chat:${widget.username}', params: {'username': widget.username});
+
+    SessionKeyManager.instance.attach(_channel, 'chat', widget.username);
+
+    _channel.on('receiveMessage', (data) {
+      _ingest.add(ChatMessage(
+        id: data['id'] ?? const Uuid().v4(),
+        sender: data['username'],
+        text: data['msg'] ?? '',
+        sealed: data['sealed'],
+        keyId: data['keyId'],
+      ));
     });
 
-    _loadContacts();  // Load contacts when the screen is loaded
-  }
-
-  Future<void> _checkPermissions() async {
-    var status = await Permission.contacts.status;
-    if (!status.isGranted) {
-      await Permission.contacts.request();
-    }
-    if (await Permission.contacts.isGranted) {
-      _loadContacts();
-    } else {
-      print("Kişiler verisine erişim izni verilmedi.");
-    }
+    // Oda adı kullanıcıya özgü; yazıyor bilgisi herkesin paylaştığı genel
+    // sohbetin kimliğiyle (şifreleme ile aynı) anahtarlanır
+    _presence = TypingPresence(
+      conversationId: 'chat',
+      username: widget.username,
+      emit: (event) => _channel.emit('typing', event),
+    )..addListener(_onPresenceChanged);
+    _channel.on('typing', _presence.onRemote);
+    _outbox.addListener(_onMessagesChanged);
+
+    // Rehber oturumda bir kez, izin zaten verilmişse arka planda eşitlenir
+    ContactRepository.instance.ensureLoaded();
   }
 
-  Future<void> _loadContacts() async {
-    try {
-      final contacts = await getContacts();  // Fetch contacts
-      print("Contacts: $contacts");
-      // Handle contacts as needed (e.g., show them in the UI)
-    } catch (e) {
-      print("Error loading contacts: $e");
-    }
+  void _onMessagesChanged() {
+    if (mounted) setState(() {});
   }
 
-  Future<List<Contact>> getContacts() async {
-    try {
-      // This will return a List<Contact> directly
-      List<Contact> contacts = await ContactsService.getContacts();
-      return contacts;
-    } catch (e) {
-      print("Error: $e");
-      return [];
-    }
+  void _onPresenceChanged() {
+    if (mounted) setState(() {});
   }
 
-  void _send() {
+  Future<void> _send() async {
     final text = _ctrl.text.trim();
     if (text.isEmpty) return;
-    final msg = {'username': widget.username, 'msg': text};
-    socket.emit('sendMessage', msg);
-    setState(() => _msgs.add('Me: $text'));
     _ctrl.clear();
+    _presence.stop();
+    final message = ChatMessage(id: const Uuid().v4(), sender: widget.username, text: text);
+    final sealed = await SessionKeyManager.instance.seal('chat', message);
+    _outbox.enqueue('chat:${widget.username}', {'id': message.id, 'username': widget.username, 'sealed': sealed.sealed, 'keyId': sealed.keyId});
+    _msgs.add(sealed.opened(text));
   }
 
   @override
   void dispose() {
-    socket.dispose();
+    _ingest.dispose();
+    _msgs.removeListener(_onMessagesChanged);
+    _outbox.removeListener(_onMessagesChanged);
+    _presence.dispose();
+    SessionKeyManager.instance.detach('chat');
+    _channel.cancel();
     super.dispose();
   }
 
+  Widget _buildTile(ChatMessage m) {
+    if (m.sender != widget.username) return ListTile(title: Text('${m.sender}: ${m.displayText}'));
+    final status = _outbox.statusOf(m.id);
+    return ListTile(
+      title: Text('Me: ${m.displayText}'),
+      trailing: status == MessageStatus.failed
+          ? IconButton(icon: Icon(Icons.error, color: Colors.red), onPressed: () => _outbox.retry(m.id))
+          : Icon(status == MessageStatus.pending ? Icons.schedule : Icons.done, size: 16),
+    );
+  }
+
   @override
   Widget build(BuildContext context) => Column(children: [
         Expanded(
-          child: ListView.builder(
-            itemCount: _msgs.length,
-            itemBuilder: (_, i) => ListTile(title: Text(_msgs[i])),
+          child: MessageListView(
+            window: _msgs.window,
+            tileBuilder: _buildTile,
+            onReachOldest: _msgs.loadOlder,
+            onReachNewest: _msgs.loadNewer,
+            atNewest: _msgs.atTail,
           ),
         ),
-        if (_typing) Text('Diğer kişi yazıyor...'),
+        if (_presence.anyoneTyping) Text('Diğer kişi yazıyor...'),
         Row(children: [
           IconButton(icon: Icon(Icons.translate), onPressed: () => Navigator.push(context, MaterialPageRoute(builder: (_) => TranslateScreen()))),
           IconButton(icon: Icon(Icons.summarize), onPressed: () => Navigator.push(context, MaterialPageRoute(builder: (_) => SummaryScreen()))),
+          IconButton(icon: Icon(Icons.search), onPressed: () => Navigator.push(context, MaterialPageRoute(builder: (_) => MessageSearchScreen()))),
           Expanded(
             child: TextField(
               controller: _ctrl,
               decoration: InputDecoration(labelText: 'Mesaj'),
-              onChanged: (v) => setState(() => _typing = v.isNotEmpty),
+              onChanged: _presence.onLocalInput,
             ),
           ),
           IconButton(icon: Icon(Icons.send), onPressed: _send),
         ]),
       ]);
 }
+
+class StatusItem {
+  final String id;
+  final String author;
+  final String text;
+  final int createdAt;
+  final int expiresAt;
+  /// Sunucu henüz onaylamadı; bağlantı gelince yeniden gönderilir.
+  final bool pending;
+
+  StatusItem({
+    required this.id,
+    required this.author,
+    required this.text,
+    required this.createdAt,
+    required this.expiresAt,
+    this.pending = false,
+  });
+
+  factory StatusItem.fromJson(Map<String, dynamic> json) => StatusItem(
+        id: json['id'],
+        author: json['author'],
+        text: json['text'],
+        createdAt: json['createdAt'],
+        expiresAt: json['expiresAt'],
+      );
+
+  Map<String, dynamic> toJson() => {'id': id, 'author': author, 'text': text, 'createdAt': createdAt, 'expiresAt': expiresAt};
+
+  StatusItem sent() => StatusItem(id: id, author: author, text: text, createdAt: createdAt, expiresAt: expiresAt);
+
+  void encodeTo(ByteWriter out) {
+    out.uint8(pending ? 1 : 0);
+    out.int64(createdAt);
+    out.int64(expiresAt);
+    out.string(id);
+    out.string(author);
+    out.string(text);
+  }
+
+  factory StatusItem.decodeFrom(ByteReader input) {
+    final pending = input.uint8() & 1 != 0;
+    final createdAt = input.int64();
+    final expiresAt = input.int64();
+    return StatusItem(id: input.string(), author: input.string(), text: input.string(), createdAt: createdAt, expiresAt: expiresAt, pending: pending);
+  }
+
+  /// Akış sırası: en yeni önce, eşitlikte id.
+  static int newestFirst(StatusItem a, StatusItem b) {
+    final byTime = b.createdAt.compareTo(a.createdAt);
+    return byTime != 0 ? byTime : a.id.compareTo(b.id);
+  }
+}
+
+/// Bitiş zamanına göre ikili min-yığın; ekleme ve en erkenini çıkarma O(log n).
+class _ExpiryHeap {
+  final List<StatusItem> _items = [];
+
+  bool get isEmpty => _items.isEmpty;
+  StatusItem get first => _items.first;
+
+  void add(StatusItem item) {
+    _items.add(item);
+    var i = _items.length - 1;
+    while (i > 0) {
+      final parent = (i - 1) >> 1;
+      if (_items[parent].expiresAt <= item.expiresAt) break;
+      _items[i] = _items[parent];
+      i = parent;
+    }
+    _items[i] = item;
+  }
+
+  StatusItem removeFirst() {
+    final first = _items.first;
+    final last = _items.removeLast();
+    if (_items.isEmpty) return first;
+    var i = 0;
+    while (true) {
+      final left = 2 * i + 1;
+      if (left >= _items.length) break;
+      final right = left + 1;
+      final child = right < _items.length && _items[right].expiresAt < _items[left].expiresAt ? right : left;
+      if (_items[child].expiresAt >= last.expiresAt) break;
+      _items[i] = _items[child];
+      i = child;
+    }
+    _items[i] = last;
+    return first;
+  }
+
+  void clear() => _items.clear();
+}
+
+/// Durum (hikâye) akışı: paylaşılan socket üzerinden yayın, imleçli artımlı
+/// eşitleme ve her kaydın kendi süresiyle dolduğu kalıcı önbellek.
+///
+/// Akış `status/feed.bin`'den açılır; ekran ağı beklemeden çizilir ve sunucuya
+/// yalnızca son imleçten sonraki durumlar sorulur (`statusSync`). Kayıtlar
+/// bitiş zamanına göre bir yığında da tutulur; tek bir zamanlayıcı en erken
+/// bitişe kurulur ve süresi dolanlar yığından O(log n) ile çıkarılıp sıralı
+/// akıştan ikili aramayla silinir, liste baştan taranmaz. Çevrimdışı yayınlanan
+/// durumlar bekleyen olarak saklanır ve bağlantı gelince yeniden gönderilir;
+/// sunucu id'ye göre tekilleştirir.
+class StatusRepository extends ChangeNotifier {
+  static final StatusRepository instance = StatusRepository(ConnectionManager.instance);
+  static const int _magic = 0x4d535446;
+
+  final ConnectionManager connection;
+  final Duration ttl;
+  final Map<String, StatusItem> _items = {};
+  /// [StatusItem.newestFirst] sırasında.
+  final List<StatusItem> _feed = [];
+  final _ExpiryHeap _expiry = _ExpiryHeap();
+  int _cursor = 0;
+  late final Future<void> _ready;
+  Timer? _expiryTimer;
+  int? _timerAt;
+  Timer? _saveTimer;
+  bool _syncing = false;
+  bool _resync = false;
+
+  StatusRepository(this.connection, {this.ttl = const Duration(hours: 24)}) {
+    _ready = _load();
+    connection.socket.on('connect', (_) => sync());
+    connection.socket.on('statusChanged', (_) => sync());
+  }
+
+  Future<void> get ready => _ready;
+
+  /// En yeni önce, yalnızca süresi dolmamış durumlar.
+  List<StatusItem> get feed => List.unmodifiable(_feed);
+
+  Future<File> get _file async => File('${(await AppStorage.dir('status')).path}/feed.bin');
+
+  Future<void> _load() async {
+    final file = await _file;
+    if (!await file.exists()) return;
+    try {
+      final input = ByteReader(await file.readAsBytes());
+      if (input.varint() != _magic) throw FormatException('Durum önbelleği tanınmadı');
+      final cursor = input.varint();
+      final count = input.varint();
+      final now = DateTime.now().millisecondsSinceEpoch;
+      for (var i = 0; i < count; i++) {
+        final item = StatusItem.decodeFrom(input);
+        if (item.expiresAt > now) _put(item);
+      }
+      _cursor = cursor;
+    } catch (e) {
+      // Bozuk önbellek: sıfırdan eşitlenir
+      print("Durum önbelleği okunamadı: $e");
+      _items.clear();
+      _feed.clear();
+      _expiry.clear();
+      _cursor = 0;
+    }
+    _scheduleExpiry();
+    notifyListeners();
+  }
+
+  void _scheduleSave() {
+    _saveTimer ??= Timer(Duration(milliseconds: 500), () async {
+      _saveTimer = null;
+      final out = ByteWriter()
+        ..varint(_magic)
+        ..varint(_cursor)
+        ..varint(_feed.length);
+      for (final item in _feed) {
+        item.encodeTo(out);
+      }
+      final file = await _file;
+      final tmp = File('${file.path}.tmp');
+      await tmp.writeAsBytes(out.takeBytes(), flush: true);
+      await tmp.rename(file.path);
+    });
+  }
+
+  void _changed() {
+    notifyListeners();
+    _scheduleSave();
+  }
+
+  int _feedPosition(StatusItem item) {
+    var low = 0, high = _feed.length;
+    while (low < high) {
+      final mid = (low + high) >> 1;
+      if (StatusItem.newestFirst(_feed[mid], item) < 0) {
+        low = mid + 1;
+      } else {
+        high = mid;
+      }
+    }
+    return low;
+  }
+
+  /// Yeni veya değişen kaydı akışa ve yığına yerleştirir.
+  void _put(StatusItem item) {
+    final previous = _items[item.id];
+    if (previous != null) {
+      _feed.removeAt(_feedPosition(previous));
+    }
+    _items[item.id] = item;
+    _feed.insert(_feedPosition(item), item);
+    if (previous == null || previous.expiresAt != item.expiresAt) _expiry.add(item);
+  }
+
+  /// Yığındaki kayıt hâlâ geçerli mi; güncellenen kayıtların eski kopyaları atlanır.
+  bool _isLive(StatusItem entry) => _items[entry.id]?.expiresAt == entry.expiresAt;
+
+  void _scheduleExpiry() {
+    while (!_expiry.isEmpty && !_isLive(_expiry.first)) {
+      _expiry.removeFirst();
+    }
+    if (_expiry.isEmpty) {
+      _expiryTimer?.cancel();
+      _expiryTimer = null;
+      _timerAt = null;
+      return;
+    }
+    final at = _expiry.first.expiresAt;
+    if (_timerAt == at && _expiryTimer != null) return;
+    _expiryTimer?.cancel();
+    _timerAt = at;
+    final delay = at - DateTime.now().millisecondsSinceEpoch;
+    _expiryTimer = Timer(Duration(milliseconds: max(delay, 0)), _expire);
+  }
+
+  void _expire() {
+    _expiryTimer = null;
+    _timerAt = null;
+    final now = DateTime.now().millisecondsSinceEpoch;
+    var removed = false;
+    while (!_expiry.isEmpty && _expiry.first.expiresAt <= now) {
+      final entry = _expiry.removeFirst();
+      if (!_isLive(entry)) continue;
+      _feed.removeAt(_feedPosition(_items.remove(entry.id)!));
+      removed = true;
+    }
+    _scheduleExpiry();
+    if (removed) _changed();
+  }
+
+  /// Son imleçten bu yana yayınlanan durumları çeker; önce bekleyenleri gönderir.
+  /// Eşitleme sürerken gelen istek kaybolmaz, bitince bir tur daha çalışır.
+  Future<void> sync() async {
+    await _ready;
+    if (!connection.socket.connected) return;
+    if (_syncing) {
+      _resync = true;
+      return;
+    }
+    _syncing = true;
+    try {
+      for (final item in _feed.where((item) => item.pending).toList()) {
+        await _send(item);
+      }
+      final delta = await emitAck(connection.socket, 'statusSync', {'since': _cursor});
+      _apply(Map<String, dynamic>.from(delta));
+    } on TimeoutException {
+      print("Durum eşitlemesi zaman aşımına uğradı");
+    } finally {
+      _syncing = false;
+    }
+    if (_resync) {
+      _resync = false;
+      await sync();
+    }
+  }
+
+  /// Delta: `statuses` (imleçten sonra yayınlanan, süresi dolmamış durumlar)
+  /// ve yeni `cursor`.
+  void _apply(Map<String, dynamic> delta) {
+    final now = DateTime.now().millisecondsSinceEpoch;
+    for (final json in delta['statuses'] ?? const []) {
+      final item = StatusItem.fromJson(Map<String, dynamic>.from(json));
+      if (item.expiresAt > now) _put(item);
+    }
+    _cursor = max(_cursor, (delta['cursor'] ?? _cursor) as int);
+    _scheduleExpiry();
+    _changed();
+  }
+
+  Future<void> _send(StatusItem item) async {
+    await emitAck(connection.socket, 'statusPublish', item.toJson());
+    if (identical(_items[item.id], item)) {
+      _put(item.sent());
+      _changed();
+    }
+  }
+
+  /// Durumu hemen akışa ekler ve sunucuya yayınlar. Bağlantı yoksa bekleyen
+  /// olarak kalır ve bir sonraki [sync]'te gönderilir.
+  Future<StatusItem> publish(String author, String text, {Duration? ttl}) async {
+    await _ready;
+    final now = DateTime.now().millisecondsSinceEpoch;
+    final item = StatusItem(
+      id: const Uuid().v4(),
+      author: author,
+      text: text,
+      createdAt: now,
+      expiresAt: now + (ttl ?? this.ttl).inMilliseconds,
+      pending: true,
+    );
+    _put(item);
+    _scheduleExpiry();
+    _changed();
+    if (connection.socket.connected) {
+      try {
+        await _send(item);
+      } on TimeoutException {
+        print("Durum gönderilemedi, bağlantıda yeniden denenecek");
+      }
+    }
+    return item;
+  }
+}
+
 /// 4) Durum
 class StatusScreen extends StatefulWidget {
   final String username;
@@ -223,27 +662,64 @@ class StatusScreen extends StatefulWidget {
 
 class _StatusScreenState extends State<StatusScreen> {
   final _ctrl = TextEditingController();
-  List<String> _sts = [];
+  final StatusRepository _statuses = StatusRepository.instance;
+
+  @override
+  void initState() {
+    super.initState();
+    // Akış önbellekten hemen çizilir, eşitleme arkadan gelir
+    _statuses.addListener(_onStatusesChanged);
+    _statuses.sync();
+  }
+
+  void _onStatusesChanged() {
+    if (mounted) setState(() {});
+  }
+
+  @override
+  void dispose() {
+    _statuses.removeListener(_onStatusesChanged);
+    _ctrl.dispose();
+    super.dispose();
+  }
 
   void _add() {
     if (_ctrl.text.isEmpty) return;
-    setState(() => _sts.add('${widget.username}: ${_ctrl.text}'));
+    _statuses.publish(widget.username, _ctrl.text);
     _ctrl.clear();
   }
 
+  String _remaining(StatusItem item) {
+    final left = Duration(milliseconds: item.expiresAt - DateTime.now().millisecondsSinceEpoch);
+    return left.inHours > 0 ? '${left.inHours} sa kaldı' : '${max(left.inMinutes, 1)} dk kaldı';
+  }
+
   @override
-  Widget build(BuildContext context) => Column(children: [
-        Expanded(
-          child: ListView.builder(
-            itemCount: _sts.length,
-            itemBuilder: (_, i) => ListTile(title: Text(_sts[i])),
-          ),
-        ),
-        Row(children: [
-          Expanded(child: TextField(controller: _ctrl, decoration: InputDecoration(labelText: 'Durum'))),
-          ElevatedButton(onPressed: _add, child: Text('Yayınla')),
-        ]),
-      ]);
+  Widget build(BuildContext context) {
+    final feed = _statuses.feed;
+    return Column(children: [
+      Expanded(
+        child: feed.isEmpty
+            ? Center(child: Text('Henüz durum yok'))
+            : ListView.builder(
+                itemCount: feed.length,
+                itemBuilder: (_, i) {
+                  final item = feed[i];
+                  return ListTile(
+                    key: ValueKey(item.id),
+                    title: Text('${item.author}: ${item.text}'),
+                    subtitle: Text(_remaining(item)),
+                    trailing: item.pending ? Icon(Icons.schedule, size: 16) : null,
+                  );
+                },
+              ),
+      ),
+      Row(children: [
+        Expanded(child: TextField(controller: _ctrl, decoration: InputDecoration(labelText: 'Durum'))),
+        ElevatedButton(onPressed: _add, child: Text('Yayınla')),
+      ]),
+    ]);
+  }
 }
 
 /// 5) Profil
@@ -285,12 +761,18 @@ class SuperMenuScreen extends StatelessWidget {
   SuperMenuScreen({required this.username});
   @override
   Widget build(BuildContext context) => ListView(padding: EdgeInsets.all(16), children: [
-        ListTile(leading: Icon(Icons.videocam), title: Text('Görüntülü Arama'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => VideoCallScreen()))),
+        ListTile(leading: Icon(Icons.videocam), title: Text('Görüntülü Arama'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => VideoCallScreen(username: username)))),
         ListTile(leading: Icon(Icons.photo), title: Text('Medya Paylaş'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => MediaPickerScreen()))),
-        ListTile(leading: Icon(Icons.location_on), title: Text('Konum Paylaş'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => LocationSharingScreen()))),
+        ListTile(leading: Icon(Icons.location_on), title: Text('Konum Paylaş'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => LocationSharingScreen(username: username)))),
         ListTile(leading: Icon(Icons.block), title: Text('Blokzincir Kimlik'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => BlockchainScreen()))),
         ListTile(leading: Icon(Icons.shield), title: Text('Kuantum Şifreleme'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => QuantumStubScreen()))),
         ListTile(leading: Icon(Icons.wifi), title: Text('Mesh Offline Ağ'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => MeshStubScreen()))),
+        if (!kReleaseMode)
+          ListTile(leading: Icon(Icons.speed), title: Text('Grup Listesi Ölçümü'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => GroupChatBenchmarkScreen()))),
+        if (!kReleaseMode)
+          ListTile(leading: Icon(Icons.network_check), title: Text('Yük Ölçümü'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => LoadBenchmarkScreen()))),
+        if (!kReleaseMode)
+          ListTile(leading: Icon(Icons.video_call), title: Text('Arama Döngü Testi'), onTap: () => Navigator.push(context, MaterialPageRoute(builder: (_) => CallLoopbackScreen()))),
       ]);
 }
 
@@ -313,7 +795,9 @@ class _PhoneNumberScreenState extends State<PhoneNumberScreen> {
 
   void _submitPhoneNumber() {
     if (_formKey.currentState?.validate() ?? false) {
-      print('Onaylanan Numara: ${_phoneNumber.phoneNumber}');
+      // Rehber eşleştirmesiyle aynı E.164 biçimi
+      final e164 = normalizePhone(_phoneNumber.phoneNumber ?? '', _phoneNumber.dialCode?.replaceAll('+', '') ?? deviceDialCode);
+      print('Onaylanan Numara: $e164');
     }
   }
 
@@ -352,564 +836,6601 @@ class _PhoneNumberScreenState extends State<PhoneNumberScreen> {
   }
 }
 
-class PhoneNumberList extends StatefulWidget {
-  @override
-  _PhoneNumberListState createState() => _PhoneNumberListState();
+const Map<String, String> _dialCodes = {
+  'TR': '90', 'US': '1', 'CA': '1', 'GB': '44', 'DE': '49', 'FR': '33', 'NL': '31', 'BE': '32',
+  'AT': '43', 'CH': '41', 'IT': '39', 'ES': '34', 'SE': '46', 'NO': '47', 'DK': '45', 'AZ': '994',
+  'RU': '7', 'UA': '380', 'GR': '30', 'BG': '359', 'SA': '966', 'AE': '971', 'IN': '91', 'CN': '86',
+};
+
+/// Cihaz bölgesinin ülke kodu; bilinmiyorsa Türkiye.
+String get deviceDialCode => _dialCodes[WidgetsBinding.instance.platformDispatcher.locale.countryCode] ?? '90';
+
+/// Rehberdeki bir numarayı E.164 biçimine (`+905321234567`) çevirir.
+///
+/// `+` veya `00` ile başlayanlar uluslararası, `0` ile başlayanlar ulusal
+/// (başındaki sıfır atılır) kabul edilir. Öneksiz numaralar 10 haneye
+/// kadar ulusal sayılır ve [dialCode] eklenir. Geçersizse null döner.
+String? normalizePhone(String raw, String dialCode) {
+  final international = raw.trimLeft().startsWith('+');
+  var digits = raw.replaceAll(RegExp(r'\D'), '');
+  if (international) {
+    // olduğu gibi
+  } else if (digits.startsWith('00')) {
+    digits = digits.substring(2);
+  } else if (digits.startsWith('0')) {
+    digits = dialCode + digits.substring(1);
+  } else if (digits.length <= 10) {
+    digits = dialCode + digits;
+  }
+  if (digits.length < 8 || digits.length > 15) return null;
+  return '+$digits';
 }
 
-class _PhoneNumberListState extends State<PhoneNumberList> {
-  List<Contact> contacts = [];
+/// Arama için büyük/küçük harf ve Türkçe harf farklarını kaldırır:
+/// I/ı/İ/i → i, ş → s, ğ → g, ü → u, ö → o, ç → c.
+String foldForSearch(String text) {
+  const from = 'IıİŞşĞğÜüÖöÇç';
+  const to = 'iiissgguuoocc';
+  final out = StringBuffer();
+  for (final rune in text.runes) {
+    final char = String.fromCharCode(rune);
+    final at = from.indexOf(char);
+    out.write(at < 0 ? char.toLowerCase() : to[at]);
+  }
+  return out.toString();
+}
 
-  @override
-  void initState() {
-    super.initState();
-    _requestPermission();
+final RegExp _tokenSeparator = RegExp(r'[^\p{L}\p{N}]+', unicode: true);
+
+List<String> searchTokens(String text) => foldForSearch(text).split(_tokenSeparator).where((t) => t.isNotEmpty).toList();
+
+int _fnv1a(String text) {
+  var hash = 0xcbf29ce484222325;
+  for (final unit in text.codeUnits) {
+    hash ^= unit;
+    hash *= 0x100000001b3;
   }
+  return hash;
+}
+
+class ContactEntry {
+  final String id;
+  final String name;
+  /// E.164 numaralar.
+  final List<String> phones;
+  /// Ad ve numaralardan hesaplanan özet; değişen kişileri bulmak için.
+  final int digest;
+
+  ContactEntry(this.id, this.name, this.phones, this.digest);
+}
 
-  Future<void> _requestPermission() async {
-    // Rehber izni isteme
-    PermissionStatus permission = await Permission.contacts.request();
+class ContactChanges {
+  final List<String> added;
+  final List<String> updated;
+  final List<String> removed;
 
-    if (permission.isGranted) {
-      _getContacts();
-    } else {
-      print("Rehber izni verilmedi.");
+  ContactChanges(this.added, this.updated, this.removed);
+
+  bool get isEmpty => added.isEmpty && updated.isEmpty && removed.isEmpty;
+}
+
+/// Kişilerin değişmez bir görüntüsü: ada göre sıralı liste, E.164 → kişi
+/// dizini ve önek araması için sıralı sözcük tablosu. Tablo, bir önek
+/// ağacının yaptığı aramayı (önek aralığını ikili aramayla bulmak) çok daha
+/// az bellekle yapar ve diske olduğu gibi yazılır.
+class _ContactIndex {
+  static const int _magic = 0x4d435431;
+  static final _ContactIndex empty = _ContactIndex._([], [], Int32List(0));
+
+  final List<ContactEntry> contacts;
+  final Map<String, int> byId = {};
+  final Map<String, int> byPhone = {};
+  final List<String> tokens;
+  final Int32List owners;
+
+  _ContactIndex._(this.contacts, this.tokens, this.owners) {
+    for (var i = 0; i < contacts.length; i++) {
+      byId[contacts[i].id] = i;
+      for (final phone in contacts[i].phones) {
+        byPhone[phone] = i;
+      }
     }
   }
 
-  Future<void> _getContacts() async {
-    try {
-      // Rehberdeki kişileri al
-      List<Contact> contactsList = await ContactsService.getContacts();
-      setState(() {
-        contacts = contactsList;
-      });
-    } catch (e) {
-      print("Kişiler alınamadı: $e");
+  factory _ContactIndex.build(List<ContactEntry> entries, String dialCode) {
+    final contacts = List<ContactEntry>.of(entries)..sort((a, b) => foldForSearch(a.name).compareTo(foldForSearch(b.name)));
+    final pairs = <MapEntry<String, int>>[];
+    for (var i = 0; i < contacts.length; i++) {
+      final words = <String>{...searchTokens(contacts[i].name)};
+      for (final phone in contacts[i].phones) {
+        final digits = phone.substring(1);
+        words.add(digits);
+        if (digits.startsWith(dialCode)) words.add(digits.substring(dialCode.length));
+      }
+      pairs.addAll(words.map((word) => MapEntry(word, i)));
     }
+    pairs.sort((a, b) => a.key.compareTo(b.key));
+    return _ContactIndex._(contacts, [for (final p in pairs) p.key], Int32List.fromList([for (final p in pairs) p.value]));
   }
 
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(
-        title: Text("Telefon Kişileri"),
-      ),
-      body: contacts.isEmpty
-          ? Center(child: CircularProgressIndicator())
-          : ListView.builder(
-              itemCount: contacts.length,
-              itemBuilder: (context, index) {
-                return ListTile(
-                  title: Text(contacts[index].displayName ?? "No Name"),
-                  subtitle: Text(contacts[index].phones?.isEmpty ?? true
-                      ? "No Phone Number"
-                      : contacts[index].phones!.first.value ?? "No Phone Number"),
-                );
-              },
-            ),
-    );
+  Uint8List encode() {
+    final out = ByteWriter()
+      ..varint(_magic)
+      ..varint(contacts.length);
+    for (final contact in contacts) {
+      out
+        ..string(contact.id)
+        ..string(contact.name)
+        ..int64(contact.digest)
+        ..varint(contact.phones.length);
+      contact.phones.forEach(out.string);
+    }
+    // Sıralı sözcükler önceki sözcükle ortak önek uzunluğuyla sıkıştırılır
+    out.varint(tokens.length);
+    var previous = '';
+    for (var i = 0; i < tokens.length; i++) {
+      var shared = 0;
+      final limit = min(previous.length, tokens[i].length);
+      while (shared < limit && previous.codeUnitAt(shared) == tokens[i].codeUnitAt(shared)) {
+        shared++;
+      }
+      out
+        ..varint(shared)
+        ..string(tokens[i].substring(shared))
+        ..varint(owners[i]);
+      previous = tokens[i];
+    }
+    return out.takeBytes();
   }
-}
 
-class QuantumStubScreen extends StatefulWidget {
-  @override
-  _QuantumStubScreen createState() => _QuantumStubScreen(); 
-}
+  factory _ContactIndex.decode(Uint8List bytes) {
+    final input = ByteReader(bytes);
+    if (input.varint() != _magic) throw FormatException('Kişi dizini tanınmadı');
+    final contacts = List<ContactEntry>.generate(input.varint(), (_) {
+      final id = input.string();
+      final name = input.string();
+      final digest = input.int64();
+      return ContactEntry(id, name, List<String>.generate(input.varint(), (_) => input.string()), digest);
+    });
+    final count = input.varint();
+    final tokens = <String>[];
+    final owners = Int32List(count);
+    var previous = '';
+    for (var i = 0; i < count; i++) {
+      final shared = input.varint();
+      previous = previous.substring(0, shared) + input.string();
+      tokens.add(previous);
+      owners[i] = input.varint();
+    }
+    return _ContactIndex._(contacts, tokens, owners);
+  }
 
-class _QuantumStubScreen extends State<QuantumStubScreen> {
-  String encryptedText = '';
-  final key = encrypt.Key.fromUtf8('32karakterlikbiranahtar1234567890!!');
-  final iv = encrypt.IV.fromLength(16);
-  final controller = TextEditingController();
+  int _lowerBound(String key) {
+    var lo = 0;
+    var hi = tokens.length;
+    while (lo < hi) {
+      final mid = (lo + hi) >> 1;
+      if (tokens[mid].compareTo(key) < 0) {
+        lo = mid + 1;
+      } else {
+        hi = mid;
+      }
+    }
+    return lo;
+  }
 
+  /// Sorgudaki her sözcük için önek eşleşmesi arar; sonuçlar ada göre sıralıdır.
+  List<ContactEntry> search(String query, int limit) {
+    final terms = searchTokens(query).map((t) => RegExp(r'^\d+$').hasMatch(t) ? t.replaceFirst(RegExp(r'^0+'), '') : t).where((t) => t.isNotEmpty);
+    if (terms.isEmpty) return contacts.take(limit).toList();
+    Set<int>? matches;
+    for (final term in terms) {
+      final hits = <int>{};
+      for (var i = _lowerBound(term); i < tokens.length && tokens[i].startsWith(term); i++) {
+        hits.add(owners[i]);
+      }
+      matches = matches == null ? hits : matches.intersection(hits);
+      if (matches.isEmpty) return [];
+    }
+    return [for (final i in (matches!.toList()..sort()).take(limit)) contacts[i]];
+  }
+}
 
-  void _encryptText() {
-    final encrypter = encrypt.Encrypter(encrypt.AES(key));
-    final encrypted = encrypter.encrypt(controller.text, iv: iv);
-    setState(() => encryptedText = encrypted.base64);
+/// Arka plan isolate'inde: ham kişileri normalleştirir, öncekiyle karşılaştırır
+/// ve yeni dizini kodlar. Dönüş: [dizin, değişiklikler, kodlanmış dizin].
+List<Object> _syncContacts(List<List<Object>> raw, Map<String, int> previous, String dialCode) {
+  final entries = <ContactEntry>[];
+  final added = <String>[];
+  final updated = <String>[];
+  final seen = <String>{};
+  for (final contact in raw) {
+    final id = contact[0] as String;
+    if (id.isEmpty || !seen.add(id)) continue;
+    final name = contact[1] as String;
+    final phones = <String>{
+      for (final value in contact[2] as List) normalizePhone(value as String, dialCode),
+    }.whereType<String>().toList()
+      ..sort();
+    final digest = _fnv1a('$name\n${phones.join(',')}');
+    entries.add(ContactEntry(id, name, phones, digest));
+    final old = previous[id];
+    if (old == null) {
+      added.add(id);
+    } else if (old != digest) {
+      updated.add(id);
+    }
   }
+  final removed = [for (final id in previous.keys) if (!seen.contains(id)) id];
+  final index = _ContactIndex.build(entries, dialCode);
+  return [index, ContactChanges(added, updated, removed), index.encode()];
+}
 
+/// Rehberin uygulama genelinde paylaşılan, dizinlenmiş önbelleği.
+///
+/// Açılışta `contacts/contacts.bin` arka planda çözülür ve ekranlar rehbere
+/// dokunmadan hemen çizilir. Oturum başına bir kez (izin varsa) rehber küçük
+/// resimler olmadan okunur; numaralar E.164'e çevrilir, kişi özetleri
+/// öncekilerle karşılaştırılır ve yalnızca değişiklik varsa dizin yeniden
+/// yazılır. Eklenen, değişen ve silinen kişiler [changes] akışına düşer.
+class ContactRepository extends ChangeNotifier {
+  static final ContactRepository instance = ContactRepository();
+
+  _ContactIndex _index = _ContactIndex.empty;
+  bool _loaded = false;
+  bool _synced = false;
+  Future<void>? _refreshing;
+  late final Future<void> _ready = _load();
+  final StreamController<ContactChanges> _changes = StreamController.broadcast();
+
+  /// Diskten ya da rehberden en az bir kez yüklendi mi.
+  bool get loaded => _loaded;
+  bool get synced => _synced;
+  int get length => _index.contacts.length;
+  List<ContactEntry> get contacts => _index.contacts;
+  Stream<ContactChanges> get changes => _changes.stream;
+
+  ContactEntry? byPhone(String e164) {
+    final i = _index.byPhone[e164];
+    return i == null ? null : _index.contacts[i];
+  }
 
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(title: Text('Kuantum Güvenli Şifreleme')),
-      body: Padding(
-        padding: EdgeInsets.all(16),
-        child: Column(
-          children: [
-            TextField(controller: controller, decoration: InputDecoration(labelText: 'Metin girin')),
-            SizedBox(height: 10),
-            ElevatedButton(onPressed: _encryptText, child: Text('Şifrele')),
-            SizedBox(height: 10),
-            SelectableText('Şifreli Metin (AES): $encryptedText'),
-          ],
-        ),
-      ),
-    );
+  ContactEntry? byId(String id) {
+    final i = _index.byId[id];
+    return i == null ? null : _index.contacts[i];
   }
-}
 
-class GroupModel {
-  final String id;
-  final String name;
-  final String description;
-  final String imageUrl;
-  final bool isPrivate;
-  final List<String> members;
+  List<ContactEntry> search(String query, {int limit = 50}) => _index.search(query, limit);
 
-  GroupModel({
-    required this.id,
-    required this.name,
-    required this.description,
-    required this.imageUrl,
-    required this.isPrivate,
-    required this.members,
-  });
+  Future<File> get _file async => File('${(await AppStorage.dir('contacts')).path}/contacts.bin');
 
-  factory GroupModel.fromJson(Map<String, dynamic> json) {
-    return GroupModel(
-      id: json['id'],
-      name: json['name'],
-      description: json['description'],
-      imageUrl: json['imageUrl'],
-      isPrivate: json['isPrivate'],
-      members: List<String>.from(json['members']),
-    );
+  Future<void> _load() async {
+    final file = await _file;
+    if (await file.exists()) {
+      final bytes = await file.readAsBytes();
+      try {
+        _index = await Isolate.run(() => _ContactIndex.decode(bytes));
+      } catch (e) {
+        print("Kişi dizini okunamadı: $e");
+      }
+    }
+    _loaded = _index.contacts.isNotEmpty;
+    notifyListeners();
   }
 
-  Map<String, dynamic> toJson() {
-    return {
-      'id': id,
-      'name': name,
-      'description': description,
-      'imageUrl': imageUrl,
-      'isPrivate': isPrivate,
-      'members': members,
-    };
+  /// Diskteki dizini açar ve bu oturumda henüz yapılmadıysa rehberle eşitler.
+  /// İzin yoksa yalnızca [requestPermission] açıkken istenir.
+  Future<void> ensureLoaded({bool requestPermission = false}) async {
+    await _ready;
+    if (!_synced) await refresh(requestPermission: requestPermission);
   }
-}
 
-/// 7) Çeviri
-class TranslateScreen extends StatelessWidget {
-  @override
-  Widget build(BuildContext context) => Scaffold(
-        appBar: AppBar(title: Text('AI Çeviri')),
-        body: Center(child: Text('Gerçek zamanlı AI çeviri entegrasyonu buraya')),
-      );
+  Future<void> refresh({bool requestPermission = false}) =>
+      _refreshing ??= _refresh(requestPermission).whenComplete(() => _refreshing = null);
+
+  Future<void> _refresh(bool requestPermission) async {
+    var status = await Permission.contacts.status;
+    if (!status.isGranted && requestPermission) status = await Permission.contacts.request();
+    if (!status.isGranted) {
+      print("Kişiler verisine erişim izni verilmedi.");
+      return;
+    }
+    await _ready;
+    final List<Contact> raw;
+    try {
+      raw = await ContactsService.getContacts(withThumbnails: false, photoHighResolution: false);
+    } catch (e) {
+      print("Kişiler alınamadı: $e");
+      return;
+    }
+    final input = [
+      for (final contact in raw)
+        <Object>[contact.identifier ?? '', contact.displayName ?? '', [for (final phone in contact.phones ?? const <Item>[]) phone.value ?? '']]
+    ];
+    final previous = {for (final contact in _index.contacts) contact.id: contact.digest};
+    final dialCode = deviceDialCode;
+    final result = await Isolate.run(() => _syncContacts(input, previous, dialCode));
+    final changes = result[1] as ContactChanges;
+    _synced = true;
+    _loaded = true;
+    if (changes.isEmpty) {
+      notifyListeners();
+      return;
+    }
+    _index = result[0] as _ContactIndex;
+    final file = await _file;
+    final tmp = File('${file.path}.tmp');
+    await tmp.writeAsBytes(result[2] as Uint8List, flush: true);
+    await tmp.rename(file.path);
+    notifyListeners();
+    _changes.add(changes);
+  }
 }
 
-class LocationSharingScreen extends StatefulWidget {
-  @override
-  _LocationSharingScreenState createState() => _LocationSharingScreenState();
+class _DiscoveryEntry {
+  final String? user;
+  final int checkedAt;
+
+  _DiscoveryEntry(this.user, this.checkedAt);
 }
 
-class _LocationSharingScreenState extends State<LocationSharingScreen> {
-  String _location = "Konum alınıyor...";
+/// Rehberdeki numaralardan hangilerinin Mopple kullanıcısı olduğunu bulur.
+///
+/// Numaralar [ContactRepository]'nin E.164 biçimiyle, sunucuya açık metin
+/// yerine tuzlanmış SHA-256 özetinin ilk 16 baytı olarak gider. Özetler
+/// [batchSize]'lık gruplar halinde tek bir ikili `discoverContacts` isteğine
+/// konur; 5 bin kişilik bir rehber birkaç istekte biter. Sonuçlar
+/// `discovery/matches.bin`'de saklanır: eşleşmeler [matchTtl], eşleşmeyenler
+/// [missTtl] boyunca yeniden sorulmaz, böylece sonraki açılışlarda yalnızca
+/// yeni, değişen veya süresi dolan numaralar gönderilir.
+class ContactDiscovery extends ChangeNotifier {
+  static final ContactDiscovery instance = ContactDiscovery(ConnectionManager.instance, ContactRepository.instance);
+  static const int hashLength = 16;
+  static const int _magic = 0x4d445331;
+
+  final ConnectionManager connection;
+  final ContactRepository contacts;
+  final int batchSize;
+  final Duration matchTtl;
+  final Duration missTtl;
+  final Map<String, _DiscoveryEntry> _entries = {};
+  late final Future<void> _ready = _load();
+  Future<void>? _syncing;
+
+  ContactDiscovery(
+    this.connection,
+    this.contacts, {
+    this.batchSize = 2000,
+    this.matchTtl = const Duration(days: 7),
+    this.missTtl = const Duration(days: 1),
+  }) {
+    contacts.changes.listen((_) => sync());
+    connection.socket.on('connect', (_) => sync());
+  }
 
-  // Konumu almak için
-  void _getLocation() async {
-    bool serviceEnabled;
-    LocationPermission permission;
+  static Uint8List hashPhone(String e164) =>
+      Uint8List.fromList(sha256.convert(utf8.encode('mopple-discovery:$e164')).bytes.sublist(0, hashLength));
 
+  /// Numaranın bağlı olduğu kullanıcı; bilinmiyorsa null.
+  String? userFor(String e164) => _entries[e164]?.user;
 
-    // Konum verisi aktifliğini almak için kontrol et
-    serviceEnabled = await Geolocator.isLocationServiceEnabled();
-    if (!serviceEnabled) {
-      setState(() {
-        _location = "Konum verisi kapalı!";
-      });
-      return;
-    }
+  bool isRegistered(ContactEntry contact) => contact.phones.any((phone) => userFor(phone) != null);
 
+  Future<File> get _file async => File('${(await AppStorage.dir('discovery')).path}/matches.bin');
 
-    // Konum izni Kontrolü 
-    permission = await Geolocator.checkPermission();
-    if (permission == LocationPermission.denied) {
-      permission = await Geolocator.requestPermission();
-      if (permission != LocationPermission.whileInUse && permission != LocationPermission.always) {
-        setState(() {
-          _location = "Konum izni verilmedi!";
-        });
-        return;
+  Future<void> _load() async {
+    final file = await _file;
+    if (!await file.exists()) return;
+    try {
+      final input = ByteReader(await file.readAsBytes());
+      if (input.varint() != _magic) throw FormatException('Eşleşme önbelleği tanınmadı');
+      for (var i = input.varint(); i > 0; i--) {
+        final phone = input.string();
+        final user = input.string();
+        _entries[phone] = _DiscoveryEntry(user.isEmpty ? null : user, input.int64());
       }
+    } catch (e) {
+      print("Eşleşme önbelleği okunamadı: $e");
+      _entries.clear();
     }
+  }
 
-
-    // Konum bilgisini al
-    Position position = await Geolocator.getCurrentPosition(desiredAccuracy: LocationAccuracy.high);
-    setState(() {
-      _location = "Enlem: ${position.latitude}, Boylam: ${position.longitude}";
+  Future<void> _save() async {
+    final out = ByteWriter()
+      ..varint(_magic)
+      ..varint(_entries.length);
+    _entries.forEach((phone, entry) {
+      out
+        ..string(phone)
+        ..string(entry.user ?? '')
+        ..int64(entry.checkedAt);
     });
+    final file = await _file;
+    final tmp = File('${file.path}.tmp');
+    await tmp.writeAsBytes(out.takeBytes(), flush: true);
+    await tmp.rename(file.path);
   }
 
+  Future<void> sync() => _syncing ??= _sync().whenComplete(() => _syncing = null);
+
+  Future<void> _sync() async {
+    await Future.wait([_ready, contacts.ensureLoaded()]);
+    if (!connection.socket.connected) return;
+    final now = DateTime.now().millisecondsSinceEpoch;
+    final phones = <String>{for (final contact in contacts.contacts) ...contact.phones};
+    // Rehberden silinen numaralar unutulur
+    final before = _entries.length;
+    _entries.removeWhere((phone, _) => !phones.contains(phone));
+    var changed = _entries.length != before;
+    final pending = [
+      for (final phone in phones)
+        if (_isStale(_entries[phone], now)) phone
+    ];
+    if (pending.isNotEmpty) {
+      final hashes = await (pending.length > 500 ? Isolate.run(() => pending.map(hashPhone).toList()) : Future.value(pending.map(hashPhone).toList()));
+      for (var start = 0; start < pending.length; start += batchSize) {
+        final end = min(start + batchSize, pending.length);
+        final packed = Uint8List(hashLength * (end - start));
+        for (var i = start; i < end; i++) {
+          packed.setAll((i - start) * hashLength, hashes[i]);
+        }
+        final Map res;
+        try {
+          res = await emitAck(connection.socket, 'discoverContacts', {'hashes': packed}, binary: true);
+        } on TimeoutException {
+          print("Kişi eşleştirmesi zaman aşımına uğradı");
+          break;
+        }
+        final users = {for (final match in res['matches'] ?? const []) match[0] as int: match[1] as String};
+        for (var i = start; i < end; i++) {
+          _entries[pending[i]] = _DiscoveryEntry(users[i - start], now);
+        }
+        changed = true;
+      }
+    }
+    if (!changed) return;
+    await _save();
+    notifyListeners();
+  }
 
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(title: Text('Konum Paylaş')),
-      body: Center(
-        child: Column(
-          mainAxisAlignment: MainAxisAlignment.center,
-          children: [
-            Text(_location),
-            ElevatedButton(
-              onPressed: _getLocation,
-              child: Text('Konumu Al'),
-            ),
-          ],
-        ),
-      ),
-    );
+  bool _isStale(_DiscoveryEntry? entry, int now) {
+    if (entry == null) return true;
+    final ttl = entry.user == null ? missTtl : matchTtl;
+    return now - entry.checkedAt > ttl.inMilliseconds;
   }
 }
 
-class GroupCreatePage extends StatefulWidget {
+class PhoneNumberList extends StatefulWidget {
   @override
-  _GroupCreatePageState createState() => _GroupCreatePageState();
+  _PhoneNumberListState createState() => _PhoneNumberListState();
 }
 
-class _GroupCreatePageState extends State<GroupCreatePage> {
-  final TextEditingController _nameController = TextEditingController();
-  final TextEditingController _descController = TextEditingController();
-  bool _isPrivate = false;
-
-  void _createGroup() {
-    final group = {
-      'id': const Uuid().v4(),
-      'name': _nameController.text,
-      'description': _descController.text,
-      'imageUrl': '',
-      'isPrivate': _isPrivate,
-      'members': [],
-    };
-
-
-    // TODO: Backendless API ile kaydet
-    print("Grup oluşturuldu: $group");
+class _PhoneNumberListState extends State<PhoneNumberList> {
+  final ContactRepository _contacts = ContactRepository.instance;
+  final ContactDiscovery _discovery = ContactDiscovery.instance;
+  String _query = '';
+  bool _waiting = true;
 
+  @override
+  void initState() {
+    super.initState();
+    _contacts.addListener(_onContactsChanged);
+    _discovery.addListener(_onContactsChanged);
+    _contacts.ensureLoaded(requestPermission: true).then((_) {
+      _waiting = false;
+      _onContactsChanged();
+      _discovery.sync();
+    });
+  }
 
-    Navigator.pop(context);
+  void _onContactsChanged() {
+    if (mounted) setState(() {});
   }
 
+  @override
+  void dispose() {
+    _contacts.removeListener(_onContactsChanged);
+    _discovery.removeListener(_onContactsChanged);
+    super.dispose();
+  }
 
   @override
   Widget build(BuildContext context) {
+    final results = _contacts.search(_query, limit: 500);
     return Scaffold(
-      appBar: AppBar(title: Text("Grup Oluştur")),
-      body: Padding(
-        padding: EdgeInsets.all(16.0),
-        child: Column(
-          children: [
-            TextField(controller: _nameController, decoration: InputDecoration(labelText: "Grup Adı")),
-            TextField(controller: _descController, decoration: InputDecoration(labelText: "Açıklama")),
-            SwitchListTile(
-              title: Text("Gizli Grup"),
-              value: _isPrivate,
-              onChanged: (val) => setState(() => _isPrivate = val),
-            ),
-            SizedBox(height: 20),
-            ElevatedButton(
-              onPressed: _createGroup,
-              child: Text("Grubu Oluştur"),
-            ),
-          ],
-        ),
+      appBar: AppBar(
+        title: Text("Telefon Kişileri"),
       ),
+      body: Column(children: [
+        Padding(
+          padding: EdgeInsets.all(8),
+          child: TextField(
+            decoration: InputDecoration(labelText: 'Ara', prefixIcon: Icon(Icons.search)),
+            onChanged: (value) => setState(() => _query = value),
+          ),
+        ),
+        Expanded(
+          child: _waiting && !_contacts.loaded
+              ? Center(child: CircularProgressIndicator())
+              : results.isEmpty
+                  ? Center(child: Text("Kişi bulunamadı"))
+                  : ListView.builder(
+                  itemCount: results.length,
+                  itemBuilder: (context, index) {
+                    final contact = results[index];
+                    return ListTile(
+                      key: ValueKey(contact.id),
+                      title: Text(contact.name.isEmpty ? "No Name" : contact.name),
+                      subtitle: Text(contact.phones.isEmpty ? "No Phone Number" : contact.phones.first),
+                      trailing: _discovery.isRegistered(contact) ? Icon(Icons.chat_bubble, color: Colors.green) : null,
+                    );
+                  },
+                ),
+        ),
+      ]),
     );
   }
 }
 
-class Block {
-  final int index;
-  final String timestamp;
-  final String data;
-  final String previousHash;
-  final String hash;
+/// Anahtar açılımı bir kez yapılmış AES motoru. GCM her başlatmada alttaki
+/// motoru aynı anahtarla yeniden başlattığı için bu çağrılar atlanır.
+class _KeyedAesEngine implements pc.BlockCipher {
+  final pc.AESEngine _engine = pc.AESEngine();
+  final Uint8List key;
 
+  _KeyedAesEngine(this.key) {
+    _engine.init(true, pc.KeyParameter(key));
+  }
 
-  Block(this.index, this.timestamp, this.data, this.previousHash) : hash = generateHash(index, timestamp, data, previousHash);
+  @override
+  String get algorithmName => _engine.algorithmName;
 
-  static String generateHash(int index, String timestamp, String data, String previousHash) {
-    final input = '$index$timestamp$data$previousHash';
-    return sha256.convert(utf8.encode(input)).toString();
+  @override
+  int get blockSize => _engine.blockSize;
+
+  @override
+  void init(bool forEncryption, pc.CipherParameters? params) {
+    // GCM motoru yalnızca şifreleme yönünde ve aynı anahtarla kullanır
   }
-}
 
-class BlockchainScreen extends StatefulWidget {
   @override
-  _BlockchainScreenState createState() => _BlockchainScreenState();
+  int processBlock(Uint8List inp, int inpOff, Uint8List out, int outOff) => _engine.processBlock(inp, inpOff, out, outOff);
+
+  @override
+  Uint8List process(Uint8List data) {
+    final out = Uint8List(blockSize);
+    final length = processBlock(data, 0, out, 0);
+    return out.sublist(0, length);
+  }
+
+  @override
+  void reset() {}
 }
 
-class _BlockchainScreenState extends State<BlockchainScreen> {
-  List<Block> blockchain = [];
+/// AES-256-GCM şifreleme servisi.
+///
+/// Anahtar başına açılmış motorlar LRU ile önbellekte tutulur. Her mesaj
+/// rastgele 12 baytlık IV kullanır; çıktı `IV || şifreli metin || etiket`
+/// biçimindedir. Büyük medya için [encryptStream] / [decryptStream] veriyi
+/// parça parça işler ve belleğe tamamen almaz.
+class CipherService {
+  static final CipherService instance = CipherService();
+  static const int ivLength = 12;
+  static const int tagBits = 128;
+
+  final int maxKeys;
+  final Map<String, _KeyedAesEngine> _engines = {};
+  final Random _random = Random.secure();
+
+  CipherService({this.maxKeys = 64});
+
+  Uint8List generateKey() => Uint8List.fromList(List.generate(32, (_) => _random.nextInt(256)));
+
+  /// Parola veya paylaşılan sırdan 32 baytlık anahtar.
+  static Uint8List deriveKey(String secret) => Uint8List.fromList(sha256.convert(utf8.encode(secret)).bytes);
+
+  _KeyedAesEngine _engineFor(Uint8List key) {
+    final id = base64Encode(key);
+    var engine = _engines.remove(id);
+    engine ??= _KeyedAesEngine(Uint8List.fromList(key));
+    _engines[id] = engine;
+    if (_engines.length > maxKeys) _engines.remove(_engines.keys.first);
+    return engine;
+  }
 
-  void _addBlock() {
-    final timestamp = DateTime.now().toString();
-    final data = 'İşlem verisi ${blockchain.length + 1}';
-    final previousHash = blockchain.isEmpty ? '0' : blockchain.last.hash;
+  pc.GCMBlockCipher _gcm(Uint8List key, bool forEncryption, Uint8List iv, Uint8List? aad) {
+    return pc.GCMBlockCipher(_engineFor(key))
+      ..init(forEncryption, pc.AEADParameters(pc.KeyParameter(key), tagBits, iv, aad ?? Uint8List(0)));
+  }
 
+  Uint8List encrypt(Uint8List key, Uint8List plaintext, {Uint8List? aad}) {
+    final iv = Uint8List.fromList(List.generate(ivLength, (_) => _random.nextInt(256)));
+    final sealed = _gcm(key, true, iv, aad).process(plaintext);
+    return Uint8List(ivLength + sealed.length)
+      ..setAll(0, iv)
+      ..setAll(ivLength, sealed);
+  }
 
-    final newBlock = Block(blockchain.length, timestamp, data, previousHash);
-    setState(() => blockchain.add(newBlock));
+  /// Etiket doğrulanamazsa pc.InvalidCipherTextException fırlatır.
+  Uint8List decrypt(Uint8List key, Uint8List sealed, {Uint8List? aad}) {
+    final iv = Uint8List.sublistView(sealed, 0, ivLength);
+    return _gcm(key, false, iv, aad).process(Uint8List.sublistView(sealed, ivLength));
   }
 
+  List<Uint8List> encryptAll(Uint8List key, List<Uint8List> plaintexts) => [for (final p in plaintexts) encrypt(key, p)];
 
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(title: Text('Gerçekçi Blokzincir')),
-      body: Column(
-        children: [
-          ElevatedButton(onPressed: _addBlock, child: Text("Yeni Blok Ekle")),
-          Expanded(
-            child: ListView.builder(
-              itemCount: blockchain.length,
-              itemBuilder: (context, index) {
-                final block = blockchain[index];
-                return ListTile(
-                  title: Text('Blok ${block.index}'),
-                  subtitle: Text('Hash: ${block.hash.substring(0, 20)}...'),
-                  trailing: Text(block.timestamp.split('.').first),
-                );
-              },
-            ),
-          ),
-        ],
-      ),
-    );
+  List<Uint8List> decryptAll(Uint8List key, List<Uint8List> sealed) => [for (final s in sealed) decrypt(key, s)];
+
+  String encryptText(Uint8List key, String text) => base64Encode(encrypt(key, Uint8List.fromList(utf8.encode(text))));
+
+  String decryptText(Uint8List key, String sealed) => utf8.decode(decrypt(key, base64Decode(sealed)));
+
+  /// İlk parça IV'dir, ardından şifreli parçalar, en sonda etiket gelir.
+  Stream<Uint8List> encryptStream(Uint8List key, Stream<List<int>> source, {Uint8List? aad}) async* {
+    final iv = Uint8List.fromList(List.generate(ivLength, (_) => _random.nextInt(256)));
+    final gcm = _gcm(key, true, iv, aad);
+    yield iv;
+    await for (final chunk in source) {
+      final input = chunk is Uint8List ? chunk : Uint8List.fromList(chunk);
+      final out = Uint8List(gcm.getOutputSize(input.length));
+      final n = gcm.processBytes(input, 0, input.length, out, 0);
+      if (n > 0) yield Uint8List.sublistView(out, 0, n);
+    }
+    final tail = Uint8List(gcm.getOutputSize(0));
+    final n = gcm.doFinal(tail, 0);
+    yield Uint8List.sublistView(tail, 0, n);
+  }
+
+  /// [encryptStream] çıktısını çözer. Etiket akışın sonunda doğrulanır;
+  /// doğrulama başarısız olursa akış hata verir ve önceden üretilen parçalar
+  /// atılmalıdır.
+  Stream<Uint8List> decryptStream(Uint8List key, Stream<List<int>> source, {Uint8List? aad}) async* {
+    final header = BytesBuilder();
+    pc.GCMBlockCipher? gcm;
+    await for (final chunk in source) {
+      var input = chunk is Uint8List ? chunk : Uint8List.fromList(chunk);
+      if (gcm == null) {
+        header.add(input);
+        if (header.length < ivLength) continue;
+        final bytes = header.takeBytes();
+        gcm = _gcm(key, false, Uint8List.sublistView(bytes, 0, ivLength), aad);
+        input = Uint8List.sublistView(bytes, ivLength);
+      }
+      final out = Uint8List(gcm.getOutputSize(input.length));
+      final n = gcm.processBytes(input, 0, input.length, out, 0);
+      if (n > 0) yield Uint8List.sublistView(out, 0, n);
+    }
+    if (gcm == null) throw FormatException('Şifreli akış IV içermiyor');
+    final tail = Uint8List(gcm.getOutputSize(0));
+    final n = gcm.doFinal(tail, 0);
+    if (n > 0) yield Uint8List.sublistView(tail, 0, n);
   }
 }
 
-/// 8) Özet
-class SummaryScreen extends StatelessWidget {
-  @override
-  Widget build(BuildContext context) => Scaffold(
-        appBar: AppBar(title: Text('Akıllı Özet')),
-        body: Center(child: Text('Mesajları AI ile otomatik özetleme buraya')),
-      );
+/// Bir gönderenin bir konuşmadaki oturum anahtarı; id `<gönderen>/<dönem>`.
+class SessionKey {
+  final String id;
+  final Uint8List key;
+  final int created;
+  int uses;
+
+  SessionKey(this.id, this.key, {int? created, this.uses = 0}) : created = created ?? DateTime.now().millisecondsSinceEpoch;
+
+  factory SessionKey.fromJson(Map<String, dynamic> json) =>
+      SessionKey(json['id'], Uint8List.fromList(base64Decode(json['key'])), created: json['created'], uses: json['uses']);
+
+  Map<String, dynamic> toJson() => {'id': id, 'key': base64Encode(key), 'created': created, 'uses': uses};
+}
+
+String? _openText(Uint8List key, String sealed, String aad) {
+  try {
+    return utf8.decode(CipherService.instance.decrypt(key, base64Decode(sealed), aad: Uint8List.fromList(utf8.encode(aad))));
+  } catch (_) {
+    return null;
+  }
 }
 
-class GroupListPage extends StatelessWidget {
-  final List<Map<String, dynamic>> mockGroups = [
-    {
-      'name': 'Mopple Fanları',
-      'description': 'Mopple kullanıcıları burada!',
-      'isPrivate': false,
-    },
-    {
-      'name': 'Sosyal Proje',
-      'description': 'Gizli tartışmalar burada',
-      'isPrivate': true,
+List<String?> _openBatch(List<List<Object>> jobs) =>
+    [for (final job in jobs) _openText(job[0] as Uint8List, job[1] as String, job[2] as String)];
+
+/// Uçtan uca şifreli mesajlar için konuşma başına oturum anahtarları.
+///
+/// Cihazın kalıcı bir P-256 kimlik anahtarı vardır; katılımcılar odaya
+/// girerken açık anahtarlarını `e2e` olayıyla duyurur ve iki kişi arasındaki
+/// ECDH sırrı bir kez hesaplanıp önbellekte tutulur. Her gönderen konuşma için
+/// rastgele bir oturum anahtarı üretir ve bunu her üyeye yalnızca bir kez,
+/// ikili sırla sarılı olarak gönderir; mesaj başına yalnızca AES-GCM çalışır.
+/// Gönderme anahtarı [maxAge] veya [maxMessages] dolunca yenilenir. Alınan
+/// anahtarlar [maxKeys] sınırlı LRU'da tutulur ve `keys/` altına yazılır.
+/// Kimlikler ilk görüşte güvenilir kabul edilir.
+class SessionKeyManager extends ChangeNotifier {
+  static final SessionKeyManager instance = SessionKeyManager();
+  static final pc.ECDomainParameters _domain = pc.ECCurve_secp256r1();
+  /// Bu sayının üstündeki şifreli mesajlar arka plan isolate'inde çözülür.
+  static const int backgroundThreshold = 32;
+
+  final Duration maxAge;
+  final int maxMessages;
+  final int maxKeys;
+  final Map<String, SessionKey> _own = {};
+  final Map<String, Uint8List> _keys = {};
+  final Map<String, Uint8List> _peers = {};
+  final Map<String, Uint8List> _pairwise = {};
+  final Map<String, Set<String>> _members = {};
+  final Map<String, String> _self = {};
+  final Map<String, ChannelSubscription> _channels = {};
+  final Set<String> _delivered = {};
+  final Set<String> _requested = {};
+  late final Future<void> _ready = _load();
+  late pc.ECPrivateKey _private;
+  late Uint8List _public;
+  Timer? _saveTimer;
+
+  SessionKeyManager({this.maxAge = const Duration(days: 7), this.maxMessages = 1000, this.maxKeys = 256});
+
+  Future<File> _file(String name) async => File('${(await AppStorage.dir('keys')).path}/$name');
+
+  Future<void> _load() async {
+    final identity = await _file('identity.json');
+    if (await identity.exists()) {
+      _private = pc.ECPrivateKey(BigInt.parse(jsonDecode(await identity.readAsString())['d'], radix: 16), _domain);
+    } else {
+      final random = pc.FortunaRandom()..seed(pc.KeyParameter(CipherService.instance.generateKey()));
+      final generator = pc.ECKeyGenerator()..init(pc.ParametersWithRandom(pc.ECKeyGeneratorParameters(_domain), random));
+      _private = generator.generateKeyPair().privateKey as pc.ECPrivateKey;
+      await identity.writeAsString(jsonEncode({'d': _private.d!.toRadixString(16)}));
     }
-  ];
+    _public = (_domain.G * _private.d)!.getEncoded(false);
 
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(title: Text("Gruplar")),
-      body: ListView.builder(
-        itemCount: mockGroups.length,
-        itemBuilder: (context, index) {
-          final group = mockGroups[index];
-          return ListTile(
-            title: Text(group['name']),
-            subtitle: Text(group['description']),
-            trailing: group['isPrivate'] ? Icon(Icons.lock) : Icon(Icons.lock_open),
-            onTap: () {
-              // TODO: Grup detayına git
-            },
-          );
-        },
-      ),
-      floatingActionButton: FloatingActionButton(
-        onPressed: () => Navigator.push(
-          context,
-          MaterialPageRoute(builder: (_) => GroupCreatePage()),
-        ),
-        child: Icon(Icons.add),
-      ),
-    );
+    final sessions = await _file('sessions.json');
+    if (!await sessions.exists()) return;
+    final json = jsonDecode(await sessions.readAsString());
+    json['own'].forEach((conversation, key) => _own[conversation] = SessionKey.fromJson(key));
+    json['keys'].forEach((id, key) => _keys[id] = Uint8List.fromList(base64Decode(key)));
   }
-}
 
-class MediaPickerScreen extends StatefulWidget {
-  @override
-  _MediaPickerScreenState createState() => _MediaPickerScreenState();
-}
+  void _scheduleSave() {
+    _saveTimer ??= Timer(Duration(seconds: 1), () async {
+      _saveTimer = null;
+      final file = await _file('sessions.json');
+      final tmp = File('${file.path}.tmp');
+      await tmp.writeAsString(jsonEncode({
+        'own': _own.map((conversation, key) => MapEntry(conversation, key.toJson())),
+        'keys': _keys.map((id, key) => MapEntry(id, base64Encode(key))),
+      }));
+      await tmp.rename(file.path);
+    });
+  }
 
-class _MediaPickerScreenState extends State<MediaPickerScreen> {
-  final ImagePicker _picker = ImagePicker();
-  XFile? _image;
+  /// Konuşmanın anahtar değişimini [channel] üzerinden yürütür.
+  Future<void> attach(ChannelSubscription channel, String conversation, String user) async {
+    await _ready;
+    if (channel.cancelled) return;
+    _channels[conversation] = channel;
+    _self[conversation] = user;
+    channel.on('e2e', (data) => _onMessage(conversation, Map<String, dynamic>.from(data)));
+    channel.onConnect((_) => _announce(conversation));
+    if (channel.connected) _announce(conversation);
+  }
 
+  void detach(String conversation) {
+    _channels.remove(conversation);
+    _members.remove(conversation);
+  }
 
-  // Fotoğraf seçme fonksiyonu
-  Future<void> _pickImage() async {
-    final XFile? pickedFile = await _picker.pickImage(source: ImageSource.gallery);
-    if (pickedFile != null) {
-      setState(() {
-        _image = pickedFile;
-      });
+  void _announce(String conversation, {String? to}) {
+    _channels[conversation]?.emit('e2e', {
+      'type': 'hello',
+      'conversation': conversation,
+      'user': _self[conversation],
+      'public': base64Encode(_public),
+      if (to != null) 'to': to,
+    });
+  }
+
+  void _onMessage(String conversation, Map<String, dynamic> data) {
+    final self = _self[conversation];
+    if (data['conversation'] != conversation || self == null) return;
+    if (data['to'] != null && data['to'] != self) return;
+    switch (data['type']) {
+      case 'hello':
+        final user = data['user'] as String;
+        if (user == self) return;
+        _learn(conversation, user, base64Decode(data['public']));
+        // Yeni gelene kendimizi tanıtıp güncel anahtarımızı veriyoruz
+        if (data['to'] == null) _announce(conversation, to: user);
+        final own = _own[conversation];
+        if (own != null) _sendKey(conversation, own.id, user);
+        break;
+      case 'key':
+        final from = data['from'] as String;
+        _learn(conversation, from, base64Decode(data['public']));
+        final wrap = _pairwiseKey(from);
+        if (wrap == null) return;
+        try {
+          final key = CipherService.instance.decrypt(wrap, base64Decode(data['wrapped']), aad: _wrapAad(conversation, data['id'], self));
+          _remember(data['id'], key);
+          _requested.remove(data['id']);
+          _scheduleSave();
+          notifyListeners();
+        } on pc.InvalidCipherTextException {
+          print("Oturum anahtarı doğrulanamadı: ${data['id']}");
+        }
+        break;
+      case 'want':
+        final id = data['id'] as String;
+        if (!id.startsWith('$self/')) return;
+        _delivered.remove('$id>${data['from']}');
+        _sendKey(conversation, id, data['from']);
+        break;
     }
   }
 
+  void _learn(String conversation, String user, Uint8List publicKey) {
+    _members.putIfAbsent(conversation, () => {}).add(user);
+    final known = _peers[user];
+    if (known != null && _equalBytes(known, publicKey)) return;
+    // Yeni cihaz: eski ikili sır geçersiz, anahtarlar yeniden gönderilmeli
+    _peers[user] = publicKey;
+    _pairwise.remove(user);
+    _delivered.removeWhere((entry) => entry.endsWith('>$user'));
+  }
 
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(title: Text('Medya Paylaş')),
-      body: Center(
-        child: Column(
-          mainAxisAlignment: MainAxisAlignment.center,
-          children: [
-            _image != null ? Image.file(File(_image!.path)) : Text('Henüz bir medya seçilmedi.'),
-            ElevatedButton(
-              onPressed: _pickImage,
-              child: Text('Medya Seç'),
-            ),
-          ],
-        ),
-      ),
-    );
+  Uint8List? _pairwiseKey(String user) {
+    final cached = _pairwise[user];
+    if (cached != null) return cached;
+    final publicKey = _peers[user];
+    if (publicKey == null) return null;
+    try {
+      final point = _domain.curve.decodePoint(publicKey);
+      final secret = (pc.ECDHBasicAgreement()..init(_private)).calculateAgreement(pc.ECPublicKey(point, _domain));
+      final bytes = _hexDecode(secret.toRadixString(16).padLeft(64, '0'));
+      return _pairwise[user] = Uint8List.fromList(sha256.convert([...bytes, ...utf8.encode('mopple-e2e')]).bytes);
+    } catch (e) {
+      print("Geçersiz açık anahtar ($user): $e");
+      return null;
+    }
   }
-}
 
-class GroupChatPage extends StatefulWidget {
+  Uint8List _wrapAad(String conversation, String id, String to) => Uint8List.fromList(utf8.encode('$conversation|$id|$to'));
+
+  void _sendKey(String conversation, String id, String to) {
+    final key = _keys[id];
+    final wrap = _pairwiseKey(to);
+    final channel = _channels[conversation];
+    if (key == null || wrap == null || channel == null || !_delivered.add('$id>$to')) return;
+    channel.emit('e2e', {
+      'type': 'key',
+      'conversation': conversation,
+      'from': _self[conversation],
+      'to': to,
+      'id': id,
+      'public': base64Encode(_public),
+      'wrapped': base64Encode(CipherService.instance.encrypt(wrap, key, aad: _wrapAad(conversation, id, to))),
+    });
+  }
+
+  void _request(String id) {
+    if (!_requested.add(id)) return;
+    final owner = id.substring(0, max(0, id.lastIndexOf('/')));
+    _channels.forEach((conversation, channel) {
+      channel.emit('e2e', {'type': 'want', 'conversation': conversation, 'from': _self[conversation], 'to': owner, 'id': id});
+    });
+  }
+
+  void _remember(String id, Uint8List key) {
+    _keys.remove(id);
+    _keys[id] = key;
+    if (_keys.length <= maxKeys) return;
+    final current = _own.values.map((own) => own.id).toSet();
+    _keys.remove(_keys.keys.firstWhere((id) => !current.contains(id), orElse: () => _keys.keys.first));
+  }
+
+  Uint8List? _lookup(String id) {
+    final key = _keys.remove(id);
+    if (key != null) _keys[id] = key;
+    return key;
+  }
+
+  SessionKey _sendingKey(String conversation, String sender) {
+    var key = _own[conversation];
+    final age = DateTime.now().millisecondsSinceEpoch - (key?.created ?? 0);
+    if (key == null || key.uses >= maxMessages || age >= maxAge.inMilliseconds) {
+      key = SessionKey('$sender/${const Uuid().v4().substring(0, 8)}', CipherService.instance.generateKey());
+      _own[conversation] = key;
+      _remember(key.id, key.key);
+      for (final member in _members[conversation] ?? const <String>{}) {
+        _sendKey(conversation, key.id, member);
+      }
+    }
+    key.uses++;
+    _scheduleSave();
+    return key;
+  }
+
+  /// Mesaj metnini konuşmanın gönderme anahtarıyla şifreler. Şifreli metin
+  /// mesaj id'sine bağlıdır; başka bir mesajın yerine konamaz.
+  Future<ChatMessage> seal(String conversation, ChatMessage message) async {
+    await _ready;
+    final key = _sendingKey(conversation, message.sender);
+    final sealed = CipherService.instance.encrypt(
+      key.key,
+      Uint8List.fromList(utf8.encode(message.text)),
+      aad: Uint8List.fromList(utf8.encode('${key.id}|${message.id}')),
+    );
+    return ChatMessage(id: message.id, sender: message.sender, sealed: base64Encode(sealed), keyId: key.id, timestamp: message.timestamp);
+  }
+
+  /// Anahtarı bilinen şifreli mesajları açar; [backgroundThreshold]'u aşan
+  /// gruplar arka plan isolate'inde çözülür. Anahtarı bilinmeyenler şifreli
+  /// kalır ve anahtar sahibinden istenir; anahtar gelince dinleyiciler
+  /// bilgilendirilir.
+  Future<List<ChatMessage>> openAll(List<ChatMessage> messages) async {
+    if (!messages.any((m) => m.isSealed)) return messages;
+    await _ready;
+    final positions = <int>[];
+    final jobs = <List<Object>>[];
+    for (var i = 0; i < messages.length; i++) {
+      final message = messages[i];
+      if (!message.isSealed) continue;
+      final key = _lookup(message.keyId!);
+      if (key == null) {
+        _request(message.keyId!);
+        continue;
+      }
+      positions.add(i);
+      jobs.add([key, message.sealed!, '${message.keyId}|${message.id}']);
+    }
+    if (jobs.isEmpty) return messages;
+    final texts = jobs.length < backgroundThreshold ? _openBatch(jobs) : await Isolate.run(() => _openBatch(jobs));
+    final opened = List<ChatMessage>.of(messages);
+    for (var j = 0; j < texts.length; j++) {
+      final text = texts[j];
+      if (text != null) opened[positions[j]] = messages[positions[j]].opened(text);
+    }
+    return opened;
+  }
+}
+
+class QuantumStubScreen extends StatefulWidget {
+  @override
+  _QuantumStubScreen createState() => _QuantumStubScreen(); 
+}
+
+class _QuantumStubScreen extends State<QuantumStubScreen> {
+  String encryptedText = '';
+  final key = CipherService.instance.generateKey();
+  final controller = TextEditingController();
+
+
+  void _encryptText() {
+    setState(() => encryptedText = CipherService.instance.encryptText(key, controller.text));
+  }
+
+
+  @override
+  Widget build(BuildContext context) {
+    return Scaffold(
+      appBar: AppBar(title: Text('Kuantum Güvenli Şifreleme')),
+      body: Padding(
+        padding: EdgeInsets.all(16),
+        child: Column(
+          children: [
+            TextField(controller: controller, decoration: InputDecoration(labelText: 'Metin girin')),
+            SizedBox(height: 10),
+            ElevatedButton(onPressed: _encryptText, child: Text('Şifrele')),
+            SizedBox(height: 10),
+            SelectableText('Şifreli Metin (AES-GCM): $encryptedText'),
+          ],
+        ),
+      ),
+    );
+  }
+}
+
+class GroupModel {
+  static const int codecVersion = 2;
+
+  final String id;
+  final String name;
+  final String description;
+  final String imageUrl;
+  final bool isPrivate;
+  /// Üye listesi [MembershipIndex]'te tutulur; burada yalnızca sayı taşınır.
+  final int memberCount;
+  /// Sunucudaki son değişikliğin sürümü.
+  final int revision;
+  final int updatedAt;
+
+  GroupModel({
+    required this.id,
+    required this.name,
+    required this.description,
+    required this.imageUrl,
+    required this.isPrivate,
+    this.memberCount = 0,
+    this.revision = 0,
+    int? updatedAt,
+  }) : updatedAt = updatedAt ?? DateTime.now().millisecondsSinceEpoch;
+
+  factory GroupModel.fromJson(Map<String, dynamic> json) {
+    return GroupModel(
+      id: json['id'],
+      name: json['name'],
+      description: json['description'],
+      imageUrl: json['imageUrl'],
+      isPrivate: json['isPrivate'],
+      memberCount: json['memberCount'] ?? (json['members'] as List?)?.length ?? 0,
+      revision: json['revision'] ?? 0,
+      updatedAt: json['updatedAt'],
+    );
+  }
+
+  Map<String, dynamic> toJson() {
+    return {
+      'id': id,
+      'name': name,
+      'description': description,
+      'imageUrl': imageUrl,
+      'isPrivate': isPrivate,
+      'memberCount': memberCount,
+      'revision': revision,
+      'updatedAt': updatedAt,
+    };
+  }
+
+  GroupModel copyWith({String? name, String? description, String? imageUrl, bool? isPrivate, int? memberCount, int? revision, int? updatedAt}) {
+    return GroupModel(
+      id: id,
+      name: name ?? this.name,
+      description: description ?? this.description,
+      imageUrl: imageUrl ?? this.imageUrl,
+      isPrivate: isPrivate ?? this.isPrivate,
+      memberCount: memberCount ?? this.memberCount,
+      revision: revision ?? this.revision,
+      updatedAt: updatedAt ?? this.updatedAt,
+    );
+  }
+
+  /// İkili kayıt: sürüm, bayraklar, revizyon, zaman damgası, dizgi alanları ve
+  /// üye sayısı. Alan adı taşımadığı için JSON'dan küçüktür ve ayrıştırma
+  /// gerektirmeden sırayla okunur.
+  void encodeTo(ByteWriter out) {
+    out.uint8(codecVersion);
+    out.uint8(isPrivate ? 1 : 0);
+    out.varint(revision);
+    out.int64(updatedAt);
+    out.string(id);
+    out.string(name);
+    out.string(description);
+    out.string(imageUrl);
+    out.varint(memberCount);
+  }
+
+  Uint8List encode() {
+    final out = ByteWriter();
+    encodeTo(out);
+    return out.takeBytes();
+  }
+
+  factory GroupModel.decodeFrom(ByteReader input) {
+    final version = input.uint8();
+    if (version != codecVersion) throw FormatException('Desteklenmeyen grup kaydı sürümü: $version');
+    final flags = input.uint8();
+    final revision = input.varint();
+    final updatedAt = input.int64();
+    return GroupModel(
+      id: input.string(),
+      name: input.string(),
+      description: input.string(),
+      imageUrl: input.string(),
+      isPrivate: flags & 1 != 0,
+      memberCount: input.varint(),
+      revision: revision,
+      updatedAt: updatedAt,
+    );
+  }
+
+  factory GroupModel.decode(Uint8List bytes) => GroupModel.decodeFrom(ByteReader(bytes));
+}
+
+class _CachedGroup {
+  GroupModel group;
+  int fetchedAt;
+
+  _CachedGroup(this.group, this.fetchedAt);
+}
+
+/// Grupların cihazdaki önbelleği ve sunucuyla delta eşitlemesi.
+///
+/// Gruplar `groups/groups.bin` dosyasında ikili kayıtlar olarak tutulur;
+/// liste açılırken ağ beklenmez. Sunucuya yalnızca son imleçten bu yana
+/// değişen gruplar ve üyelik farkları sorulur (`groupSync`). [ttl]'i dolan
+/// kayıtlar gösterilmeye devam eder, bir sonraki eşitlemede tamamı yeniden
+/// istenir. Önbellek [maxGroups]'u aşınca en uzun süredir açılmayan gruplar
+/// atılır.
+class GroupRepository extends ChangeNotifier {
+  static final GroupRepository instance = GroupRepository(ConnectionManager.instance);
+  static const int _magic = 0x4d475250;
+
+  final ConnectionManager connection;
+  final Duration ttl;
+  final int maxGroups;
+  final Map<String, _CachedGroup> _groups = {};
+  int _cursor = 0;
+  List<GroupModel>? _sorted;
+  late final Future<void> _ready;
+  Timer? _saveTimer;
+  bool _syncing = false;
+  bool _resync = false;
+
+  GroupRepository(this.connection, {this.ttl = const Duration(hours: 24), this.maxGroups = 1000}) {
+    _ready = _load();
+    connection.socket.on('connect', (_) => sync());
+    connection.socket.on('groupChanged', (_) => sync());
+  }
+
+  Future<void> get ready => _ready;
+
+  /// Son güncellenen önce.
+  List<GroupModel> get groups => _sorted ??= ([for (final entry in _groups.values) entry.group]
+    ..sort((a, b) => b.updatedAt.compareTo(a.updatedAt)));
+
+  /// Grubu döndürür ve LRU sırasında en yeniye taşır.
+  GroupModel? get(String id) {
+    final entry = _groups.remove(id);
+    if (entry == null) return null;
+    _groups[id] = entry;
+    return entry.group;
+  }
+
+  Future<File> get _file async => File('${(await AppStorage.dir('groups')).path}/groups.bin');
+
+  Future<void> _load() async {
+    final file = await _file;
+    if (!await file.exists()) return;
+    try {
+      final input = ByteReader(await file.readAsBytes());
+      if (input.varint() != _magic) throw FormatException('Grup önbelleği tanınmadı');
+      final cursor = input.varint();
+      final count = input.varint();
+      for (var i = 0; i < count; i++) {
+        final fetchedAt = input.int64();
+        final group = GroupModel.decodeFrom(input);
+        _groups[group.id] = _CachedGroup(group, fetchedAt);
+      }
+      _cursor = cursor;
+    } catch (e) {
+      // Bozuk önbellek: sıfırdan eşitlenir
+      print("Grup önbelleği okunamadı: $e");
+      _groups.clear();
+      _cursor = 0;
+    }
+    _sorted = null;
+    notifyListeners();
+  }
+
+  void _scheduleSave() {
+    _saveTimer ??= Timer(Duration(milliseconds: 500), () async {
+      _saveTimer = null;
+      final out = ByteWriter()
+        ..varint(_magic)
+        ..varint(_cursor)
+        ..varint(_groups.length);
+      for (final entry in _groups.values) {
+        out.int64(entry.fetchedAt);
+        entry.group.encodeTo(out);
+      }
+      final file = await _file;
+      final tmp = File('${file.path}.tmp');
+      await tmp.writeAsBytes(out.takeBytes(), flush: true);
+      await tmp.rename(file.path);
+    });
+  }
+
+  void _changed() {
+    _sorted = null;
+    notifyListeners();
+    _scheduleSave();
+  }
+
+  void _put(GroupModel group, int fetchedAt) {
+    _groups.remove(group.id);
+    _groups[group.id] = _CachedGroup(group, fetchedAt);
+    while (_groups.length > maxGroups) {
+      _groups.remove(_groups.keys.first);
+    }
+  }
+
+  /// Son imleçten bu yana değişenleri ve süresi dolan kayıtları çeker.
+  /// Eşitleme sürerken gelen istek kaybolmaz, bitince bir tur daha çalışır.
+  Future<void> sync() async {
+    await _ready;
+    if (!connection.socket.connected) return;
+    if (_syncing) {
+      _resync = true;
+      return;
+    }
+    _syncing = true;
+    try {
+      final now = DateTime.now().millisecondsSinceEpoch;
+      final stale = [
+        for (final entry in _groups.entries)
+          if (now - entry.value.fetchedAt > ttl.inMilliseconds) entry.key
+      ];
+      final delta = await emitAck(connection.socket, 'groupSync', {'since': _cursor, if (stale.isNotEmpty) 'refresh': stale});
+      _apply(Map<String, dynamic>.from(delta));
+    } on TimeoutException {
+      print("Grup eşitlemesi zaman aşımına uğradı");
+    } finally {
+      _syncing = false;
+    }
+    if (_resync) {
+      _resync = false;
+      await sync();
+    }
+  }
+
+  /// Delta: `groups` (değişen ve yenilenen gruplar), `removed` (silinen
+  /// id'ler), `members` (sıralı katılma/ayrılma kayıtları, her biri güncel
+  /// üye sayısıyla) ve yeni `cursor`.
+  void _apply(Map<String, dynamic> delta) {
+    final now = DateTime.now().millisecondsSinceEpoch;
+    for (final json in delta['groups'] ?? const []) {
+      _put(GroupModel.fromJson(Map<String, dynamic>.from(json)), now);
+    }
+    for (final id in delta['removed'] ?? const []) {
+      _groups.remove(id);
+    }
+    for (final change in delta['members'] ?? const []) {
+      // Üye listesi yalnızca açılmış dizinlere uygulanır
+      MembershipIndex.peek(change['group'])?.apply(change['user'], change['joined'] == true, count: change['count']);
+      final entry = _groups[change['group']];
+      if (entry != null) entry.group = entry.group.copyWith(memberCount: change['count']);
+    }
+    _cursor = max(_cursor, (delta['cursor'] ?? _cursor) as int);
+    _changed();
+  }
+
+  /// Grubu önce yerel önbelleğe ekler, sonra sunucuya bildirir.
+  Future<GroupModel> create({required String name, String description = '', bool isPrivate = false, String? owner}) async {
+    await _ready;
+    final group = GroupModel(
+      id: const Uuid().v4(),
+      name: name,
+      description: description,
+      imageUrl: '',
+      isPrivate: isPrivate,
+      memberCount: owner == null ? 0 : 1,
+    );
+    _put(group, group.updatedAt);
+    _changed();
+    if (owner != null) MembershipIndex.of(group.id).apply(owner, true);
+    connection.socket.emit('groupCreate', {...group.toJson(), 'members': [if (owner != null) owner]});
+    return group;
+  }
+}
+
+class MemberPage {
+  final List<String> members;
+  /// Bir sonraki sayfanın başlangıç konumu.
+  final int next;
+
+  MemberPage(this.members, this.next);
+}
+
+/// Bir grubun üyelik dizini.
+///
+/// Üyeler kimlikten konuma bir harita ve katılma sırasına göre bir listeyle
+/// tutulur: üyelik sorgusu O(1), sayfalama konumdan ileri taramadır. Ayrılan
+/// üyeler listede boşluk bırakır; açılışta boşluklar canlı üyelerin üçte
+/// birini aşarsa dosya sıkıştırılır. Değişiklikler `members/<grup>.log`
+/// dosyasına ikili kayıtlar olarak eklenir. Büyük gruplarda liste sunucudan
+/// [pageSize]'lık sayfalarla gerektikçe çekilir; liste tamamlanana kadar
+/// [count] sunucunun bildirdiği sayıdır.
+class MembershipIndex extends ChangeNotifier {
+  static const int pageSize = 1000;
+  static const int _leaveOp = 0;
+  static const int _joinOp = 1;
+  static const int _cursorOp = 2;
+  static const int _completeOp = 3;
+  static final Map<String, MembershipIndex> _indexes = {};
+  static bool _listening = false;
+
   final String groupId;
-  final String userId;
+  final List<String?> _order = [];
+  final Map<String, int> _position = {};
+  String? _fetchCursor;
+  bool _complete = false;
+  int? _serverCount;
+  RandomAccessFile? _log;
+  late Future<void> _lock;
+  bool _fetching = false;
+
+  MembershipIndex._(this.groupId) {
+    _lock = _open();
+  }
 
-  const GroupChatPage({required this.groupId, required this.userId});
+  factory MembershipIndex.of(String groupId) {
+    if (!_listening) {
+      _listening = true;
+      ConnectionManager.instance.socket.on('memberChanged', (data) {
+        peek(data['group'])?.apply(data['user'], data['joined'] == true, count: data['count']);
+      });
+    }
+    return _indexes.putIfAbsent(groupId, () => MembershipIndex._(groupId));
+  }
+
+  /// Yalnızca açılmış dizini döndürür.
+  static MembershipIndex? peek(String groupId) => _indexes[groupId];
+
+  Future<void> get ready => _synchronized(() async {});
+  bool get isComplete => _complete;
+  bool contains(String user) => _position.containsKey(user);
+  int get count => _complete ? _position.length : max(_position.length, _serverCount ?? 0);
+
+  Future<T> _synchronized<T>(Future<T> Function() action) {
+    final result = _lock.then((_) => action());
+    _lock = result.then((_) {}, onError: (_) {});
+    return result;
+  }
+
+  Future<File> get _file async =>
+      File('${(await AppStorage.dir('members')).path}/${groupId.replaceAll(RegExp(r'[^\w-]'), '_')}.log');
+
+  Future<void> _open() async {
+    final file = await _file;
+    var damaged = false;
+    if (await file.exists()) {
+      final input = ByteReader(await file.readAsBytes());
+      try {
+        while (!input.isAtEnd) {
+          final op = input.uint8();
+          if (op == _completeOp) {
+            _complete = true;
+          } else if (op == _cursorOp) {
+            _fetchCursor = input.string();
+          } else {
+            _set(input.string(), op == _joinOp);
+          }
+        }
+      } on RangeError {
+        // Yarım yazılmış son kayıt; dosya yeniden yazılarak atılır
+        damaged = true;
+      }
+    }
+    if (damaged || (_order.length - _position.length) * 3 > _position.length) await _compact(file);
+    _log = await file.open(mode: FileMode.append);
+    notifyListeners();
+  }
+
+  Future<void> _compact(File file) async {
+    _order.removeWhere((user) => user == null);
+    final out = ByteWriter();
+    for (var i = 0; i < _order.length; i++) {
+      _position[_order[i]!] = i;
+      out
+        ..uint8(_joinOp)
+        ..string(_order[i]!);
+    }
+    if (_fetchCursor != null) {
+      out
+        ..uint8(_cursorOp)
+        ..string(_fetchCursor!);
+    }
+    if (_complete) out.uint8(_completeOp);
+    final tmp = File('${file.path}.tmp');
+    await tmp.writeAsBytes(out.takeBytes(), flush: true);
+    await tmp.rename(file.path);
+  }
+
+  bool _set(String user, bool joined) {
+    final at = _position[user];
+    if (joined) {
+      if (at != null) return false;
+      _position[user] = _order.length;
+      _order.add(user);
+      return true;
+    }
+    if (at == null) return false;
+    _position.remove(user);
+    _order[at] = null;
+    return true;
+  }
+
+  /// Katılma/ayrılma değişikliğini uygular; tekrar gelen değişiklikler yok sayılır.
+  Future<void> apply(String user, bool joined, {int? count}) => _synchronized(() async {
+        if (count != null) _serverCount = count;
+        if (_set(user, joined)) {
+          await _log!.writeFrom((ByteWriter()
+                ..uint8(joined ? _joinOp : _leaveOp)
+                ..string(user))
+              .takeBytes());
+        } else if (count == null) {
+          return;
+        }
+        notifyListeners();
+      });
+
+  /// [from] konumundan itibaren en fazla [limit] üye.
+  MemberPage page({int from = 0, int limit = 50}) {
+    final members = <String>[];
+    var i = from;
+    while (i < _order.length && members.length < limit) {
+      final user = _order[i++];
+      if (user != null) members.add(user);
+    }
+    return MemberPage(members, i);
+  }
+
+  /// Sunucudan bir sonraki üye sayfasını çeker; liste tamamsa bir şey yapmaz.
+  Future<void> fetchMore() async {
+    final socket = ConnectionManager.instance.socket;
+    if (_fetching || _complete || !socket.connected) return;
+    _fetching = true;
+    try {
+      await ready;
+      final res = Map<String, dynamic>.from(await emitAck(socket, 'groupMembers', {
+        'group': groupId,
+        'after': _fetchCursor,
+        'limit': pageSize,
+      }));
+      await _synchronized(() async {
+        final out = ByteWriter();
+        for (final user in List<String>.from(res['members'])) {
+          if (_set(user, true)) {
+            out
+              ..uint8(_joinOp)
+              ..string(user);
+          }
+        }
+        _serverCount = res['count'];
+        if (res['next'] != null) {
+          _fetchCursor = res['next'];
+          out
+            ..uint8(_cursorOp)
+            ..string(_fetchCursor!);
+        }
+        if (res['done'] == true) {
+          _complete = true;
+          out.uint8(_completeOp);
+        }
+        await _log!.writeFrom(out.takeBytes());
+      });
+      notifyListeners();
+    } on TimeoutException {
+      print("Üye listesi alınamadı: $groupId");
+    } finally {
+      _fetching = false;
+    }
+  }
+
+  Future<void> join(String user) => _change(user, true);
+
+  Future<void> leave(String user) => _change(user, false);
+
+  /// Yerelde hemen uygulanır; sunucu zaman aşımına uğrarsa veya hata
+  /// döndürürse geri alınır. Sunucu hatası [StateError] olarak fırlatılır.
+  Future<void> _change(String user, bool joined) async {
+    await ready;
+    if (contains(user) == joined) return;
+    await apply(user, joined);
+    final dynamic res;
+    try {
+      res = await emitAck(ConnectionManager.instance.socket, joined ? 'groupJoin' : 'groupLeave', {'group': groupId, 'user': user});
+    } on TimeoutException {
+      await apply(user, !joined);
+      rethrow;
+    }
+    if (res is Map && res['error'] != null) {
+      await apply(user, !joined);
+      throw StateError('${res['error']}');
+    }
+    if (res is Map && res['count'] != null) await apply(user, joined, count: res['count']);
+  }
+}
+
+/// 7) Çeviri
+class TranslateScreen extends StatelessWidget {
+  @override
+  Widget build(BuildContext context) => Scaffold(
+        appBar: AppBar(title: Text('AI Çeviri')),
+        body: Center(child: Text('Gerçek zamanlı AI çeviri entegrasyonu buraya')),
+      );
+}
+
+/// İki koordinat arasındaki büyük daire uzaklığı (metre).
+double distanceMeters(double lat1, double lng1, double lat2, double lng2) {
+  const earthRadius = 6371000.0;
+  final dLat = (lat2 - lat1) * pi / 180;
+  final dLng = (lng2 - lng1) * pi / 180;
+  final a = sin(dLat / 2) * sin(dLat / 2) + cos(lat1 * pi / 180) * cos(lat2 * pi / 180) * sin(dLng / 2) * sin(dLng / 2);
+  return 2 * earthRadius * asin(sqrt(min(a, 1.0)));
+}
+
+class LocationSample {
+  final double latitude;
+  final double longitude;
+  /// Metre.
+  final double accuracy;
+  /// m/s; bilinmiyorsa 0.
+  final double speed;
+  final int timestamp;
+
+  LocationSample({required this.latitude, required this.longitude, this.accuracy = 0, this.speed = 0, int? timestamp})
+      : timestamp = timestamp ?? DateTime.now().millisecondsSinceEpoch;
+
+  factory LocationSample.fromPosition(Position position) => LocationSample(
+        latitude: position.latitude,
+        longitude: position.longitude,
+        accuracy: position.accuracy,
+        speed: max(position.speed, 0),
+        timestamp: position.timestamp.millisecondsSinceEpoch,
+      );
+
+  double distanceTo(LocationSample other) => distanceMeters(latitude, longitude, other.latitude, other.longitude);
+}
+
+/// Konum örnekleri için delta kodlaması.
+///
+/// Koordinatlar 1e-5 dereceye (~1 m) yuvarlanır. İlk örnek tam yazılır,
+/// sonrakiler bir öncekinden farkları olarak zigzag varint'le yazılır; yürüyüş
+/// hızında bir örnek birkaç bayt tutar.
+class LocationBatch {
+  static const int version = 1;
+  static const double _scale = 1e5;
+
+  static Uint8List encode(List<LocationSample> samples) {
+    final out = ByteWriter()
+      ..uint8(version)
+      ..varint(samples.length);
+    var time = 0, lat = 0, lng = 0;
+    for (var i = 0; i < samples.length; i++) {
+      final sample = samples[i];
+      final nextLat = (sample.latitude * _scale).round();
+      final nextLng = (sample.longitude * _scale).round();
+      if (i == 0) {
+        out.int64(sample.timestamp);
+      } else {
+        out.svarint(sample.timestamp - time);
+      }
+      out.svarint(nextLat - lat);
+      out.svarint(nextLng - lng);
+      out.varint(sample.accuracy.round());
+      // Hız desimetre/saniye
+      out.varint((sample.speed * 10).round());
+      time = sample.timestamp;
+      lat = nextLat;
+      lng = nextLng;
+    }
+    return out.takeBytes();
+  }
+
+  static List<LocationSample> decode(Uint8List bytes) {
+    final input = ByteReader(bytes);
+    final v = input.uint8();
+    if (v != version) throw FormatException('Desteklenmeyen konum paketi sürümü: $v');
+    final count = input.varint();
+    final samples = <LocationSample>[];
+    var time = 0, lat = 0, lng = 0;
+    for (var i = 0; i < count; i++) {
+      time = i == 0 ? input.int64() : time + input.svarint();
+      lat += input.svarint();
+      lng += input.svarint();
+      samples.add(LocationSample(
+        latitude: lat / _scale,
+        longitude: lng / _scale,
+        accuracy: input.varint().toDouble(),
+        speed: input.varint() / 10,
+        timestamp: time,
+      ));
+    }
+    return samples;
+  }
+}
+
+/// Konum örnekleri akışı. Doğruluk veya mesafe filtresi değiştiğinde akış
+/// yeniden açılır.
+abstract class LocationSource {
+  Stream<LocationSample> positions(LocationAccuracy accuracy, int distanceFilter);
+}
+
+/// Cihaz GPS'i. Servis ve izin oturum başına bir kez denetlenir.
+class GeolocatorLocationSource implements LocationSource {
+  Future<String?>? _check;
+
+  /// Konum kullanılamıyorsa nedeni döner.
+  Future<String?> _ensure() async {
+    if (!await Geolocator.isLocationServiceEnabled()) return "Konum verisi kapalı!";
+    var permission = await Geolocator.checkPermission();
+    if (permission == LocationPermission.denied) permission = await Geolocator.requestPermission();
+    if (permission != LocationPermission.whileInUse && permission != LocationPermission.always) return "Konum izni verilmedi!";
+    return null;
+  }
+
+  @override
+  Stream<LocationSample> positions(LocationAccuracy accuracy, int distanceFilter) async* {
+    final problem = await (_check ??= _ensure());
+    if (problem != null) {
+      // Kullanıcı ayarları değiştirebilir; bir sonraki denemede yeniden sorulur
+      _check = null;
+      throw StateError(problem);
+    }
+    yield* Geolocator.getPositionStream(locationSettings: LocationSettings(accuracy: accuracy, distanceFilter: distanceFilter))
+        .map(LocationSample.fromPosition);
+  }
+}
+
+/// GPS olmadan deneme için sahte konum kaynağı.
+///
+/// Başlangıç noktasından rastgele dönüşlerle yürür, ara ara [stopEvery]
+/// örnek boyunca durur ve hız kazanıp araç hızına çıkar; böylece eşikler ve
+/// doğruluk geçişleri gerçek cihaz olmadan denenebilir. Doğruluk istenen
+/// seviyeye göre gürültü ekler ve mesafe filtresi platform gibi uygulanır.
+class SimulatedLocationSource implements LocationSource {
+  final Duration interval;
+  final int stopEvery;
+  final Random _random;
+  double _latitude;
+  double _longitude;
+  double _heading = 0;
+  double _speed = 1.4;
+  int _step = 0;
+
+  SimulatedLocationSource({
+    double latitude = 41.0082,
+    double longitude = 28.9784,
+    this.interval = const Duration(seconds: 1),
+    this.stopEvery = 120,
+    int? seed,
+  })  : _latitude = latitude,
+        _longitude = longitude,
+        _random = Random(seed);
+
+  static double _noise(LocationAccuracy accuracy) {
+    switch (accuracy) {
+      case LocationAccuracy.best:
+      case LocationAccuracy.bestForNavigation:
+      case LocationAccuracy.high:
+        return 5;
+      case LocationAccuracy.medium:
+        return 30;
+      default:
+        return 100;
+    }
+  }
+
+  void _advance() {
+    _step++;
+    final phase = _step % (stopEvery * 3);
+    if (phase < stopEvery) {
+      _speed = 0;
+    } else if (phase < stopEvery * 2) {
+      _speed = 1.4;
+    } else {
+      _speed = min(_speed + 0.5, 14);
+    }
+    _heading += (_random.nextDouble() - 0.5) * 0.6;
+    final meters = _speed * interval.inMilliseconds / 1000;
+    _latitude += meters * cos(_heading) / 111320;
+    _longitude += meters * sin(_heading) / (111320 * cos(_latitude * pi / 180));
+  }
+
+  @override
+  Stream<LocationSample> positions(LocationAccuracy accuracy, int distanceFilter) async* {
+    final noise = _noise(accuracy);
+    LocationSample? last;
+    while (true) {
+      await Future.delayed(interval);
+      _advance();
+      final error = noise * _random.nextDouble();
+      final angle = _random.nextDouble() * 2 * pi;
+      final sample = LocationSample(
+        latitude: _latitude + error * cos(angle) / 111320,
+        longitude: _longitude + error * sin(angle) / (111320 * cos(_latitude * pi / 180)),
+        accuracy: noise,
+        speed: _speed,
+      );
+      if (last != null && sample.distanceTo(last) < distanceFilter) continue;
+      last = sample;
+      yield sample;
+    }
+  }
+}
+
+enum _Motion { still, walking, driving }
+
+/// Canlı konum paylaşımı.
+///
+/// Konum akışından gelen örnekler yalnızca son gönderilenden en az
+/// [minDistance] (ve örneğin doğruluğu kadar) uzaklaşıldığında ve en az
+/// [minInterval] geçtiğinde alınır. Duran cihaz örnek üretmediğinden
+/// [heartbeat] bir zamanlayıcıyla yürür: son gönderimden bu yana süre dolunca
+/// en son konum güncel zamanla yeniden gönderilir. Alınan örnekler [batchInterval] boyunca veya [maxBatch]'e
+/// kadar biriktirilip [LocationBatch] ile tek ikili `locationBatch` olayında
+/// gider; ilk konum beklemeden gönderilir. Doğruluk harekete uyarlanır:
+/// [stillAfter] boyunca duran cihazda düşük doğruluk ve geniş filtre, araç
+/// hızında yüksek doğruluk ve geniş filtre kullanılır. Bağlantı yokken en
+/// fazla [maxBatch] örnek saklanır.
+class LiveLocationSharer extends ChangeNotifier {
+  static final LiveLocationSharer instance = LiveLocationSharer(ConnectionManager.instance);
+
+  final ConnectionManager connection;
+  final double minDistance;
+  final Duration minInterval;
+  final Duration heartbeat;
+  final Duration batchInterval;
+  final int maxBatch;
+  final Duration stillAfter;
+  LocationSource source = GeolocatorLocationSource();
+  final List<LocationSample> _batch = [];
+  String? _user;
+  StreamSubscription<LocationSample>? _positions;
+  Timer? _flushTimer;
+  Timer? _heartbeatTimer;
+  LocationSample? _lastSent;
+  LocationSample? latest;
+  _Motion _motion = _Motion.walking;
+  int? _slowSince;
+  int sentSamples = 0;
+  int sentBytes = 0;
+  String? error;
+
+  LiveLocationSharer(
+    this.connection, {
+    this.minDistance = 20,
+    this.minInterval = const Duration(seconds: 5),
+    this.heartbeat = const Duration(seconds: 60),
+    this.batchInterval = const Duration(seconds: 10),
+    this.maxBatch = 20,
+    this.stillAfter = const Duration(minutes: 2),
+  }) {
+    connection.socket.on('connect', (_) {
+      if (_batch.isNotEmpty) _flush();
+    });
+  }
+
+  bool get sharing => _user != null;
+
+  LocationAccuracy get accuracy => _motion == _Motion.still ? LocationAccuracy.low : LocationAccuracy.high;
+
+  /// Hareket durumuna göre platform mesafe filtresi (metre).
+  static const Map<_Motion, int> _distanceFilters = {_Motion.still: 100, _Motion.walking: 10, _Motion.driving: 50};
+
+  void start(String user, {LocationSource? source}) {
+    if (sharing) stop();
+    if (source != null) this.source = source;
+    _user = user;
+    _lastSent = null;
+    _motion = _Motion.walking;
+    _slowSince = null;
+    sentSamples = 0;
+    sentBytes = 0;
+    _listen();
+    _scheduleHeartbeat();
+    notifyListeners();
+  }
+
+  void stop() {
+    final user = _user;
+    if (user == null) return;
+    _flush();
+    _positions?.cancel();
+    _positions = null;
+    _flushTimer?.cancel();
+    _flushTimer = null;
+    _heartbeatTimer?.cancel();
+    _heartbeatTimer = null;
+    _batch.clear();
+    _user = null;
+    connection.socket.emit('locationStop', {'user': user});
+    notifyListeners();
+  }
+
+  void _listen() {
+    _positions?.cancel();
+    error = null;
+    _positions = source.positions(accuracy, _distanceFilters[_motion]!).listen(_onSample, onError: (e) {
+      error = e is StateError ? e.message : '$e';
+      notifyListeners();
+    });
+  }
+
+  /// Hareket durumu değişince akışı yeni doğruluk ve filtreyle yeniden açar.
+  void _adapt(LocationSample sample) {
+    var motion = _motion;
+    if (sample.speed >= 8) {
+      motion = _Motion.driving;
+      _slowSince = null;
+    } else if (sample.speed >= 0.5) {
+      motion = _Motion.walking;
+      _slowSince = null;
+    } else {
+      _slowSince ??= sample.timestamp;
+      if (sample.timestamp - _slowSince! >= stillAfter.inMilliseconds) motion = _Motion.still;
+    }
+    if (motion == _motion) return;
+    _motion = motion;
+    _listen();
+  }
+
+  void _onSample(LocationSample sample) {
+    if (!sharing) return;
+    latest = sample;
+    _adapt(sample);
+    final previous = _lastSent;
+    if (previous != null) {
+      final elapsed = sample.timestamp - previous.timestamp;
+      final moved = sample.distanceTo(previous) >= max(minDistance, sample.accuracy);
+      if (elapsed < minInterval.inMilliseconds || (!moved && elapsed < heartbeat.inMilliseconds)) {
+        notifyListeners();
+        return;
+      }
+    }
+    _queue(sample, immediate: previous == null);
+    notifyListeners();
+  }
+
+  void _queue(LocationSample sample, {bool immediate = false}) {
+    _lastSent = sample;
+    _batch.add(sample);
+    _scheduleHeartbeat();
+    if (immediate || _batch.length >= maxBatch) {
+      _flush();
+    } else {
+      _flushTimer ??= Timer(batchInterval, _flush);
+    }
+  }
+
+  void _scheduleHeartbeat() {
+    _heartbeatTimer?.cancel();
+    _heartbeatTimer = Timer(heartbeat, _beat);
+  }
+
+  /// Son gönderimden beri [heartbeat] geçti: en son konumu şimdiki zamanla
+  /// yeniden gönderir. Henüz konum yoksa yalnızca zamanlayıcıyı kurar.
+  void _beat() {
+    _heartbeatTimer = null;
+    if (!sharing) return;
+    final last = latest ?? _lastSent;
+    if (last == null) {
+      _scheduleHeartbeat();
+      return;
+    }
+    _queue(
+      LocationSample(latitude: last.latitude, longitude: last.longitude, accuracy: last.accuracy, speed: last.speed),
+      immediate: true,
+    );
+  }
+
+  void _flush() {
+    _flushTimer?.cancel();
+    _flushTimer = null;
+    final user = _user;
+    if (user == null || _batch.isEmpty) return;
+    if (!connection.socket.connected) {
+      if (_batch.length > maxBatch) _batch.removeRange(0, _batch.length - maxBatch);
+      return;
+    }
+    final bytes = LocationBatch.encode(_batch);
+    connection.socket.emitWithBinary('locationBatch', {'user': user, 'points': bytes});
+    sentSamples += _batch.length;
+    sentBytes += bytes.length;
+    _batch.clear();
+  }
+}
+
+class LocationUpdate {
+  final String user;
+  /// Paylaşım bittiyse null.
+  final LocationSample? sample;
+
+  LocationUpdate(this.user, this.sample);
+}
+
+/// Başka kullanıcıların canlı konumlarını izler.
+///
+/// Her izlenen kullanıcı için `location:<kullanıcı>` odasına abone olunur;
+/// sunucu paylaşanın paketlerini yalnızca bu odaya dağıtır. Açılışta son
+/// paket `locationWatch` ile istenir. Her kullanıcının yalnızca en yeni
+/// konumu tutulur ve değişiklikler [updates] akışına düşer.
+class LiveLocationWatcher extends ChangeNotifier {
+  static final LiveLocationWatcher instance = LiveLocationWatcher(ConnectionManager.instance);
+
+  final ConnectionManager connection;
+  final Map<String, ChannelSubscription> _subscriptions = {};
+  final Map<String, LocationSample> _positions = {};
+  final StreamController<LocationUpdate> _updates = StreamController.broadcast();
+
+  LiveLocationWatcher(this.connection) {
+    connection.socket.on('locationBatch', _onBatch);
+    connection.socket.on('locationStop', (data) => _remove(data['user']));
+  }
+
+  Map<String, LocationSample> get positions => Map.unmodifiable(_positions);
+  Stream<LocationUpdate> get updates => _updates.stream;
+  Iterable<String> get watching => _subscriptions.keys;
+
+  Future<void> watch(String user) async {
+    if (_subscriptions.containsKey(user)) return;
+    _subscriptions[user] = connection.subscribe('location:$user');
+    notifyListeners();
+    if (!connection.socket.connected) return;
+    try {
+      final latest = await emitAck(connection.socket, 'locationWatch', {'user': user});
+      if (latest != null) _onBatch(latest);
+    } on TimeoutException {
+      print("Son konum alınamadı: $user");
+    }
+  }
+
+  void unwatch(String user) {
+    _subscriptions.remove(user)?.cancel();
+    _remove(user);
+    notifyListeners();
+  }
+
+  void _onBatch(dynamic data) {
+    final user = data['user'];
+    if (!_subscriptions.containsKey(user)) return;
+    final List<LocationSample> samples;
+    try {
+      samples = LocationBatch.decode(toBytes(data['points']));
+    } on FormatException catch (e) {
+      print("Konum paketi çözülemedi: $e");
+      return;
+    }
+    if (samples.isEmpty) return;
+    final sample = samples.last;
+    final current = _positions[user];
+    if (current != null && current.timestamp >= sample.timestamp) return;
+    _positions[user] = sample;
+    _updates.add(LocationUpdate(user, sample));
+    notifyListeners();
+  }
+
+  void _remove(String user) {
+    if (_positions.remove(user) == null) return;
+    _updates.add(LocationUpdate(user, null));
+    notifyListeners();
+  }
+}
+
+class GeoBounds {
+  final double south;
+  final double west;
+  final double north;
+  final double east;
+
+  const GeoBounds({required this.south, required this.west, required this.north, required this.east});
+
+  /// Merkezi ve yarıçapı verilen dairenin çevreleyen kutusu.
+  factory GeoBounds.around(double latitude, double longitude, double radiusMeters) {
+    final dLat = radiusMeters / 111320;
+    final dLng = radiusMeters / (111320 * max(cos(latitude * pi / 180), 0.01));
+    return GeoBounds(
+      south: max(latitude - dLat, -90),
+      west: max(longitude - dLng, -180),
+      north: min(latitude + dLat, 90),
+      east: min(longitude + dLng, 180),
+    );
+  }
+
+  bool contains(double latitude, double longitude) =>
+      latitude >= south && latitude <= north && longitude >= west && longitude <= east;
+}
+
+class LocationCluster {
+  final double latitude;
+  final double longitude;
+  final int count;
+  /// Tek kişilik kümede kullanıcı.
+  final String? user;
+
+  LocationCluster(this.latitude, this.longitude, this.count, this.user);
+}
+
+/// Bir karedeki konumların sayısı, koordinat toplamları ve kimlikleri.
+class _GeoCell {
+  int count = 0;
+  double sumLatitude = 0;
+  double sumLongitude = 0;
+  final Set<String> members = {};
+}
+
+/// Web Mercator kare koordinatları; [level] seviyesinde dünya 2^level × 2^level
+/// kareye bölünür (harita yakınlaştırma seviyeleriyle aynı ızgara).
+int _tileX(double longitude, int level) {
+  final n = 1 << level;
+  return ((longitude + 180) / 360 * n).floor().clamp(0, n - 1);
+}
+
+int _tileY(double latitude, int level) {
+  final n = 1 << level;
+  final lat = latitude.clamp(-85.05112878, 85.05112878) * pi / 180;
+  return ((1 - log(tan(lat) + 1 / cos(lat)) / pi) / 2 * n).floor().clamp(0, n - 1);
+}
+
+/// Paylaşılan konumlar için artımlı uzamsal dizin.
+///
+/// Her konum 0..[maxLevel] seviyelerinin her birinde bir Mercator karesine
+/// düşer; kareler yalnızca dolu olanlar tutulan haritalardadır ve sayı,
+/// koordinat toplamı ve üye kümesi taşır. Güncelleme seviye sayısı kadar iş
+/// yapar (en ince kare değişmediyse yalnızca toplamlar düzeltilir). Kutu ve
+/// yarıçap sorguları, kutuyu en fazla [_queryCells] kareyle örten en ince
+/// seviyeyi seçip yalnızca o karelerdeki adayları denetler. Kümeler her
+/// yakınlaştırma seviyesi için zaten hazırdır: `zoom + 2` seviyesindeki her
+/// dolu kare (256 piksellik karede ~64 piksel) ağırlık merkezinde tek bir
+/// kümedir; çizim görünen kare sayısıyla orantılıdır, nokta sayısıyla değil.
+class SpatialIndex {
+  static const int maxLevel = 20;
+  static const int _queryCells = 16;
+
+  final Map<String, LocationSample> _points = {};
+  final List<Map<int, _GeoCell>> _levels = List.generate(maxLevel + 1, (_) => <int, _GeoCell>{});
+
+  int get length => _points.length;
+  Iterable<String> get ids => _points.keys;
+  LocationSample? operator [](String id) => _points[id];
+
+  static int _key(int x, int y, int level) => (x << level) | y;
+
+  void update(String id, LocationSample sample) {
+    final previous = _points[id];
+    _points[id] = sample;
+    if (previous != null &&
+        _tileX(previous.longitude, maxLevel) == _tileX(sample.longitude, maxLevel) &&
+        _tileY(previous.latitude, maxLevel) == _tileY(sample.latitude, maxLevel)) {
+      // Aynı en ince karede kaldı; üst seviyelerde de kare değişmez
+      final dLat = sample.latitude - previous.latitude;
+      final dLng = sample.longitude - previous.longitude;
+      for (var level = 0; level <= maxLevel; level++) {
+        final cell = _levels[level][_key(_tileX(sample.longitude, level), _tileY(sample.latitude, level), level)]!;
+        cell.sumLatitude += dLat;
+        cell.sumLongitude += dLng;
+      }
+      return;
+    }
+    if (previous != null) _unlink(id, previous);
+    for (var level = 0; level <= maxLevel; level++) {
+      final cell = _levels[level].putIfAbsent(_key(_tileX(sample.longitude, level), _tileY(sample.latitude, level), level), () => _GeoCell());
+      cell.count++;
+      cell.sumLatitude += sample.latitude;
+      cell.sumLongitude += sample.longitude;
+      cell.members.add(id);
+    }
+  }
+
+  void remove(String id) {
+    final previous = _points.remove(id);
+    if (previous != null) _unlink(id, previous);
+  }
+
+  void _unlink(String id, LocationSample point) {
+    for (var level = 0; level <= maxLevel; level++) {
+      final cells = _levels[level];
+      final key = _key(_tileX(point.longitude, level), _tileY(point.latitude, level), level);
+      final cell = cells[key]!;
+      if (--cell.count == 0) {
+        cells.remove(key);
+        continue;
+      }
+      cell.sumLatitude -= point.latitude;
+      cell.sumLongitude -= point.longitude;
+      cell.members.remove(id);
+    }
+  }
+
+  /// Kutuyu örten kareleri dolaşır; kare sayısı dolu kare sayısını aşıyorsa
+  /// bunun yerine dolu kareler süzülür.
+  void _visit(GeoBounds bounds, int level, void Function(_GeoCell cell) visitor) {
+    final cells = _levels[level];
+    final x0 = _tileX(bounds.west, level), x1 = _tileX(bounds.east, level);
+    final y0 = _tileY(bounds.north, level), y1 = _tileY(bounds.south, level);
+    if ((x1 - x0 + 1) * (y1 - y0 + 1) > cells.length) {
+      final mask = (1 << level) - 1;
+      cells.forEach((key, cell) {
+        final x = key >> level, y = key & mask;
+        if (x >= x0 && x <= x1 && y >= y0 && y <= y1) visitor(cell);
+      });
+      return;
+    }
+    for (var x = x0; x <= x1; x++) {
+      for (var y = y0; y <= y1; y++) {
+        final cell = cells[_key(x, y, level)];
+        if (cell != null) visitor(cell);
+      }
+    }
+  }
+
+  List<String> withinBounds(GeoBounds bounds) {
+    var level = maxLevel;
+    while (level > 0 &&
+        (_tileX(bounds.east, level) - _tileX(bounds.west, level) + 1) * (_tileY(bounds.south, level) - _tileY(bounds.north, level) + 1) >
+            _queryCells) {
+      level--;
+    }
+    final result = <String>[];
+    _visit(bounds, level, (cell) {
+      for (final id in cell.members) {
+        final point = _points[id]!;
+        if (bounds.contains(point.latitude, point.longitude)) result.add(id);
+      }
+    });
+    return result;
+  }
+
+  /// Yarıçap içindekiler, yakından uzağa.
+  List<String> within(double latitude, double longitude, double radiusMeters) {
+    final distances = <String, double>{};
+    for (final id in withinBounds(GeoBounds.around(latitude, longitude, radiusMeters))) {
+      final point = _points[id]!;
+      final distance = distanceMeters(latitude, longitude, point.latitude, point.longitude);
+      if (distance <= radiusMeters) distances[id] = distance;
+    }
+    return distances.keys.toList()..sort((a, b) => distances[a]!.compareTo(distances[b]!));
+  }
+
+  /// [zoom] yakınlaştırmasında görünen alandaki kümeler.
+  List<LocationCluster> clusters(GeoBounds viewport, int zoom) {
+    final result = <LocationCluster>[];
+    _visit(viewport, min(max(zoom, 0) + 2, maxLevel), (cell) {
+      result.add(LocationCluster(
+        cell.sumLatitude / cell.count,
+        cell.sumLongitude / cell.count,
+        cell.count,
+        cell.count == 1 ? cell.members.first : null,
+      ));
+    });
+    return result;
+  }
+}
+
+/// [LiveLocationWatcher] güncellemelerini bir [SpatialIndex]'e işler.
+///
+/// Güncellemeler kare başına toplanır; dinleyiciler kare başına en fazla bir
+/// kez uyarılır. [filter] verilirse yalnızca kabul ettiği kullanıcılar dizine
+/// girer.
+class SharedLocationMap extends ChangeNotifier {
+  final SpatialIndex index = SpatialIndex();
+  final LiveLocationWatcher watcher;
+  final bool Function(String user)? filter;
+  late final IngestBuffer<LocationUpdate> _ingest;
+  late final StreamSubscription<LocationUpdate> _updates;
+
+  SharedLocationMap(this.watcher, {this.filter}) {
+    _ingest = IngestBuffer(onFlush: _apply);
+    watcher.positions.forEach((user, sample) {
+      if (filter?.call(user) ?? true) index.update(user, sample);
+    });
+    _updates = watcher.updates.listen(_ingest.add);
+  }
+
+  void _apply(List<LocationUpdate> batch) {
+    for (final update in batch) {
+      final sample = update.sample;
+      if (sample == null || !(filter?.call(update.user) ?? true)) {
+        index.remove(update.user);
+      } else {
+        index.update(update.user, sample);
+      }
+    }
+    notifyListeners();
+  }
+
+  @override
+  void dispose() {
+    _updates.cancel();
+    _ingest.dispose();
+    super.dispose();
+  }
+}
+
+class LocationSharingScreen extends StatefulWidget {
+  final String username;
+
+  LocationSharingScreen({required this.username});
+
+  @override
+  _LocationSharingScreenState createState() => _LocationSharingScreenState();
+}
+
+class _LocationSharingScreenState extends State<LocationSharingScreen> {
+  final LiveLocationSharer _sharer = LiveLocationSharer.instance;
+  final LiveLocationWatcher _watcher = LiveLocationWatcher.instance;
+  final _watchCtrl = TextEditingController();
+  bool _simulated = false;
+
+  @override
+  void initState() {
+    super.initState();
+    _sharer.addListener(_onChanged);
+    _watcher.addListener(_onChanged);
+  }
+
+  void _onChanged() {
+    if (mounted) setState(() {});
+  }
+
+  @override
+  void dispose() {
+    _sharer.removeListener(_onChanged);
+    _watcher.removeListener(_onChanged);
+    _watchCtrl.dispose();
+    super.dispose();
+  }
+
+  void _toggle() {
+    if (_sharer.sharing) {
+      _sharer.stop();
+    } else {
+      _sharer.start(widget.username, source: _simulated ? SimulatedLocationSource() : GeolocatorLocationSource());
+    }
+  }
+
+  void _watch() {
+    final user = _watchCtrl.text.trim();
+    if (user.isEmpty || user == widget.username) return;
+    _watcher.watch(user);
+    _watchCtrl.clear();
+  }
+
+  String _describe(LocationSample? sample) => sample == null
+      ? "Konum alınıyor..."
+      : "Enlem: ${sample.latitude.toStringAsFixed(5)}, Boylam: ${sample.longitude.toStringAsFixed(5)} (±${sample.accuracy.round()} m)";
+
+  @override
+  Widget build(BuildContext context) {
+    final positions = _watcher.positions;
+    final watching = _watcher.watching.toList();
+    return Scaffold(
+      appBar: AppBar(title: Text('Konum Paylaş')),
+      body: ListView(padding: EdgeInsets.all(16), children: [
+        Text(_sharer.error ?? (_sharer.sharing ? _describe(_sharer.latest) : "Canlı konum kapalı")),
+        if (_sharer.sharing)
+          Text("${_sharer.sentSamples} konum, ${_sharer.sentBytes} bayt gönderildi · "
+              "${_sharer.accuracy == LocationAccuracy.high ? 'yüksek' : 'düşük'} doğruluk"),
+        if (!kReleaseMode)
+          SwitchListTile(
+            title: Text('Simüle konum'),
+            value: _simulated,
+            onChanged: _sharer.sharing ? null : (value) => setState(() => _simulated = value),
+          ),
+        ElevatedButton(
+          onPressed: _toggle,
+          child: Text(_sharer.sharing ? 'Paylaşımı Durdur' : 'Canlı Konumu Paylaş'),
+        ),
+        Divider(),
+        Row(children: [
+          Expanded(child: TextField(controller: _watchCtrl, decoration: InputDecoration(labelText: 'İzlenecek kullanıcı'))),
+          IconButton(icon: Icon(Icons.visibility), onPressed: _watch),
+        ]),
+        for (final user in watching)
+          ListTile(
+            key: ValueKey(user),
+            leading: Icon(positions.containsKey(user) ? Icons.location_on : Icons.location_off),
+            title: Text(user),
+            subtitle: Text(positions.containsKey(user) ? _describe(positions[user]) : "Paylaşmıyor"),
+            trailing: IconButton(icon: Icon(Icons.close), onPressed: () => _watcher.unwatch(user)),
+          ),
+      ]),
+    );
+  }
+}
+
+class GroupCreatePage extends StatefulWidget {
+  final String? userId;
+
+  const GroupCreatePage({this.userId});
+
+  @override
+  _GroupCreatePageState createState() => _GroupCreatePageState();
+}
+
+class _GroupCreatePageState extends State<GroupCreatePage> {
+  final TextEditingController _nameController = TextEditingController();
+  final TextEditingController _descController = TextEditingController();
+  bool _isPrivate = false;
+
+  Future<void> _createGroup() async {
+    final name = _nameController.text.trim();
+    if (name.isEmpty) return;
+    await GroupRepository.instance.create(
+      name: name,
+      description: _descController.text.trim(),
+      isPrivate: _isPrivate,
+      owner: widget.userId,
+    );
+    if (mounted) Navigator.pop(context);
+  }
+
+
+  @override
+  Widget build(BuildContext context) {
+    return Scaffold(
+      appBar: AppBar(title: Text("Grup Oluştur")),
+      body: Padding(
+        padding: EdgeInsets.all(16.0),
+        child: Column(
+          children: [
+            TextField(controller: _nameController, decoration: InputDecoration(labelText: "Grup Adı")),
+            TextField(controller: _descController, decoration: InputDecoration(labelText: "Açıklama")),
+            SwitchListTile(
+              title: Text("Gizli Grup"),
+              value: _isPrivate,
+              onChanged: (val) => setState(() => _isPrivate = val),
+            ),
+            SizedBox(height: 20),
+            ElevatedButton(
+              onPressed: _createGroup,
+              child: Text("Grubu Oluştur"),
+            ),
+          ],
+        ),
+      ),
+    );
+  }
+}
+
+class Block {
+  final int index;
+  final String timestamp;
+  final String data;
+  final String previousHash;
+  final String hash;
+
+
+  Block(this.index, this.timestamp, this.data, this.previousHash) : hash = generateHash(index, timestamp, data, previousHash);
+
+  /// Depodan okunan blok; özet yeniden hesaplanmaz, doğrulama ChainStore'da yapılır.
+  Block.stored(this.index, this.timestamp, this.data, this.previousHash, this.hash);
+
+  static String generateHash(int index, String timestamp, String data, String previousHash) {
+    final input = '$index$timestamp$data$previousHash';
+    return sha256.convert(utf8.encode(input)).toString();
+  }
+
+  factory Block.fromJson(Map<String, dynamic> json) {
+    return Block.stored(json['index'], json['timestamp'], json['data'], json['previousHash'], json['hash']);
+  }
+
+  Map<String, dynamic> toJson() {
+    return {
+      'index': index,
+      'timestamp': timestamp,
+      'data': data,
+      'previousHash': previousHash,
+      'hash': hash,
+    };
+  }
+}
+
+/// 64 bitlik anahtarlardan blok numarasına açık adreslemeli (linear probing)
+/// karma tablo. Tipli diziler kullandığından 1M blok için ~24 MB yer tutar.
+class _HashPrefixIndex {
+  Int64List _keys;
+  Int32List _values;
+  int _count = 0;
+
+  _HashPrefixIndex([int capacity = 1024])
+      : _keys = Int64List(capacity),
+        _values = Int32List(capacity)..fillRange(0, capacity, -1);
+
+  static int prefixOf(String hash) => int.parse(hash.substring(0, 15), radix: 16);
+
+  void add(int key, int value) {
+    if ((_count + 1) * 2 > _values.length) _grow();
+    var slot = key & (_values.length - 1);
+    while (_values[slot] != -1) {
+      slot = (slot + 1) & (_values.length - 1);
+    }
+    _keys[slot] = key;
+    _values[slot] = value;
+    _count++;
+  }
+
+  /// Anahtarı taşıyan tüm blok numaraları (önek çakışmaları dahil).
+  Iterable<int> candidates(int key) sync* {
+    var slot = key & (_values.length - 1);
+    while (_values[slot] != -1) {
+      if (_keys[slot] == key) yield _values[slot];
+      slot = (slot + 1) & (_values.length - 1);
+    }
+  }
+
+  void _grow() {
+    final keys = _keys;
+    final values = _values;
+    _keys = Int64List(values.length * 2);
+    _values = Int32List(values.length * 2)..fillRange(0, values.length * 2, -1);
+    _count = 0;
+    for (var i = 0; i < values.length; i++) {
+      if (values[i] != -1) add(keys[i], values[i]);
+    }
+  }
+}
+
+class ChainVerification {
+  final bool valid;
+  final int verified;
+  final int? firstInvalid;
+
+  ChainVerification(this.valid, this.verified, [this.firstInvalid]);
+}
+
+/// Satır günlüğünde son dizinlenmiş kaydın bitişi.
+///
+/// Günlük yazılıp dizin yazılamadan çökülürse günlüğün sonunda yetim satırlar
+/// kalır; açılışta günlük bu konuma kesilir. [index]'in her [entrySize]
+/// baytlık girdisi kaydın başlangıcıyla başlar. Kayıtlar tek satırlık JSON
+/// olduğundan son kaydın başından ilk satır sonuna kadar okunur.
+Future<int> _indexedLogEnd(RandomAccessFile log, RandomAccessFile index, int count, {int entrySize = 8}) async {
+  if (count == 0) return 0;
+  await index.setPosition((count - 1) * entrySize);
+  var position = ByteData.sublistView(await index.read(8)).getInt64(0);
+  final length = await log.length();
+  await log.setPosition(position);
+  while (position < length) {
+    final chunk = await log.read(4096);
+    if (chunk.isEmpty) break;
+    final newline = chunk.indexOf(0x0a);
+    if (newline >= 0) return position + newline + 1;
+    position += chunk.length;
+  }
+  return length;
+}
+
+/// Blokları cihazda saklayan zincir deposu.
+///
+/// Bloklar yalnızca sona eklenen bir JSON satır dosyasına (`chain.log`) yazılır.
+/// `chain.idx` her blok için 16 bayt tutar: kaydın dosyadaki konumu ve
+/// özetinin 60 bitlik öneki. Açılışta yalnızca son blok okunur; numara ile
+/// erişim tek bir konum okumasıdır, özet ile erişim için dizin ilk aramada
+/// belleğe alınır. Doğrulama `chain.ckpt` kontrol noktasından devam eder ve
+/// sadece o zamandan beri eklenen blokları yeniden özetler.
+class ChainStore {
+  static const int _entrySize = 16;
+  static const int parallelThreshold = 20000;
+  static const int backgroundHashThreshold = 64;
+
+  final Directory dir;
+  final RandomAccessFile _log;
+  final RandomAccessFile _index;
+  int _length;
+  Block? _tip;
+  _HashPrefixIndex? _byHash;
+  Future<void> _lock = Future.value();
+
+  ChainStore._(this.dir, this._log, this._index, this._length);
+
+  static Future<ChainStore>? _shared;
+
+  /// Uygulama genelinde paylaşılan zincir; aynı dosyalara tek yazar olmasını sağlar.
+  static Future<ChainStore> shared() => _shared ??= open();
+
+  static Future<ChainStore> open({Directory? dir}) async {
+    dir ??= await AppStorage.dir('chain');
+    final log = await File('${dir.path}/chain.log').open(mode: FileMode.append);
+    final index = await File('${dir.path}/chain.idx').open(mode: FileMode.append);
+    final store = ChainStore._(dir, log, index, await index.length() ~/ _entrySize);
+    // Çökmeden kalan yarım dizin girdisi ve yetim bloklar atılır
+    await index.truncate(store._length * _entrySize);
+    await log.truncate(await _indexedLogEnd(log, index, store._length, entrySize: _entrySize));
+    if (store._length > 0) store._tip = await store._read(store._length - 1);
+    return store;
+  }
+
+  int get length => _length;
+  Block? get tip => _tip;
+  File get _checkpoint => File('${dir.path}/chain.ckpt');
+
+  Future<T> _synchronized<T>(Future<T> Function() action) {
+    final result = _lock.then((_) => action());
+    _lock = result.then((_) {}, onError: (_) {});
+    return result;
+  }
+
+  Future<int> _offsetOf(int index) async {
+    if (index >= _length) return _log.length();
+    await _index.setPosition(index * _entrySize);
+    return ByteData.sublistView(await _index.read(8)).getInt64(0);
+  }
+
+  Future<Block> _read(int index) async => (await _readRange(index, index + 1)).single;
+
+  Future<List<Block>> _readRange(int from, int to) async {
+    if (from >= to) return [];
+    final start = await _offsetOf(from);
+    final end = await _offsetOf(to);
+    await _log.setPosition(start);
+    final lines = const LineSplitter().convert(utf8.decode(await _log.read(end - start)));
+    return lines.map((line) => Block.fromJson(jsonDecode(line))).toList();
+  }
+
+  Future<Block> blockAt(int index) {
+    RangeError.checkValidIndex(index, this, 'index', _length);
+    return _synchronized(() => _read(index));
+  }
+
+  /// [from, to) aralığını tek okumayla döndürür.
+  Future<List<Block>> range(int from, int to) => _synchronized(() => _readRange(max(0, from), min(to, _length)));
+
+  Future<Block?> blockByHash(String hash) => _synchronized(() async {
+        final byHash = _byHash ??= await _loadHashIndex();
+        for (final index in byHash.candidates(_HashPrefixIndex.prefixOf(hash))) {
+          final block = await _read(index);
+          if (block.hash == hash) return block;
+        }
+        return null;
+      });
+
+  Future<_HashPrefixIndex> _loadHashIndex() async {
+    final table = _HashPrefixIndex(max(1024, 1 << (2 * _length).bitLength));
+    await _index.setPosition(0);
+    final entries = ByteData.sublistView(await _index.read(_length * _entrySize));
+    for (var i = 0; i < _length; i++) {
+      table.add(entries.getInt64(i * _entrySize + 8), i);
+    }
+    return table;
+  }
+
+  /// Zincirin ucuna yeni bir blok ekler.
+  Future<Block> append(String data, {String? timestamp}) => appendAll([data], timestamp: timestamp).then((blocks) => blocks.single);
+
+  /// Birden çok bloğu tek yazmayla ekler; büyük gruplar arka plan
+  /// isolate'inde özetlenir.
+  Future<List<Block>> appendAll(List<String> data, {String? timestamp}) => _synchronized(() async {
+        if (data.isEmpty) return <Block>[];
+        final time = timestamp ?? DateTime.now().toString();
+        final blocks = data.length >= backgroundHashThreshold
+            ? await ChainVerifier.hashBlocks(_length, _tip?.hash ?? '0', time, data)
+            : ChainVerifier._chain(_length, _tip?.hash ?? '0', time, data);
+        await _write(blocks);
+        return blocks;
+      });
+
+  /// Özetleri önceden hesaplanmış blokları ekler; bağlantıyı denetler.
+  Future<void> _write(List<Block> blocks) async {
+    final lines = BytesBuilder(copy: false);
+    final entries = ByteData(blocks.length * _entrySize);
+    var offset = await _log.length();
+    for (var i = 0; i < blocks.length; i++) {
+      final block = blocks[i];
+      final expectedPrevious = i > 0 ? blocks[i - 1].hash : (_tip?.hash ?? '0');
+      if (block.index != _length + i || block.previousHash != expectedPrevious) {
+        throw StateError('Blok ${block.index} zincire bağlanmıyor');
+      }
+      final line = utf8.encode('${jsonEncode(block.toJson())}\n');
+      entries.setInt64(i * _entrySize, offset);
+      entries.setInt64(i * _entrySize + 8, _HashPrefixIndex.prefixOf(block.hash));
+      offset += line.length;
+      lines.add(line);
+    }
+    await _log.setPosition(await _log.length());
+    await _log.writeFrom(lines.takeBytes());
+    await _index.setPosition(_length * _entrySize);
+    await _index.writeFrom(entries.buffer.asUint8List());
+    for (final block in blocks) {
+      _byHash?.add(_HashPrefixIndex.prefixOf(block.hash), block.index);
+    }
+    _length += blocks.length;
+    _tip = blocks.last;
+  }
+
+  /// Son kontrol noktasından bu yana eklenen blokları doğrular; bekleyen
+  /// blok sayısı [parallelThreshold]'u aşarsa iş ChainVerifier ile çekirdeklere
+  /// dağıtılır.
+  Future<ChainVerification> verify({int pageSize = 4096}) => _synchronized(() async {
+        var verified = 0;
+        var previousHash = '0';
+        if (await _checkpoint.exists()) {
+          final saved = jsonDecode(await _checkpoint.readAsString());
+          verified = min(saved['verified'] as int, _length);
+          previousHash = saved['hash'];
+        }
+        if (_length - verified >= parallelThreshold) {
+          final result = await ChainVerifier.verify(dir.path, verified, _length, previousHash);
+          if (result.valid) {
+            await _checkpoint.writeAsString(jsonEncode({'verified': _length, 'hash': _tip!.hash}));
+          }
+          return result;
+        }
+        while (verified < _length) {
+          final page = await _readRange(verified, min(verified + pageSize, _length));
+          for (final block in page) {
+            if (block.index != verified ||
+                block.previousHash != previousHash ||
+                Block.generateHash(block.index, block.timestamp, block.data, block.previousHash) != block.hash) {
+              return ChainVerification(false, verified, verified);
+            }
+            previousHash = block.hash;
+            verified++;
+          }
+          await _checkpoint.writeAsString(jsonEncode({'verified': verified, 'hash': previousHash}));
+        }
+        return ChainVerification(true, verified);
+      });
+
+  Future<void> close() => _synchronized(() async {
+        await _log.close();
+        await _index.close();
+      });
+}
+
+
+class _SegmentResult {
+  final int from;
+  final String firstPrevious;
+  final String lastHash;
+  final int? firstInvalid;
+
+  _SegmentResult(this.from, this.firstPrevious, this.lastHash, this.firstInvalid);
+}
+
+/// Zinciri parçalara bölüp SHA-256 özetlerini işçi isolate'lerde paralel
+/// hesaplayan doğrulayıcı. Her işçi kendi parçasını diskten okur ve parça
+/// içindeki bağlantıları denetler; parçalar arası `previousHash` bağlantıları
+/// sonuçlar birleştirilirken kontrol edilir.
+class ChainVerifier {
+  static Future<ChainVerification> verify(String dir, int from, int to, String previousHash, {int? workers}) async {
+    if (from >= to) return ChainVerification(true, to);
+    workers ??= Platform.numberOfProcessors;
+    final segment = ((to - from) / workers).ceil();
+    final results = await Future.wait([
+      for (var start = from; start < to; start += segment) _spawn(dir, start, min(start + segment, to)),
+    ]);
+    var expected = previousHash;
+    for (final result in results) {
+      if (result.firstPrevious != expected) return ChainVerification(false, result.from, result.from);
+      if (result.firstInvalid != null) return ChainVerification(false, result.firstInvalid!, result.firstInvalid);
+      expected = result.lastHash;
+    }
+    return ChainVerification(true, to);
+  }
+
+  static Future<_SegmentResult> _spawn(String dir, int from, int to) => Isolate.run(() => _verifySegment(dir, from, to));
+
+  static _SegmentResult _verifySegment(String dir, int from, int to, {int pageSize = 4096}) {
+    final index = File('$dir/chain.idx').openSync();
+    final log = File('$dir/chain.log').openSync();
+    try {
+      final count = index.lengthSync() ~/ ChainStore._entrySize;
+      int offsetOf(int i) {
+        if (i >= count) return log.lengthSync();
+        index.setPositionSync(i * ChainStore._entrySize);
+        return ByteData.sublistView(index.readSync(8)).getInt64(0);
+      }
+
+      String? firstPrevious;
+      var previous = '';
+      for (var start = from; start < to; start += pageSize) {
+        final end = min(start + pageSize, to);
+        final begin = offsetOf(start);
+        log.setPositionSync(begin);
+        final lines = const LineSplitter().convert(utf8.decode(log.readSync(offsetOf(end) - begin)));
+        for (var i = 0; i < lines.length; i++) {
+          final block = Block.fromJson(jsonDecode(lines[i]));
+          firstPrevious ??= block.previousHash;
+          if (block.index != start + i ||
+              (block.index != from && block.previousHash != previous) ||
+              Block.generateHash(block.index, block.timestamp, block.data, block.previousHash) != block.hash) {
+            return _SegmentResult(from, firstPrevious, previous, start + i);
+          }
+          previous = block.hash;
+        }
+      }
+      return _SegmentResult(from, firstPrevious ?? '', previous, null);
+    } finally {
+      index.closeSync();
+      log.closeSync();
+    }
+  }
+
+  /// Yeni blokların özetlerini arka planda sırayla hesaplar.
+  static Future<List<Block>> hashBlocks(int firstIndex, String previousHash, String timestamp, List<String> data) =>
+      Isolate.run(() => _chain(firstIndex, previousHash, timestamp, data));
+
+  static List<Block> _chain(int firstIndex, String previousHash, String timestamp, List<String> data) {
+    final blocks = <Block>[];
+    for (final item in data) {
+      blocks.add(Block(firstIndex + blocks.length, timestamp, item, blocks.isEmpty ? previousHash : blocks.last.hash));
+    }
+    return blocks;
+  }
+}
+
+/// Tek yapraklı veya düğüm özetleri 32 baytlık SHA-256 değerleridir. Yaprak
+/// ve iç düğümler farklı öneklerle özetlenir; tek sayıda düğüm kalan
+/// seviyelerde son düğüm kopyalanmadan bir üst seviyeye taşınır.
+class MerkleTree {
+  static const int _hashSize = 32;
+
+  /// levels[0] yapraklar, levels.last kök; her seviye ardışık 32 baytlık düğümler.
+  final List<Uint8List> levels;
+
+  MerkleTree._(this.levels);
+
+  static Uint8List leafHash(List<int> data) => Uint8List.fromList(sha256.convert([0, ...data]).bytes);
+
+  static Uint8List nodeHash(List<int> left, List<int> right) => Uint8List.fromList(sha256.convert([1, ...left, ...right]).bytes);
+
+  factory MerkleTree.fromLeaves(List<Uint8List> leaves) {
+    final levels = [Uint8List.fromList(leaves.expand((leaf) => leaf).toList())];
+    while (levels.last.length > _hashSize) {
+      final below = levels.last;
+      final count = below.length ~/ _hashSize;
+      final level = BytesBuilder(copy: false);
+      for (var i = 0; i < count; i += 2) {
+        final left = Uint8List.sublistView(below, i * _hashSize, (i + 1) * _hashSize);
+        level.add(i + 1 < count ? nodeHash(left, Uint8List.sublistView(below, (i + 1) * _hashSize, (i + 2) * _hashSize)) : left);
+      }
+      levels.add(level.takeBytes());
+    }
+    return MerkleTree._(levels);
+  }
+
+  factory MerkleTree.decode(Uint8List bytes) {
+    final view = ByteData.sublistView(bytes);
+    final levelCount = view.getUint32(0);
+    var offset = 4 + levelCount * 4;
+    final levels = <Uint8List>[];
+    for (var l = 0; l < levelCount; l++) {
+      final size = view.getUint32(4 + l * 4) * _hashSize;
+      levels.add(Uint8List.sublistView(bytes, offset, offset + size));
+      offset += size;
+    }
+    return MerkleTree._(levels);
+  }
+
+  Uint8List get root => levels.last;
+  int get leafCount => levels.first.length ~/ _hashSize;
+
+  /// Seviye sayısı, seviye başına düğüm sayısı ve ardından tüm düğümler.
+  Uint8List encode() {
+    final header = ByteData(4 + levels.length * 4)..setUint32(0, levels.length);
+    for (var l = 0; l < levels.length; l++) {
+      header.setUint32(4 + l * 4, levels[l].length ~/ _hashSize);
+    }
+    final out = BytesBuilder(copy: false)..add(header.buffer.asUint8List());
+    levels.forEach(out.add);
+    return out.takeBytes();
+  }
+
+  MerkleProof proof(int leaf) {
+    final steps = <MerkleStep>[];
+    var index = leaf;
+    for (var l = 0; l < levels.length - 1; l++) {
+      final count = levels[l].length ~/ _hashSize;
+      final sibling = index.isOdd ? index - 1 : index + 1;
+      if (sibling < count) {
+        steps.add(MerkleStep(Uint8List.fromList(Uint8List.sublistView(levels[l], sibling * _hashSize, (sibling + 1) * _hashSize)), index.isOdd));
+      }
+      index ~/= 2;
+    }
+    return MerkleProof(leaf, steps);
+  }
+}
+
+class MerkleStep {
+  final Uint8List sibling;
+  final bool siblingOnLeft;
+
+  MerkleStep(this.sibling, this.siblingOnLeft);
+}
+
+/// Bir yaprağın köke kadar olan kardeş özetleri; doğrulama O(log n).
+class MerkleProof {
+  final int leaf;
+  final List<MerkleStep> steps;
+
+  MerkleProof(this.leaf, this.steps);
+
+  bool verify(Uint8List leafHash, Uint8List root) {
+    var hash = leafHash;
+    for (final step in steps) {
+      hash = step.siblingOnLeft ? MerkleTree.nodeHash(step.sibling, hash) : MerkleTree.nodeHash(hash, step.sibling);
+    }
+    return _equalBytes(hash, root);
+  }
+
+  factory MerkleProof.fromJson(Map<String, dynamic> json) {
+    return MerkleProof(
+      json['leaf'],
+      [for (final step in json['steps']) MerkleStep(Uint8List.fromList(_hexDecode(step.substring(1))), step[0] == 'L')],
+    );
+  }
+
+  Map<String, dynamic> toJson() {
+    return {
+      'leaf': leaf,
+      'steps': [for (final step in steps) '${step.siblingOnLeft ? 'L' : 'R'}${_hexEncode(step.sibling)}'],
+    };
+  }
+}
+
+bool _equalBytes(List<int> a, List<int> b) {
+  if (a.length != b.length) return false;
+  for (var i = 0; i < a.length; i++) {
+    if (a[i] != b[i]) return false;
+  }
+  return true;
+}
+
+String _hexEncode(List<int> bytes) => bytes.map((b) => b.toRadixString(16).padLeft(2, '0')).join();
+
+List<int> _hexDecode(String hex) => [for (var i = 0; i < hex.length; i += 2) int.parse(hex.substring(i, i + 2), radix: 16)];
+
+/// Sohbet mesajlarını gruplar halinde zincire bağlar.
+///
+/// Açıkken ([enabled]) depoya eklenen mesajların yaprak özetleri toplanır;
+/// [batchSize]'a ulaşıldığında veya [maxDelay] dolduğunda grup tek bir blok
+/// olarak eklenir ve blok yalnızca Merkle kökünü taşır. Ağaç
+/// `anchors/<blok>.tree` dosyasına, mesaj → (blok, yaprak) eşlemesi
+/// `anchors/index.log`'a yazılır; tek bir mesaj için kanıt buradan üretilir.
+class MessageAnchor {
+  static final MessageAnchor instance = MessageAnchor();
+
+  final int batchSize;
+  final Duration maxDelay;
+  bool enabled = false;
+  final List<String> _pendingIds = [];
+  final List<Uint8List> _pendingLeaves = [];
+  Map<String, List<int>>? _locations;
+  Timer? _timer;
+  Future<void> _lock = Future.value();
+
+  MessageAnchor({this.batchSize = 1024, this.maxDelay = const Duration(seconds: 30)});
+
+  /// Şifreli mesajlarda yaprak değişmeyen şifreli metinden üretilir; mesaj
+  /// sonradan açılsa da kanıt geçerli kalır ve zincire açık metin girmez.
+  static Uint8List leafOf(ChatMessage message) => MerkleTree.leafHash(utf8.encode(jsonEncode({
+        'id': message.id,
+        'sender': message.sender,
+        if (message.sealed != null) ...{'sealed': message.sealed, 'keyId': message.keyId} else 'text': message.text,
+        'timestamp': message.timestamp,
+      })));
+
+  void addAll(List<ChatMessage> messages) {
+    if (!enabled) return;
+    for (final message in messages) {
+      _pendingIds.add(message.id);
+      _pendingLeaves.add(leafOf(message));
+    }
+    if (_pendingIds.length >= batchSize) {
+      commit();
+    } else {
+      _timer ??= Timer(maxDelay, commit);
+    }
+  }
+
+  /// Bekleyen grubu tek blok olarak ekler.
+  Future<Block?> commit() {
+    _timer?.cancel();
+    _timer = null;
+    if (_pendingIds.isEmpty) return Future.value();
+    final ids = List<String>.of(_pendingIds);
+    final leaves = List<Uint8List>.of(_pendingLeaves);
+    _pendingIds.clear();
+    _pendingLeaves.clear();
+    final result = _lock.then((_) => _commit(ids, leaves));
+    _lock = result.then((_) {}, onError: (_) {});
+    return result;
+  }
+
+  Future<Block> _commit(List<String> ids, List<Uint8List> leaves) async {
+    final tree = MerkleTree.fromLeaves(leaves);
+    final store = await ChainStore.shared();
+    final block = await store.append(jsonEncode({'type': 'merkle', 'root': _hexEncode(tree.root), 'count': ids.length}));
+    final dir = await AppStorage.dir('anchors');
+    await File('${dir.path}/${block.index}.tree').writeAsBytes(tree.encode());
+    final lines = StringBuffer();
+    for (var i = 0; i < ids.length; i++) {
+      lines.writeln(jsonEncode([ids[i], block.index, i]));
+      _locations?[ids[i]] = [block.index, i];
+    }
+    await File('${dir.path}/index.log').writeAsString(lines.toString(), mode: FileMode.append);
+    return block;
+  }
+
+  Future<Map<String, List<int>>> _loadLocations() async {
+    final file = File('${(await AppStorage.dir('anchors')).path}/index.log');
+    final locations = <String, List<int>>{};
+    if (await file.exists()) {
+      await for (final line in file.openRead().transform(utf8.decoder).transform(const LineSplitter())) {
+        final entry = jsonDecode(line);
+        locations[entry[0]] = [entry[1], entry[2]];
+      }
+    }
+    return locations;
+  }
+
+  /// Mesajın bağlandığı blok ve kapsama kanıtı; henüz bağlanmadıysa null.
+  Future<MapEntry<Block, MerkleProof>?> proofFor(String messageId) async {
+    await _lock;
+    final location = (_locations ??= await _loadLocations())[messageId];
+    if (location == null) return null;
+    final store = await ChainStore.shared();
+    final tree = MerkleTree.decode(await File('${(await AppStorage.dir('anchors')).path}/${location[0]}.tree').readAsBytes());
+    return MapEntry(await store.blockAt(location[0]), tree.proof(location[1]));
+  }
+
+  /// Mesajın, bloktaki Merkle köküne bağlı olduğunu O(log n) adımda doğrular.
+  static bool verify(ChatMessage message, Block block, MerkleProof proof) {
+    final data = jsonDecode(block.data);
+    return data['type'] == 'merkle' && proof.verify(leafOf(message), Uint8List.fromList(_hexDecode(data['root'])));
+  }
+}
+
+class BlockchainScreen extends StatefulWidget {
+  @override
+  _BlockchainScreenState createState() => _BlockchainScreenState();
+}
+
+class _BlockchainScreenState extends State<BlockchainScreen> {
+  static const int _page = 50;
+
+  ChainStore? _store;
+  final Map<int, Block> _cache = {};
+  final Set<int> _loadingPages = {};
+  String _status = '';
+
+  @override
+  void initState() {
+    super.initState();
+    _open();
+  }
+
+  Future<void> _open() async {
+    final store = await ChainStore.shared();
+    if (!mounted) return;
+    setState(() => _store = store);
+    final result = await store.verify();
+    if (!mounted) return;
+    setState(() => _status = result.valid ? 'Zincir doğrulandı (${result.verified} blok)' : 'Blok ${result.firstInvalid} geçersiz!');
+  }
+
+  void _addBlock() async {
+    final store = _store;
+    if (store == null) return;
+    final newBlock = await store.append('İşlem verisi ${store.length + 1}');
+    setState(() => _cache[newBlock.index] = newBlock);
+  }
+
+  Block? _blockAt(int index) {
+    final block = _cache[index];
+    if (block != null) return block;
+    final page = index ~/ _page;
+    if (_loadingPages.add(page)) {
+      _store!.range(page * _page, (page + 1) * _page).then((blocks) {
+        _loadingPages.remove(page);
+        if (_cache.length > 1000) _cache.clear();
+        for (final block in blocks) {
+          _cache[block.index] = block;
+        }
+        if (mounted) setState(() {});
+      });
+    }
+    return null;
+  }
+
+  @override
+  Widget build(BuildContext context) {
+    return Scaffold(
+      appBar: AppBar(title: Text('Gerçekçi Blokzincir')),
+      body: Column(
+        children: [
+          ElevatedButton(onPressed: _addBlock, child: Text("Yeni Blok Ekle")),
+          SwitchListTile(
+            title: Text('Mesajları zincire bağla'),
+            value: MessageAnchor.instance.enabled,
+            onChanged: (val) => setState(() => MessageAnchor.instance.enabled = val),
+          ),
+          if (_status.isNotEmpty) Text(_status),
+          Expanded(
+            child: ListView.builder(
+              itemCount: _store?.length ?? 0,
+              itemBuilder: (context, index) {
+                final block = _blockAt(index);
+                if (block == null) return ListTile(title: Text('Blok $index'));
+                return ListTile(
+                  title: Text('Blok ${block.index}'),
+                  subtitle: Text('Hash: ${block.hash.substring(0, 20)}...'),
+                  trailing: Text(block.timestamp.split('.').first),
+                );
+              },
+            ),
+          ),
+        ],
+      ),
+    );
+  }
+}
+
+/// 8) Özet
+class SummaryScreen extends StatelessWidget {
+  @override
+  Widget build(BuildContext context) => Scaffold(
+        appBar: AppBar(title: Text('Akıllı Özet')),
+        body: Center(child: Text('Mesajları AI ile otomatik özetleme buraya')),
+      );
+}
+
+class GroupListPage extends StatefulWidget {
+  final String userId;
+
+  const GroupListPage({required this.userId});
+
+  @override
+  State<GroupListPage> createState() => _GroupListPageState();
+}
+
+class _GroupListPageState extends State<GroupListPage> {
+  final GroupRepository _groups = GroupRepository.instance;
+
+  @override
+  void initState() {
+    super.initState();
+    // Liste önbellekten hemen çizilir, eşitleme arkadan gelir
+    _groups.addListener(_onGroupsChanged);
+    _groups.sync();
+  }
+
+  void _onGroupsChanged() {
+    if (mounted) setState(() {});
+  }
+
+  @override
+  void dispose() {
+    _groups.removeListener(_onGroupsChanged);
+    super.dispose();
+  }
+
+  @override
+  Widget build(BuildContext context) {
+    final groups = _groups.groups;
+    return Scaffold(
+      appBar: AppBar(title: Text("Gruplar")),
+      body: groups.isEmpty
+          ? Center(child: Text("Henüz grup yok"))
+          : ListView.builder(
+              itemCount: groups.length,
+              itemBuilder: (context, index) {
+                final group = groups[index];
+                return ListTile(
+                  key: ValueKey(group.id),
+                  title: Text(group.name),
+                  subtitle: Text(group.description),
+                  trailing: group.isPrivate ? Icon(Icons.lock) : Icon(Icons.lock_open),
+                  onTap: () => Navigator.push(
+                    context,
+                    MaterialPageRoute(
+                      builder: (_) => GroupDetailPage(groupId: group.id, groupName: group.name, userId: widget.userId),
+                    ),
+                  ),
+                );
+              },
+            ),
+      floatingActionButton: FloatingActionButton(
+        onPressed: () => Navigator.push(
+          context,
+          MaterialPageRoute(builder: (_) => GroupCreatePage(userId: widget.userId)),
+        ),
+        child: Icon(Icons.add),
+      ),
+    );
+  }
+}
+
+class MediaPickerScreen extends StatefulWidget {
+  @override
+  _MediaPickerScreenState createState() => _MediaPickerScreenState();
+}
+
+class _MediaPickerScreenState extends State<MediaPickerScreen> {
+  final ImagePicker _picker = ImagePicker();
+  XFile? _image;
+
+
+  // Fotoğraf seçme fonksiyonu
+  Future<void> _pickImage() async {
+    final XFile? pickedFile = await _picker.pickImage(source: ImageSource.gallery);
+    if (pickedFile != null) {
+      setState(() {
+        _image = pickedFile;
+      });
+    }
+  }
+
+
+  @override
+  Widget build(BuildContext context) {
+    return Scaffold(
+      appBar: AppBar(title: Text('Medya Paylaş')),
+      body: Center(
+        child: Column(
+          mainAxisAlignment: MainAxisAlignment.center,
+          children: [
+            _image != null ? Image.file(File(_image!.path)) : Text('Henüz bir medya seçilmedi.'),
+            ElevatedButton(
+              onPressed: _pickImage,
+              child: Text('Medya Seç'),
+            ),
+          ],
+        ),
+      ),
+    );
+  }
+}
+
+/// Uygulama içi kalıcı dosyalar için dizin yardımcısı
+class AppStorage {
+  static final Map<String, Future<Directory>> _dirs = {};
+
+  static Future<Directory> dir(String name) => _dirs.putIfAbsent(name, () async {
+        final root = await getApplicationDocumentsDirectory();
+        return Directory('${root.path}/mopple/$name').create(recursive: true);
+      });
+}
+
+/// Bir akışı sabit boyutlu parçalara böler; bellekte en fazla bir parça tutulur.
+Stream<Uint8List> fixedSizeChunks(Stream<List<int>> source, int size) async* {
+  final buffer = Uint8List(size);
+  var filled = 0;
+  await for (final data in source) {
+    var offset = 0;
+    while (offset < data.length) {
+      final n = min(size - filled, data.length - offset);
+      buffer.setRange(filled, filled + n, data, offset);
+      filled += n;
+      offset += n;
+      if (filled == size) {
+        yield Uint8List.fromList(buffer);
+        filled = 0;
+      }
+    }
+  }
+  if (filled > 0) yield buffer.sublist(0, filled);
+}
+
+/// Socket.io ack'ini Future olarak bekler.
+Future<dynamic> emitAck(IO.Socket socket, String event, dynamic data, {bool binary = false, Duration timeout = const Duration(seconds: 15)}) {
+  final completer = Completer<dynamic>();
+  socket.emitWithAck(event, data, binary: binary, ack: (res) {
+    if (!completer.isCompleted) completer.complete(res);
+  });
+  return completer.future.timeout(timeout);
+}
+
+/// Socket'ten gelen ikili veriyi Uint8List'e çevirir.
+Uint8List toBytes(dynamic data) {
+  if (data is Uint8List) return data;
+  if (data is ByteBuffer) return data.asUint8List();
+  return Uint8List.fromList(List<int>.from(data));
+}
+
+/// Sıkıştırılmış ikili kayıtlar için yazıcı: LEB128 tamsayılar, 8 baytlık
+/// zaman damgaları ve uzunluk önekli UTF-8 dizgiler.
+class ByteWriter {
+  final BytesBuilder _out = BytesBuilder();
+  final ByteData _scratch = ByteData(8);
+
+  int get length => _out.length;
+
+  void uint8(int value) => _out.addByte(value);
+
+  /// Negatif olmayan tamsayı; küçük değerler tek bayt tutar.
+  void varint(int value) {
+    while (value >= 0x80) {
+      _out.addByte((value & 0x7f) | 0x80);
+      value >>= 7;
+    }
+    _out.addByte(value);
+  }
+
+  /// İşaretli tamsayı (zigzag); küçük farklar tek bayt tutar.
+  void svarint(int value) => varint((value << 1) ^ (value >> 63));
+
+  void int64(int value) {
+    _scratch.setInt64(0, value);
+    _out.add(_scratch.buffer.asUint8List());
+  }
+
+  void bytes(List<int> value) {
+    varint(value.length);
+    _out.add(value);
+  }
+
+  void string(String value) => bytes(utf8.encode(value));
+
+  Uint8List takeBytes() => _out.takeBytes();
+}
+
+/// [ByteWriter] çıktısını okur; kayıt yarım kalmışsa RangeError fırlatır.
+class ByteReader {
+  final Uint8List _bytes;
+  final ByteData _view;
+  int offset;
+
+  ByteReader(this._bytes, [this.offset = 0]) : _view = ByteData.sublistView(_bytes);
+
+  bool get isAtEnd => offset >= _bytes.length;
+
+  int uint8() => _bytes[offset++];
+
+  int varint() {
+    var result = 0;
+    var shift = 0;
+    while (true) {
+      final b = _bytes[offset++];
+      result |= (b & 0x7f) << shift;
+      if (b < 0x80) return result;
+      shift += 7;
+    }
+  }
+
+  int svarint() {
+    final value = varint();
+    return (value >>> 1) ^ -(value & 1);
+  }
+
+  int int64() {
+    final value = _view.getInt64(offset);
+    offset += 8;
+    return value;
+  }
+
+  Uint8List bytes() {
+    final length = varint();
+    if (offset + length > _bytes.length) throw RangeError('Kayıt beklenenden kısa');
+    final value = Uint8List.sublistView(_bytes, offset, offset + length);
+    offset += length;
+    return value;
+  }
+
+  String string() => utf8.decode(bytes());
+}
+
+enum MessageKind { text, media, receipt, system, sealed }
+
+/// Tipli ikili mesaj zarfı.
+///
+/// Başlık: sürüm, tür, içerik tipi (1'er bayt), zaman damgası (8 bayt), ardından
+/// uzunluk önekli id, grup ve gönderen. Yük ayrı bir ikili ek olarak gider;
+/// base64'e çevrilmez ve alıcı türü metni taramadan başlıktan okur.
+class MessageEnvelope {
+  static const int version = 1;
+  static const List<String> contentTypes = [
+    'text/plain',
+    'image/jpeg',
+    'image/png',
+    'video/mp4',
+    'application/octet-stream',
+  ];
+
+  final String id;
+  final MessageKind kind;
+  final String groupId;
+  final String sender;
+  final int timestamp;
+  final String contentType;
+  final Uint8List payload;
+
+  MessageEnvelope({
+    String? id,
+    required this.kind,
+    required this.groupId,
+    required this.sender,
+    int? timestamp,
+    this.contentType = 'text/plain',
+    required this.payload,
+  })  : id = id ?? const Uuid().v4(),
+        timestamp = timestamp ?? DateTime.now().millisecondsSinceEpoch;
+
+  factory MessageEnvelope.text(String groupId, String sender, String text) =>
+      MessageEnvelope(kind: MessageKind.text, groupId: groupId, sender: sender, payload: Uint8List.fromList(utf8.encode(text)));
+
+  /// Uçtan uca şifreli metin. Yük: anahtar id uzunluğu (1 bayt), anahtar id,
+  /// ardından `IV || şifreli metin || etiket`.
+  factory MessageEnvelope.sealed(String groupId, ChatMessage message) {
+    final keyId = utf8.encode(message.keyId!);
+    if (keyId.length > 255) throw ArgumentError('Anahtar id 255 baytı aşamaz');
+    final sealed = base64Decode(message.sealed!);
+    return MessageEnvelope(
+      id: message.id,
+      kind: MessageKind.sealed,
+      groupId: groupId,
+      sender: message.sender,
+      timestamp: message.timestamp,
+      contentType: 'application/octet-stream',
+      payload: Uint8List(1 + keyId.length + sealed.length)
+        ..[0] = keyId.length
+        ..setAll(1, keyId)
+        ..setAll(1 + keyId.length, sealed),
+    );
+  }
+
+  String get text => utf8.decode(payload);
+  String get keyId => utf8.decode(Uint8List.sublistView(payload, 1, 1 + payload[0]));
+  Uint8List get sealedBytes => Uint8List.sublistView(payload, 1 + payload[0]);
+  bool get isImage => contentType.startsWith('image/');
+  bool get isVideo => contentType.startsWith('video/');
+
+  Uint8List encodeHeader() {
+    final id = utf8.encode(this.id);
+    final group = utf8.encode(groupId);
+    final from = utf8.encode(sender);
+    final header = ByteData(11 + 3 + id.length + group.length + from.length);
+    var offset = 0;
+    header.setUint8(offset++, version);
+    header.setUint8(offset++, kind.index);
+    final type = contentTypes.indexOf(contentType);
+    header.setUint8(offset++, type < 0 ? contentTypes.length - 1 : type);
+    header.setInt64(offset, timestamp);
+    offset += 8;
+    for (final field in [id, group, from]) {
+      if (field.length > 255) throw ArgumentError('Zarf alanı 255 baytı aşamaz');
+      header.setUint8(offset++, field.length);
+      for (final b in field) {
+        header.setUint8(offset++, b);
+      }
+    }
+    return header.buffer.asUint8List();
+  }
+
+  /// socket.io'ya iki ikili ek olarak gönderilecek [başlık, yük].
+  List<Uint8List> encode() => [encodeHeader(), payload];
+
+  /// `envelope` olayı için çözücü dinleyici; bozuk zarflar atlanır.
+  static dynamic Function(dynamic) handler(void Function(MessageEnvelope envelope) onEnvelope) => (data) {
+        try {
+          onEnvelope(MessageEnvelope.decode(data));
+        } on FormatException catch (e) {
+          print("Geçersiz zarf: $e");
+        }
+      };
+
+  /// Bozuk veya kısa başlıklar, bilinmeyen tür/içerik indeksleri ve eksik
+  /// ekler için [FormatException] fırlatır.
+  factory MessageEnvelope.decode(dynamic frame) {
+    if (frame is! List || frame.length < 2) throw FormatException('Zarf iki ikili ek içermeli');
+    final header = toBytes(frame[0]);
+    if (header.length < 11) throw FormatException('Zarf başlığı kısa: ${header.length} bayt');
+    final view = ByteData.sublistView(header);
+    if (view.getUint8(0) != version) {
+      throw FormatException('Desteklenmeyen zarf sürümü: ${view.getUint8(0)}');
+    }
+    final kind = view.getUint8(1);
+    if (kind >= MessageKind.values.length) throw FormatException('Bilinmeyen zarf türü: $kind');
+    final type = view.getUint8(2);
+    if (type >= contentTypes.length) throw FormatException('Bilinmeyen içerik tipi: $type');
+    var offset = 11;
+    String field() {
+      if (offset >= header.length) throw FormatException('Zarf başlığı yarım kalmış');
+      final length = view.getUint8(offset++);
+      if (offset + length > header.length) throw FormatException('Zarf alanı başlığı aşıyor');
+      final value = utf8.decode(Uint8List.sublistView(header, offset, offset + length));
+      offset += length;
+      return value;
+    }
+
+    final id = field();
+    final groupId = field();
+    final sender = field();
+    final payload = toBytes(frame[1]);
+    if (MessageKind.values[kind] == MessageKind.sealed && (payload.isEmpty || 1 + payload[0] > payload.length)) {
+      throw FormatException('Şifreli zarf yükü yarım kalmış');
+    }
+    return MessageEnvelope(
+      id: id,
+      kind: MessageKind.values[kind],
+      groupId: groupId,
+      sender: sender,
+      timestamp: view.getInt64(3),
+      contentType: contentTypes[type],
+      payload: payload,
+    );
+  }
+}
+
+/// Zarfları socket.io ikili ekleri olarak taşır.
+extension EnvelopeSocket on IO.Socket {
+  void sendEnvelope(MessageEnvelope envelope) => emitWithBinary('envelope', envelope.encode());
+}
+
+/// Tüm sohbet ve grupların paylaştığı tek, uzun ömürlü socket bağlantısı.
+///
+/// Ekranlar socket açmak yerine bir kanala abone olur. Oda aboneliği referans
+/// sayımlıdır: ilk abone `subscribe`, son abone ayrılınca `unsubscribe`
+/// gönderilir. Bağlantı koptuğunda socket.io üstel geri çekilmeyle yeniden
+/// bağlanır ve açık odalara tekrar katılınır.
+class ConnectionManager {
+  static final ConnectionManager instance = ConnectionManager._();
+
+  String endpoint = 'http://10.0.2.2:3000';
+  Duration reconnectDelay = Duration(milliseconds: 500);
+  Duration reconnectDelayMax = Duration(seconds: 30);
+  final Map<String, int> _rooms = {};
+  final Map<String, Map<String, dynamic>> _joins = {};
+  IO.Socket? _socket;
+
+  ConnectionManager._();
+
+  /// Bağlantı kurulmadan önce (ör. `main` içinde) çağrılmalıdır.
+  void configure({String? endpoint, Duration? reconnectDelay, Duration? reconnectDelayMax}) {
+    if (_socket != null) throw StateError('Bağlantı zaten kuruldu');
+    this.endpoint = endpoint ?? this.endpoint;
+    this.reconnectDelay = reconnectDelay ?? this.reconnectDelay;
+    this.reconnectDelayMax = reconnectDelayMax ?? this.reconnectDelayMax;
+  }
+
+  IO.Socket get socket => _socket ??= _connect();
+
+  IO.Socket _connect() {
+    final socket = IO.io(endpoint, {
+      'transports': ['websocket'],
+      'autoConnect': true,
+      'forceNew': true,
+      'reconnection': true,
+      'reconnectionDelay': reconnectDelay.inMilliseconds,
+      'reconnectionDelayMax': reconnectDelayMax.inMilliseconds,
+      'randomizationFactor': 0.5,
+    });
+    socket.onConnect((_) {
+      print('🔗 Bağlandı');
+      for (final room in _rooms.keys) {
+        socket.emit('subscribe', _joins[room]);
+      }
+    });
+    return socket;
+  }
+
+  ChannelSubscription subscribe(String room, {Map<String, dynamic> params = const {}}) {
+    final count = _rooms[room] ?? 0;
+    _rooms[room] = count + 1;
+    if (count == 0) {
+      _joins[room] = {'room': room, ...params};
+      if (socket.connected) socket.emit('subscribe', _joins[room]);
+    }
+    return ChannelSubscription._(this, room);
+  }
+
+  void _release(String room) {
+    final count = (_rooms[room] ?? 1) - 1;
+    if (count > 0) {
+      _rooms[room] = count;
+      return;
+    }
+    _rooms.remove(room);
+    _joins.remove(room);
+    _socket?.emit('unsubscribe', {'room': room});
+  }
+}
+
+/// Bir ekranın bir odaya aboneliği. Kaydedilen dinleyiciler [cancel] ile
+/// paylaşılan socket'ten kaldırılır.
+class ChannelSubscription {
+  final ConnectionManager _manager;
+  final String room;
+  final List<MapEntry<String, dynamic Function(dynamic)>> _handlers = [];
+  bool _cancelled = false;
+
+  ChannelSubscription._(this._manager, this.room);
+
+  IO.Socket get socket => _manager.socket;
+  bool get connected => socket.connected;
+  bool get cancelled => _cancelled;
+
+  void on(String event, dynamic Function(dynamic) handler) {
+    _handlers.add(MapEntry(event, handler));
+    socket.on(event, handler);
+  }
+
+  void onConnect(dynamic Function(dynamic) handler) => on('connect', handler);
+
+  void emit(String event, dynamic data) => socket.emit(event, data);
+
+  void sendEnvelope(MessageEnvelope envelope) => socket.sendEnvelope(envelope);
+
+  void onEnvelope(void Function(MessageEnvelope envelope) handler) => on('envelope', MessageEnvelope.handler(handler));
+
+  void cancel() {
+    if (_cancelled) return;
+    _cancelled = true;
+    for (final entry in _handlers) {
+      socket.off(entry.key, entry.value);
+    }
+    _handlers.clear();
+    _manager._release(room);
+  }
+}
+
+enum MessageStatus { pending, sent, failed }
+
+/// Gönderilmeyi bekleyen mesajlar için kalıcı giden kutusu.
+///
+/// Her mesaj istemci kimliğiyle diske yazılır; bağlantı varken [batchSize]'lık
+/// gruplar halinde tek `sendMessages` emit'iyle gönderilir ve sunucunun ack'inde
+/// dönen kimlikler gönderildi sayılır. Sunucu kimliğe göre tekilleştirdiği için
+/// yeniden deneme güvenlidir. [maxAttempts] denemeden sonra mesaj başarısız
+/// olarak işaretlenir ve [retry] ile tekrar kuyruğa alınabilir.
+class Outbox extends ChangeNotifier {
+  static final Outbox instance = Outbox(ConnectionManager.instance);
+
+  final ConnectionManager connection;
+  final int batchSize;
+  final int maxAttempts;
+  final List<Map<String, dynamic>> _queue = [];
+  /// Kuyruktaki id'ler; satır başına durum sorgusu O(1).
+  final Set<String> _pending = {};
+  final Map<String, Map<String, dynamic>> _failed = {};
+  late final Future<void> _ready;
+  Future<void> _saving = Future.value();
+  bool _saveQueued = false;
+  Timer? _flushTimer;
+  bool _flushing = false;
+  int _backoff = 0;
+
+  Outbox(this.connection, {this.batchSize = 50, this.maxAttempts = 5}) {
+    _ready = _load();
+    connection.socket.on('connect', (_) => _onConnect());
+  }
+
+  /// Bağlantı döndüğünde bekleyen geri çekilme beklenmez; sıra hemen gönderilir.
+  void _onConnect() {
+    _flushTimer?.cancel();
+    _backoff = 0;
+    _scheduleFlush(Duration.zero);
+  }
+
+  Future<File> get _file async => File('${(await AppStorage.dir('outbox')).path}/outbox.json');
+
+  Future<void> _load() async {
+    final file = await _file;
+    if (!await file.exists()) return;
+    try {
+      final saved = jsonDecode(await file.readAsString());
+      for (final entry in List<Map<String, dynamic>>.from(saved['queue'])) {
+        _queue.add(entry);
+        _pending.add(entry['id']);
+      }
+      for (final entry in List<Map<String, dynamic>>.from(saved['failed'])) {
+        _failed[entry['id']] = entry;
+      }
+    } catch (e) {
+      // Bozuk dosya kuyruğu kilitlememeli; boş kuyrukla devam edilir
+      print("Giden kutusu okunamadı: $e");
+      _queue.clear();
+      _pending.clear();
+      _failed.clear();
+    }
+    notifyListeners();
+    _scheduleFlush(Duration.zero);
+  }
+
+  /// Kayıtlar sırayla yazılır; bekleyen bir kayıt varsa yeni istek ona katılır
+  /// ve yazıldığı andaki son durumu kaydeder. Dosya önce `.tmp`'ye yazılıp
+  /// yeniden adlandırılır, yarım kalan yazma eski dosyayı bozmaz.
+  Future<void> _save() {
+    if (_saveQueued) return _saving;
+    _saveQueued = true;
+    return _saving = _saving.then((_) async {
+      _saveQueued = false;
+      final file = await _file;
+      final tmp = File('${file.path}.tmp');
+      await tmp.writeAsString(jsonEncode({'queue': _queue, 'failed': _failed.values.toList()}), flush: true);
+      await tmp.rename(file.path);
+    }).catchError((e) {
+      print("Giden kutusu yazılamadı: $e");
+    });
+  }
+
+  MessageStatus statusOf(String id) {
+    if (_failed.containsKey(id)) return MessageStatus.failed;
+    if (_pending.contains(id)) return MessageStatus.pending;
+    return MessageStatus.sent;
+  }
+
+  /// Mesajı kuyruğa ekler; [message] içinde benzersiz bir 'id' bulunmalıdır.
+  Future<void> enqueue(String room, Map<String, dynamic> message) async {
+    await _ready;
+    _queue.add({'id': message['id'], 'room': room, 'message': message, 'attempts': 0});
+    _pending.add(message['id']);
+    notifyListeners();
+    await _save();
+    // Art arda gönderilen mesajlar aynı gruba girsin diye kısa bir bekleme
+    _scheduleFlush(Duration(milliseconds: 50));
+  }
+
+  Future<void> retry(String id) async {
+    final entry = _failed.remove(id);
+    if (entry == null) return;
+    _queue.add({...entry, 'attempts': 0});
+    _pending.add(id);
+    notifyListeners();
+    await _save();
+    _scheduleFlush(Duration.zero);
+  }
+
+  void _scheduleFlush(Duration delay) {
+    if (_flushTimer?.isActive ?? false) return;
+    _flushTimer = Timer(delay, flush);
+  }
+
+  Future<void> flush() async {
+    await _ready;
+    if (_flushing || _queue.isEmpty || !connection.socket.connected) return;
+    _flushing = true;
+    try {
+      while (_queue.isNotEmpty && connection.socket.connected) {
+        final batch = _queue.take(batchSize).toList();
+        Set<String> acked;
+        try {
+          final res = await emitAck(connection.socket, 'sendMessages', {
+            'messages': batch.map((entry) => {'room': entry['room'], ...entry['message']}).toList(),
+          });
+          acked = Set<String>.from(res is Map ? res['ok'] ?? const [] : const []);
+        } on TimeoutException {
+          acked = {};
+        }
+        for (final entry in batch) {
+          if (acked.contains(entry['id'])) {
+            _queue.remove(entry);
+            _pending.remove(entry['id']);
+          } else if (++entry['attempts'] >= maxAttempts) {
+            _queue.remove(entry);
+            _pending.remove(entry['id']);
+            _failed[entry['id']] = entry;
+          }
+        }
+        notifyListeners();
+        await _save();
+        if (acked.length < batch.length) {
+          // Kısmi başarısızlıkta üstel bekleme ile yeniden dene
+          _backoff = min(_backoff + 1, 6);
+          _flushTimer = Timer(Duration(seconds: 1 << _backoff), flush);
+          return;
+        }
+        _backoff = 0;
+      }
+    } finally {
+      _flushing = false;
+    }
+  }
+}
+
+/// Medya dosyasını sıra numaralı, sağlama toplamlı parçalar halinde gönderir.
+///
+/// Dosya hiçbir zaman tamamen belleğe alınmaz; aynı anda en fazla [window]
+/// parça yolda olur. Bağlantı koparsa [upload] kaldığı parçadan devam eder.
+class MediaUploader {
+  static const int defaultChunkSize = 64 * 1024;
+
+  final IO.Socket socket;
+  final String path;
+  final String groupId;
+  final String sender;
+  final String contentType;
+  final int chunkSize;
+  final int window;
+  final String transferId;
+
+  MediaUploader({
+    required this.socket,
+    required this.path,
+    required this.groupId,
+    required this.sender,
+    required this.contentType,
+    this.chunkSize = defaultChunkSize,
+    this.window = 4,
+    String? transferId,
+  }) : transferId = transferId ?? const Uuid().v4();
+
+  Future<void> upload({int maxAttempts = 5, void Function(int sent, int total)? onProgress}) async {
+    final file = File(path);
+    final size = await file.length();
+    final digest = await MediaWorkerPool.instance.fileDigest(path);
+    final begin = {
+      'id': transferId,
+      'groupId': groupId,
+      'sender': sender,
+      'contentType': contentType,
+      'size': size,
+      'chunkSize': chunkSize,
+      'digest': digest,
+    };
+
+    for (var attempt = 1;; attempt++) {
+      try {
+        await _waitConnected();
+        // Sunucu daha önce aldığı parçaları bildirir, oradan devam edilir.
+        final res = await emitAck(socket, 'mediaBegin', begin);
+        final from = res is Map ? (res['next'] as int? ?? 0) : 0;
+        await _sendFrom(file, from, size, onProgress);
+        await emitAck(socket, 'mediaEnd', {'id': transferId, 'groupId': groupId, 'sender': sender});
+        return;
+      } on TimeoutException {
+        if (attempt >= maxAttempts) rethrow;
+        await Future.delayed(Duration(seconds: attempt));
+      }
+    }
+  }
+
+  Future<void> _sendFrom(File file, int from, int size, void Function(int, int)? onProgress) async {
+    final inFlight = <Future<dynamic>>[];
+    var seq = from;
+    try {
+      await for (final chunk in fixedSizeChunks(file.openRead(from * chunkSize), chunkSize)) {
+        final sum = await MediaWorkerPool.instance.digest(chunk);
+        inFlight.add(emitAck(socket, 'mediaChunk', {'id': transferId, 'seq': seq, 'sum': sum, 'bytes': chunk}, binary: true));
+        seq++;
+        if (inFlight.length >= window) await inFlight.removeAt(0);
+        onProgress?.call(min(seq * chunkSize, size), size);
+      }
+    } catch (_) {
+      // Yoldaki parçaların hataları da yakalanır; sonraki deneme kaldığı yerden sürer
+      await Future.wait(inFlight).catchError((_) => <dynamic>[]);
+      rethrow;
+    }
+    await Future.wait(inFlight);
+  }
+
+  Future<void> _waitConnected() async {
+    if (socket.connected) return;
+    final completer = Completer<void>();
+    socket.once('connect', (_) {
+      if (!completer.isCompleted) completer.complete();
+    });
+    socket.connect();
+    await completer.future;
+  }
+}
+
+/// Gelen medya parçalarını diskte yeniden birleştirir.
+///
+/// Alınan parçalar bir bit haritasıyla `<id>.json` dosyasında tutulur; uygulama
+/// yeniden açıldığında veya bağlantı koptuğunda eksik parçalardan devam edilir.
+class MediaChunkWriter {
+  final Directory dir;
+  final String transferId;
+  final int size;
+  final int chunkSize;
+  final String digest;
+  final String contentType;
+  final Uint8List _received;
+  int _receivedCount;
+  int _unsaved = 0;
+  RandomAccessFile? _raf;
+  Future<void> _lock = Future.value();
+
+  MediaChunkWriter._(this.dir, this.transferId, this.size, this.chunkSize, this.digest, this.contentType, this._received, this._receivedCount);
+
+  int get chunkCount => (size + chunkSize - 1) ~/ chunkSize;
+  bool get isComplete => _receivedCount == chunkCount;
+  File get _part => File('${dir.path}/$transferId.part');
+  File get _meta => File('${dir.path}/$transferId.json');
+  File get target => File('${dir.path}/$transferId');
+
+  static Future<MediaChunkWriter> open(Directory dir, Map<String, dynamic> begin) async {
+    final id = begin['id'] as String;
+    final size = begin['size'] as int;
+    final chunkSize = begin['chunkSize'] as int;
+    final count = (size + chunkSize - 1) ~/ chunkSize;
+    var received = Uint8List((count + 7) >> 3);
+    var receivedCount = 0;
+    final meta = File('${dir.path}/$id.json');
+    if (await meta.exists()) {
+      final saved = jsonDecode(await meta.readAsString());
+      received = base64Decode(saved['received']);
+      receivedCount = saved['count'];
+    }
+    return MediaChunkWriter._(dir, id, size, chunkSize, begin['digest'], begin['contentType'] ?? '', received, receivedCount);
+  }
+
+  bool has(int seq) => _received[seq >> 3] & (1 << (seq & 7)) != 0;
+
+  /// İlk eksik parçanın sıra numarası.
+  int get nextMissing {
+    for (var seq = 0; seq < chunkCount; seq++) {
+      if (!has(seq)) return seq;
+    }
+    return chunkCount;
+  }
+
+  /// Bekleyen tüm yazmalar bittiğinde tamamlanır.
+  Future<void> get idle => _lock;
+
+  /// Parçayı yerine yazar; sağlama toplamı tutmazsa false döner.
+  ///
+  /// Yazmalar sıraya alınır, çünkü aynı RandomAccessFile üzerinde eşzamanlı
+  /// işlem yapılamaz.
+  Future<bool> write(int seq, Uint8List bytes, String sum) {
+    final result = _lock.then((_) => _write(seq, bytes, sum));
+    _lock = result.then((_) {}, onError: (_) {});
+    return result;
+  }
+
+  Future<bool> _write(int seq, Uint8List bytes, String sum) async {
+    if (seq < 0 || seq >= chunkCount) return false;
+    if (has(seq)) return true;
+    if (await MediaWorkerPool.instance.digest(bytes) != sum) return false;
+    final raf = _raf ??= await _part.open(mode: FileMode.append);
+    await raf.setPosition(seq * chunkSize);
+    await raf.writeFrom(bytes);
+    _received[seq >> 3] |= 1 << (seq & 7);
+    _receivedCount++;
+    if (++_unsaved >= 16 || isComplete) await _saveMeta();
+    return true;
+  }
+
+  Future<void> _saveMeta() async {
+    _unsaved = 0;
+    await _raf?.flush();
+    await _meta.writeAsString(jsonEncode({'received': base64Encode(_received), 'count': _receivedCount}));
+  }
+
+  /// Tüm parçalar geldiyse dosyayı doğrular ve son adına taşır.
+  Future<File?> finish() async {
+    await idle;
+    if (!isComplete) return null;
+    await _raf?.close();
+    _raf = null;
+    final actual = await MediaWorkerPool.instance.fileDigest(_part.path);
+    if (actual != digest) {
+      // Bozuk dosya: baştan alınması için durumu sıfırla.
+      await _part.delete();
+      await _meta.delete();
+      _received.fillRange(0, _received.length, 0);
+      _receivedCount = 0;
+      return null;
+    }
+    await _meta.delete();
+    return _part.rename(target.path);
+  }
+
+  Future<void> close() async {
+    await idle;
+    if (_unsaved > 0) await _saveMeta();
+    await _raf?.close();
+    _raf = null;
+  }
+}
+
+/// Sohbet ve grup ekranlarında ortak kullanılan mesaj
+class ChatMessage {
+  final String id;
+  final String sender;
+  final String text;
+  final String? mediaPath;
+  final Uint8List? bytes;
+  final bool isVideo;
+  final int timestamp;
+  /// Şifreli metin (base64) ve oturum anahtarının id'si. Açılan mesajda da
+  /// korunur: depoya yalnızca bu yazılır, zincir yaprağı da bundan üretilir.
+  final String? sealed;
+  final String? keyId;
+  /// [text], [sealed]'dan bellekte çözüldü.
+  final bool decrypted;
+
+  ChatMessage({
+    required this.id,
+    required this.sender,
+    this.text = '',
+    this.mediaPath,
+    this.bytes,
+    this.isVideo = false,
+    int? timestamp,
+    this.sealed,
+    this.keyId,
+    this.decrypted = false,
+  }) : timestamp = timestamp ?? DateTime.now().millisecondsSinceEpoch;
+
+  factory ChatMessage.fromEnvelope(MessageEnvelope envelope) {
+    switch (envelope.kind) {
+      case MessageKind.text:
+        return ChatMessage(id: envelope.id, sender: envelope.sender, text: envelope.text, timestamp: envelope.timestamp);
+      case MessageKind.sealed:
+        return ChatMessage(
+          id: envelope.id,
+          sender: envelope.sender,
+          sealed: base64Encode(envelope.sealedBytes),
+          keyId: envelope.keyId,
+          timestamp: envelope.timestamp,
+        );
+      default:
+        return ChatMessage(id: envelope.id, sender: envelope.sender, bytes: envelope.payload, isVideo: envelope.isVideo, timestamp: envelope.timestamp);
+    }
+  }
+
+  factory ChatMessage.fromJson(Map<String, dynamic> json) {
+    return ChatMessage(
+      id: json['id'],
+      sender: json['sender'],
+      text: json['text'],
+      mediaPath: json['mediaPath'],
+      isVideo: json['isVideo'],
+      timestamp: json['timestamp'],
+      sealed: json['sealed'],
+      keyId: json['keyId'],
+    );
+  }
+
+  Map<String, dynamic> toJson() {
+    return {
+      'id': id,
+      'sender': sender,
+      // Açık metin yalnızca şifresiz mesajlarda diske yazılır
+      'text': sealed == null ? text : '',
+      'mediaPath': mediaPath,
+      'isVideo': isVideo,
+      'timestamp': timestamp,
+      if (sealed != null) 'sealed': sealed,
+      if (keyId != null) 'keyId': keyId,
+    };
+  }
+
+  bool get isImage => !isVideo && (mediaPath != null || bytes != null);
+  /// Şifreli ve henüz açılamadı.
+  bool get isSealed => sealed != null && !decrypted;
+  String get displayText => isSealed ? '🔒 Şifreli mesaj' : text;
+
+  ChatMessage opened(String text) =>
+      ChatMessage(id: id, sender: sender, text: text, timestamp: timestamp, sealed: sealed, keyId: keyId, decrypted: true);
+}
+
+void _mediaWorkerMain(List<SendPort> ports) {
+  final requests = ReceivePort();
+  ports[0].send(requests.sendPort);
+  requests.listen((message) async {
+    final id = message[0] as int;
+    try {
+      ports[1].send([id, await _runMediaTask(message[1] as String, message[2]), null]);
+    } catch (e) {
+      ports[1].send([id, null, '$e']);
+    }
+  });
+}
+
+Future<dynamic> _runMediaTask(String op, dynamic arg) async {
+  switch (op) {
+    case 'fileDigest':
+      return (await sha256.bind(File(arg as String).openRead()).first).toString();
+    case 'digest':
+      return sha256.convert((arg as TransferableTypedData).materialize().asUint8List()).toString();
+    case 'thumbnail':
+      final source = arg[0];
+      final bytes = source is String ? await File(source).readAsBytes() : (source as TransferableTypedData).materialize().asUint8List();
+      final image = img.decodeImage(bytes);
+      if (image == null) throw FormatException('Resim çözülemedi');
+      final side = arg[1] as int;
+      final thumb = image.width >= image.height
+          ? img.copyResize(image, width: min(side, image.width))
+          : img.copyResize(image, height: min(side, image.height));
+      return TransferableTypedData.fromList([img.encodeJpg(thumb, quality: 80)]);
+  }
+  throw ArgumentError('Bilinmeyen medya görevi: $op');
+}
+
+/// Medya özetleme, doğrulama ve küçük resim üretimini arka plan
+/// isolate'lerinde yapan küçük havuz. İşçiler ilk kullanımda başlatılır ve
+/// iş en az yüklü işçiye verilir.
+class MediaWorkerPool {
+  static final MediaWorkerPool instance = MediaWorkerPool(max(1, min(3, Platform.numberOfProcessors - 1)));
+
+  final int size;
+  final List<Future<SendPort>?> _workers;
+  final List<int> _load;
+  final Map<int, Completer<dynamic>> _pending = {};
+  final Map<int, int> _owner = {};
+  final ReceivePort _replies = ReceivePort();
+  int _nextId = 0;
+
+  MediaWorkerPool(this.size)
+      : _workers = List.filled(size, null),
+        _load = List.filled(size, 0) {
+    _replies.listen((message) {
+      final id = message[0] as int;
+      _load[_owner.remove(id)!]--;
+      final completer = _pending.remove(id)!;
+      if (message[2] != null) {
+        completer.completeError(Exception(message[2]));
+      } else {
+        completer.complete(message[1]);
+      }
+    });
+  }
+
+  Future<SendPort> _spawn() async {
+    final handshake = ReceivePort();
+    await Isolate.spawn(_mediaWorkerMain, [handshake.sendPort, _replies.sendPort]);
+    return await handshake.first as SendPort;
+  }
+
+  Future<dynamic> _run(String op, dynamic arg) async {
+    var worker = 0;
+    for (var i = 1; i < size; i++) {
+      if (_load[i] < _load[worker]) worker = i;
+    }
+    final id = _nextId++;
+    final completer = Completer<dynamic>();
+    _pending[id] = completer;
+    _owner[id] = worker;
+    _load[worker]++;
+    final port = await (_workers[worker] ??= _spawn());
+    port.send([id, op, arg]);
+    return completer.future;
+  }
+
+  /// Dosyanın SHA-256 özetini dosyayı akış halinde okuyarak hesaplar.
+  Future<String> fileDigest(String path) async => await _run('fileDigest', path) as String;
+
+  Future<String> digest(Uint8List bytes) async => await _run('digest', TransferableTypedData.fromList([bytes])) as String;
+
+  /// Uzun kenarı en fazla [maxSide] piksel olan JPEG küçük resim üretir.
+  Future<Uint8List> thumbnail({String? path, Uint8List? bytes, int maxSide = 320}) async {
+    final source = path ?? TransferableTypedData.fromList([bytes!]);
+    final result = await _run('thumbnail', [source, maxSide]) as TransferableTypedData;
+    return result.materialize().asUint8List();
+  }
+}
+
+/// Mesaj kimliğine göre çözülmüş küçük resimleri tutan LRU önbellek;
+/// kaydırma sırasında aynı resim iki kez çözülmez.
+class MediaCache {
+  static final MediaCache instance = MediaCache();
+
+  final int maxEntries;
+  final Map<String, ImageProvider> _ready = {};
+  final Map<String, Future<ImageProvider>> _loading = {};
+
+  MediaCache({this.maxEntries = 200});
+
+  ImageProvider? peek(String id) {
+    final image = _ready.remove(id);
+    if (image != null) _ready[id] = image;
+    return image;
+  }
+
+  Future<ImageProvider> thumbnail(ChatMessage message) {
+    final ready = peek(message.id);
+    if (ready != null) return Future.value(ready);
+    return _loading.putIfAbsent(message.id, () async {
+      try {
+        final bytes = await MediaWorkerPool.instance.thumbnail(path: message.mediaPath, bytes: message.bytes);
+        final image = MemoryImage(bytes);
+        _ready[message.id] = image;
+        if (_ready.length > maxEntries) _ready.remove(_ready.keys.first);
+        return image;
+      } finally {
+        _loading.remove(message.id);
+      }
+    });
+  }
+}
+
+class MediaThumbnail extends StatelessWidget {
+  final ChatMessage message;
+
+  const MediaThumbnail({Key? key, required this.message}) : super(key: key);
+
+  @override
+  Widget build(BuildContext context) {
+    final ready = MediaCache.instance.peek(message.id);
+    if (ready != null) return Image(image: ready);
+    return FutureBuilder<ImageProvider>(
+      future: MediaCache.instance.thumbnail(message),
+      builder: (_, snapshot) {
+        if (snapshot.hasData) return Image(image: snapshot.data!);
+        if (snapshot.hasError) return Icon(Icons.broken_image);
+        return SizedBox(height: 160, child: Center(child: CircularProgressIndicator()));
+      },
+    );
+  }
+}
+
+/// Konuşmanın bellekte tutulan ardışık bir dilimi.
+///
+/// Her mesajın kalıcı depodaki sıra numarası (seq) bilinir; id'den konuma
+/// erişim O(1)'dir ve aynı mesaj pencereye iki kez girmez.
+class MessageWindow {
+  final List<ChatMessage> _items = [];
+  final Map<String, int> _seqs = {};
+  int _start = 0;
+
+  int get start => _start;
+  int get end => _start + _items.length;
+  int get length => _items.length;
+  ChatMessage operator [](int index) => _items[index];
+  bool contains(String id) => _seqs.containsKey(id);
+
+  int? indexOf(String id) {
+    final seq = _seqs[id];
+    return seq == null ? null : seq - _start;
+  }
+
+  void append(ChatMessage message, int seq) {
+    if (_items.isEmpty) _start = seq;
+    _seqs[message.id] = seq;
+    _items.add(message);
+  }
+
+  void appendAll(List<ChatMessage> page, int firstSeq) {
+    for (var i = 0; i < page.length; i++) {
+      append(page[i], firstSeq + i);
+    }
+  }
+
+  void prepend(List<ChatMessage> page, int firstSeq) {
+    for (var i = 0; i < page.length; i++) {
+      _seqs[page[i].id] = firstSeq + i;
+    }
+    _items.insertAll(0, page);
+    _start = firstSeq;
+  }
+
+  void replace(ChatMessage message) {
+    final index = indexOf(message.id);
+    if (index != null) _items[index] = message;
+  }
+
+  void trimStart(int count) {
+    for (final message in _items.take(count)) {
+      _seqs.remove(message.id);
+    }
+    _items.removeRange(0, count);
+    _start += count;
+  }
+
+  void trimEnd(int count) {
+    for (final message in _items.skip(_items.length - count)) {
+      _seqs.remove(message.id);
+    }
+    _items.removeRange(_items.length - count, _items.length);
+  }
+}
+
+/// Bir konuşmanın mesaj deposu.
+///
+/// Mesajlar cihazda yalnızca sona eklenen bir JSON satır dosyasına (`.log`) ve
+/// her kaydın başlangıç konumunu tutan 8 baytlık bir dizine (`.idx`) yazılır.
+/// Bellekte en fazla [windowSize] mesajlık bir pencere tutulur; yukarı
+/// kaydırıldıkça eski sayfalar dizin üzerinden doğrudan okunur. Yeniden
+/// gönderilen ve sunucunun tekrar ilettiği mesajlar son [recentIds] mesajın
+/// kimliklerine karşı ayıklanır; pencere nerede olursa olsun günlüğe iki kez
+/// yazılmaz.
+class MessageRepository extends ChangeNotifier {
+  static const int pageSize = 100;
+  static const int windowSize = 400;
+  static const int recentIds = 5000;
+  static final Map<String, MessageRepository> _repositories = {};
+
+  final String conversationId;
+  final MessageWindow window = MessageWindow();
+  RandomAccessFile? _log;
+  RandomAccessFile? _index;
+  int _total = 0;
+  bool _paging = false;
+  final LinkedHashSet<String> _recent = LinkedHashSet();
+  late Future<void> _lock;
+
+  MessageRepository._(this.conversationId) {
+    _lock = _open();
+    SessionKeyManager.instance.addListener(_openSealed);
+  }
+
+  /// Ekranlar kapansa da depo açık kalır; aynı konuşma tekrar açıldığında
+  /// pencere hazırdır.
+  factory MessageRepository.of(String conversationId) =>
+      _repositories.putIfAbsent(conversationId, () => MessageRepository._(conversationId));
+
+  int get total => _total;
+  bool get hasOlder => window.start > 0;
+  bool get atTail => window.end == _total;
+
+  Future<T> _synchronized<T>(Future<T> Function() action) {
+    final result = _lock.then((_) => action());
+    _lock = result.then((_) {}, onError: (_) {});
+    return result;
+  }
+
+  Future<void> _open() async {
+    final dir = await AppStorage.dir('messages');
+    final name = conversationId.replaceAll(RegExp(r'[^\w-]'), '_');
+    _log = await File('${dir.path}/$name.log').open(mode: FileMode.append);
+    _index = await File('${dir.path}/$name.idx').open(mode: FileMode.append);
+    _total = await _index!.length() ~/ 8;
+    // Günlük yazılıp dizin yazılamadan çökülmüşse yetim satırlar atılır
+    await _index!.truncate(_total * 8);
+    await _log!.truncate(await _indexedLogEnd(_log!, _index!, _total));
+    await _loadRecent();
+    final from = max(0, _total - pageSize);
+    window.appendAll(await _read(from, _total), from);
+    notifyListeners();
+  }
+
+  /// Son [recentIds] kaydın kimliklerini tek okumayla yükler.
+  Future<void> _loadRecent() async {
+    final start = await _offsetOf(max(0, _total - recentIds));
+    final end = await _log!.length();
+    await _log!.setPosition(start);
+    for (final line in const LineSplitter().convert(utf8.decode(await _log!.read(end - start)))) {
+      _remember(jsonDecode(line)['id']);
+    }
+  }
+
+  void _remember(String id) {
+    _recent.add(id);
+    if (_recent.length > recentIds) _recent.remove(_recent.first);
+  }
+
+  Future<int> _offsetOf(int seq) async {
+    if (seq >= _total) return _log!.length();
+    await _index!.setPosition(seq * 8);
+    return ByteData.sublistView(await _index!.read(8)).getInt64(0);
+  }
+
+  Future<List<ChatMessage>> _read(int from, int to) async {
+    if (from >= to) return [];
+    final start = await _offsetOf(from);
+    final end = await _offsetOf(to);
+    await _log!.setPosition(start);
+    final lines = const LineSplitter().convert(utf8.decode(await _log!.read(end - start)));
+    return SessionKeyManager.instance.openAll(lines.map((line) => ChatMessage.fromJson(jsonDecode(line))).toList());
+  }
+
+  /// Yeni bir oturum anahtarı geldiğinde penceredeki şifreli mesajları açar.
+  void _openSealed() => _synchronized(() async {
+        final sealed = [for (var i = 0; i < window.length; i++) if (window[i].isSealed) window[i]];
+        if (sealed.isEmpty) return;
+        final opened = (await SessionKeyManager.instance.openAll(sealed)).where((m) => !m.isSealed).toList();
+        if (opened.isEmpty) return;
+        opened.forEach(window.replace);
+        notifyListeners();
+      });
+
+  /// Mesajı kalıcı depoya ekler; pencere sondaysa pencereye de ekler.
+  Future<void> add(ChatMessage message) => addAll([message]);
+
+  /// Mesajları tek yazma ve tek bildirimle ekler.
+  Future<void> addAll(List<ChatMessage> messages) => _synchronized(() async {
+        final seen = <String>{};
+        var fresh = messages.where((m) => !_recent.contains(m.id) && !window.contains(m.id) && seen.add(m.id)).toList();
+        if (fresh.isEmpty) return;
+        // Anahtarı bilinenler açık, bilinmeyenler şifreli saklanır
+        fresh = await SessionKeyManager.instance.openAll(fresh);
+        final lines = BytesBuilder(copy: false);
+        final offsets = ByteData(fresh.length * 8);
+        var offset = await _log!.length();
+        for (var i = 0; i < fresh.length; i++) {
+          final line = utf8.encode('${jsonEncode((await _storable(fresh[i])).toJson())}\n');
+          offsets.setInt64(i * 8, offset);
+          offset += line.length;
+          lines.add(line);
+        }
+        await _log!.setPosition(await _log!.length());
+        await _log!.writeFrom(lines.takeBytes());
+        await _index!.setPosition(_total * 8);
+        await _index!.writeFrom(offsets.buffer.asUint8List());
+        for (final message in fresh) {
+          _remember(message.id);
+        }
+
+        MessageAnchor.instance.addAll(fresh);
+        SearchIndex.instance.add(conversationId, fresh);
+        final wasAtTail = atTail;
+        final first = _total;
+        _total += fresh.length;
+        if (wasAtTail) {
+          window.appendAll(fresh, first);
+          if (window.length > windowSize) window.trimStart(window.length - windowSize);
+        }
+        notifyListeners();
+      });
+
+  /// Satır içi medya depoya dosya olarak yazılır, kayıtta yolu tutulur.
+  Future<ChatMessage> _storable(ChatMessage message) async {
+    if (message.bytes == null || message.mediaPath != null) return message;
+    final file = File('${(await AppStorage.dir('media')).path}/${message.id}');
+    await file.writeAsBytes(message.bytes!);
+    return ChatMessage(id: message.id, sender: message.sender, mediaPath: file.path, isVideo: message.isVideo, timestamp: message.timestamp);
+  }
+
+  /// Pencerenin başına bir önceki sayfayı yükler.
+  Future<void> loadOlder() async {
+    if (_paging || !hasOlder) return;
+    _paging = true;
+    try {
+      await _synchronized(() async {
+        final from = max(0, window.start - pageSize);
+        window.prepend(await _read(from, window.start), from);
+        if (window.length > windowSize) window.trimEnd(window.length - windowSize);
+        notifyListeners();
+      });
+    } finally {
+      _paging = false;
+    }
+  }
+
+  /// Eski mesajlara bakılırken kırpılan yeni mesajları geri yükler.
+  Future<void> loadNewer() async {
+    if (_paging || atTail) return;
+    _paging = true;
+    try {
+      await _synchronized(() async {
+        final to = min(_total, window.end + pageSize);
+        window.appendAll(await _read(window.end, to), window.end);
+        if (window.length > windowSize) window.trimStart(window.length - windowSize);
+        notifyListeners();
+      });
+    } finally {
+      _paging = false;
+    }
+  }
+}
+
+/// Bir terimin belge numaraları; artan sırada eklenir.
+class _Postings {
+  Int32List ids;
+  int length = 0;
+
+  _Postings([int capacity = 4]) : ids = Int32List(capacity);
+
+  void add(int id) {
+    if (length > 0 && ids[length - 1] == id) return;
+    if (length == ids.length) ids = Int32List(length * 2)..setAll(0, ids);
+    ids[length++] = id;
+  }
+
+  /// [id]'den küçük ilk konum.
+  int lowerBound(int id) {
+    var lo = 0;
+    var hi = length;
+    while (lo < hi) {
+      final mid = (lo + hi) >> 1;
+      if (ids[mid] < id) {
+        lo = mid + 1;
+      } else {
+        hi = mid;
+      }
+    }
+    return lo;
+  }
+
+  bool contains(int id) {
+    final at = lowerBound(id);
+    return at < length && ids[at] == id;
+  }
+}
+
+class SearchHit {
+  final String conversation;
+  final String messageId;
+  final String sender;
+  final int timestamp;
+  final String snippet;
+
+  SearchHit(this.conversation, this.messageId, this.sender, this.timestamp, this.snippet);
+}
+
+class SearchPage {
+  final List<SearchHit> hits;
+  /// Sonraki sayfa için [SearchIndex.search]'e `before` olarak verilir.
+  final int? next;
+
+  SearchPage(this.hits, this.next);
+}
+
+const int _maxTokenLength = 32;
+
+/// Dizinde ve sorguda aynı uzunlukta kesilen sözcükler.
+Iterable<String> _indexTokens(String text) =>
+    searchTokens(text).map((token) => token.length > _maxTokenLength ? token.substring(0, _maxTokenLength) : token);
+
+/// Mesajın dizin terimleri: katlanmış sözcükler ve konuşma terimi.
+List<String> _documentTerms(String conversation, String text) => ['#$conversation', ..._indexTokens(text).toSet()];
+
+/// Anlık görüntüyü ve ardından gelen terim günlüğünü okuyup dizini kurar.
+/// Dönüş: [terimler, günlükten okunan belge sayısı, okunan bayt].
+List<Object> _loadSearchIndex(Uint8List? snapshot, Uint8List tail, int covered, int maxDocs) {
+  final terms = SplayTreeMap<String, _Postings>();
+  if (snapshot != null) {
+    final input = ByteReader(snapshot);
+    input.varint(); // sihirli sayı, belge sayısı ve günlük konumu çağıran tarafta okundu
+    input.varint();
+    input.varint();
+    for (var n = input.varint(); n > 0; n--) {
+      final term = input.string();
+      final count = input.varint();
+      final postings = _Postings(max(count, 4));
+      var id = 0;
+      for (var i = 0; i < count; i++) {
+        id += input.varint();
+        postings.add(id);
+      }
+      terms[term] = postings;
+    }
+  }
+  final input = ByteReader(tail);
+  var replayed = 0;
+  var consumed = 0;
+  try {
+    while (!input.isAtEnd && covered + replayed < maxDocs) {
+      final doc = covered + replayed;
+      for (var n = input.varint(); n > 0; n--) {
+        terms.putIfAbsent(input.string(), () => _Postings()).add(doc);
+      }
+      replayed++;
+      consumed = input.offset;
+    }
+  } on RangeError {
+    // Yarım yazılmış son kayıt atılır
+  }
+  return [terms, replayed, consumed];
+}
+
+Uint8List _encodeSearchSnapshot(SplayTreeMap<String, _Postings> terms, int docs, int tailOffset) {
+  final out = ByteWriter()
+    ..varint(SearchIndex._magic)
+    ..varint(docs)
+    ..varint(tailOffset)
+    ..varint(terms.length);
+  terms.forEach((term, postings) {
+    out
+      ..string(term)
+      ..varint(postings.length);
+    var previous = 0;
+    for (var i = 0; i < postings.length; i++) {
+      out.varint(postings.ids[i] - previous);
+      previous = postings.ids[i];
+    }
+  });
+  return out.takeBytes();
+}
+
+/// Tüm konuşmalar üzerinde kalıcı, ters (inverted) tam metin dizini.
+///
+/// Her mesaj geliş sırasına göre bir belge numarası alır; terim başına
+/// belge numaraları artan tipli dizilerde tutulduğu için en yeni sonuçlar
+/// listelerin sonundan geriye doğru okunur. Terimler sıralı bir ağaçtadır;
+/// önek sorgusu ağaçta ilgili aralığa atlar ve en fazla [maxExpansions]
+/// terime genişler. Birden çok sözcükte en az belgeli sözcük sürülür, diğerleri
+/// ikili aramayla denetlenir; konuşma filtresi de aynı şekilde bir terimdir.
+///
+/// Diskte: `docs.log` + `docs.idx` (belge başına 8 baytlık konum), belge
+/// terimlerinin eklendiği `terms.log` ve her [snapshotEvery] belgede bir
+/// yazılan `index.bin` anlık görüntüsü. Açılışta görüntü ile ardından gelen
+/// günlük arka plan isolate'inde okunur. Mesajlar [add] ile kuyruğa alınır
+/// ve gruplar halinde, büyük gruplarda arka planda sözcüklere ayrılır.
+class SearchIndex {
+  static final SearchIndex instance = SearchIndex();
+  static const int _magic = 0x4d535831;
+  static const int snapshotEvery = 20000;
+  static const int maxExpansions = 256;
+  static const int backgroundThreshold = 256;
+
+  SplayTreeMap<String, _Postings> _terms = SplayTreeMap();
+  int _docs = 0;
+  int _snapshotDocs = 0;
+  late RandomAccessFile _docLog;
+  late RandomAccessFile _docIndex;
+  late RandomAccessFile _termLog;
+  late File _snapshot;
+  late Future<void> _lock;
+  final List<List<Object>> _queue = [];
+  Timer? _drainTimer;
+
+  SearchIndex() {
+    _lock = _open();
+  }
+
+  int get documentCount => _docs;
+
+  Future<T> _synchronized<T>(Future<T> Function() action) {
+    final result = _lock.then((_) => action());
+    _lock = result.then((_) {}, onError: (_) {});
+    return result;
+  }
+
+  Future<void> _open() async {
+    final dir = await AppStorage.dir('search');
+    _docLog = await File('${dir.path}/docs.log').open(mode: FileMode.append);
+    _docIndex = await File('${dir.path}/docs.idx').open(mode: FileMode.append);
+    _termLog = await File('${dir.path}/terms.log').open(mode: FileMode.append);
+    _snapshot = File('${dir.path}/index.bin');
+    _docs = await _docIndex.length() ~/ 8;
+
+    Uint8List? snapshot;
+    var covered = 0;
+    var tailOffset = 0;
+    if (await _snapshot.exists()) {
+      snapshot = await _snapshot.readAsBytes();
+      final header = ByteReader(snapshot);
+      if (header.varint() == _magic) {
+        covered = header.varint();
+        tailOffset = header.varint();
+      } else {
+        snapshot = null;
+      }
+    }
+    await _termLog.setPosition(tailOffset);
+    final tail = await _termLog.read(await _termLog.length() - tailOffset);
+    final docs = _docs;
+    final result = await Isolate.run(() => _loadSearchIndex(snapshot, tail, covered, docs));
+    _terms = result[0] as SplayTreeMap<String, _Postings>;
+    _snapshotDocs = covered;
+    // Çökmeden kalan tutarsızlık: iki günlük aynı belgede hizalanır
+    final indexed = covered + (result[1] as int);
+    if (indexed < _docs) {
+      await _docIndex.truncate(indexed * 8);
+      _docs = indexed;
+    }
+    await _termLog.truncate(tailOffset + (result[2] as int));
+    await _docLog.truncate(await _indexedLogEnd(_docLog, _docIndex, _docs));
+  }
+
+  /// Mesajları dizine eklenmek üzere kuyruğa alır. Metinsiz mesajlar ve
+  /// açılmış olsalar da şifreli mesajlar atlanır: dizin ve özetler şifresiz
+  /// diske yazıldığından açık metinleri burada da saklanmamalıdır.
+  void add(String conversation, List<ChatMessage> messages) {
+    for (final message in messages) {
+      if (message.sealed != null || message.text.isEmpty) continue;
+      _queue.add([conversation, message.id, message.sender, message.timestamp, message.text]);
+    }
+    if (_queue.isNotEmpty) _drainTimer ??= Timer(Duration(milliseconds: 200), _drain);
+  }
+
+  void _drain() {
+    _drainTimer = null;
+    final batch = List<List<Object>>.of(_queue);
+    _queue.clear();
+    _synchronized(() => _index(batch));
+  }
+
+  Future<void> _index(List<List<Object>> batch) async {
+    final sources = [for (final doc in batch) [doc[0] as String, doc[4] as String]];
+    List<List<String>> tokenize() => [for (final s in sources) _documentTerms(s[0], s[1])];
+    final terms = batch.length < backgroundThreshold ? tokenize() : await Isolate.run(tokenize);
+
+    final termRecords = ByteWriter();
+    final docRecords = BytesBuilder(copy: false);
+    final offsets = ByteData(batch.length * 8);
+    var offset = await _docLog.length();
+    for (var i = 0; i < batch.length; i++) {
+      termRecords.varint(terms[i].length);
+      terms[i].forEach(termRecords.string);
+      final text = batch[i][4] as String;
+      final line = utf8.encode('${jsonEncode({
+        'c': batch[i][0],
+        'id': batch[i][1],
+        'from': batch[i][2],
+        't': batch[i][3],
+        's': text.length > 120 ? text.substring(0, 120) : text,
+      })}\n');
+      offsets.setInt64(i * 8, offset);
+      offset += line.length;
+      docRecords.add(line);
+    }
+    // Aramalar konumları kaydırdığı için her yazma dosya sonuna konumlanır
+    for (final entry in [
+      MapEntry(_termLog, termRecords.takeBytes()),
+      MapEntry(_docLog, docRecords.takeBytes()),
+      MapEntry(_docIndex, offsets.buffer.asUint8List()),
+    ]) {
+      await entry.key.setPosition(await entry.key.length());
+      await entry.key.writeFrom(entry.value);
+    }
+
+    for (var i = 0; i < batch.length; i++) {
+      for (final term in terms[i]) {
+        _terms.putIfAbsent(term, () => _Postings()).add(_docs + i);
+      }
+    }
+    _docs += batch.length;
+    if (_docs - _snapshotDocs >= snapshotEvery) await _writeSnapshot();
+  }
+
+  Future<void> _writeSnapshot() async {
+    final terms = _terms;
+    final docs = _docs;
+    final tailOffset = await _termLog.length();
+    final bytes = await Isolate.run(() => _encodeSearchSnapshot(terms, docs, tailOffset));
+    final tmp = File('${_snapshot.path}.tmp');
+    await tmp.writeAsBytes(bytes, flush: true);
+    await tmp.rename(_snapshot.path);
+    _snapshotDocs = docs;
+  }
+
+  List<_Postings> _expand(String prefix) {
+    final out = <_Postings>[];
+    var key = _terms.containsKey(prefix) ? prefix : _terms.firstKeyAfter(prefix);
+    while (key != null && key.startsWith(prefix) && out.length < maxExpansions) {
+      out.add(_terms[key]!);
+      key = _terms.firstKeyAfter(key);
+    }
+    return out;
+  }
+
+  Future<SearchHit> _document(int id) async {
+    await _docIndex.setPosition(id * 8);
+    final start = ByteData.sublistView(await _docIndex.read(8)).getInt64(0);
+    final int end;
+    if (id + 1 < _docs) {
+      end = ByteData.sublistView(await _docIndex.read(8)).getInt64(0);
+    } else {
+      end = await _docLog.length();
+    }
+    await _docLog.setPosition(start);
+    final json = jsonDecode(utf8.decode(await _docLog.read(end - start)));
+    return SearchHit(json['c'], json['id'], json['from'], json['t'], json['s']);
+  }
+
+  /// Her sözcüğü önek olarak arar; sonuçlar yeniden eskiye sıralıdır.
+  /// [conversation] verilirse yalnızca o konuşmada arar. Sonraki sayfa için
+  /// dönen [SearchPage.next] değeri [before] olarak verilir.
+  Future<SearchPage> search(String query, {String? conversation, int? before, int limit = 20}) => _synchronized(() async {
+        final words = _indexTokens(query).toSet();
+        if (words.isEmpty) return SearchPage([], null);
+        final groups = [
+          for (final word in words) _expand(word),
+          if (conversation != null) [if (_terms['#$conversation'] != null) _terms['#$conversation']!],
+        ];
+        if (groups.any((lists) => lists.isEmpty)) return SearchPage([], null);
+        int size(List<_Postings> lists) => lists.fold(0, (sum, p) => sum + p.length);
+        groups.sort((a, b) => size(a).compareTo(size(b)));
+
+        // En az belgeli grubun listeleri sondan birleştirilir
+        final driver = groups.first;
+        final limitId = before ?? _docs;
+        final heads = [for (final p in driver) p.lowerBound(limitId) - 1];
+        final ids = <int>[];
+        var last = -1;
+        while (ids.length < limit) {
+          var best = -1;
+          for (var i = 0; i < driver.length; i++) {
+            if (heads[i] >= 0 && (best < 0 || driver[i].ids[heads[i]] > driver[best].ids[heads[best]])) best = i;
+          }
+          if (best < 0) {
+            last = -1;
+            break;
+          }
+          final id = driver[best].ids[heads[best]];
+          for (var i = 0; i < driver.length; i++) {
+            if (heads[i] >= 0 && driver[i].ids[heads[i]] == id) heads[i]--;
+          }
+          last = id;
+          if (groups.skip(1).every((lists) => lists.any((p) => p.contains(id)))) ids.add(id);
+        }
+        final hits = [for (final id in ids) await _document(id)];
+        return SearchPage(hits, ids.length == limit && last > 0 ? last : null);
+      });
+}
+
+class MessageSearchScreen extends StatefulWidget {
+  /// Verilirse yalnızca bu konuşmada arar.
+  final String? conversation;
+
+  const MessageSearchScreen({this.conversation});
+
+  @override
+  State<MessageSearchScreen> createState() => _MessageSearchScreenState();
+}
+
+class _MessageSearchScreenState extends State<MessageSearchScreen> {
+  final List<SearchHit> _hits = [];
+  String _query = '';
+  int? _next;
+  int _generation = 0;
+  bool _loading = false;
+  Timer? _debounce;
+
+  void _onChanged(String value) {
+    _debounce?.cancel();
+    _debounce = Timer(Duration(milliseconds: 150), () => _run(value));
+  }
+
+  Future<void> _run(String query) async {
+    final generation = ++_generation;
+    final page = await SearchIndex.instance.search(query, conversation: widget.conversation);
+    if (!mounted || generation != _generation) return;
+    setState(() {
+      _query = query;
+      _hits
+        ..clear()
+        ..addAll(page.hits);
+      _next = page.next;
+    });
+  }
+
+  Future<void> _loadMore() async {
+    if (_loading || _next == null) return;
+    _loading = true;
+    final generation = _generation;
+    final page = await SearchIndex.instance.search(_query, conversation: widget.conversation, before: _next);
+    _loading = false;
+    if (!mounted || generation != _generation) return;
+    setState(() {
+      _hits.addAll(page.hits);
+      _next = page.next;
+    });
+  }
+
+  @override
+  void dispose() {
+    _debounce?.cancel();
+    super.dispose();
+  }
+
+  @override
+  Widget build(BuildContext context) => Scaffold(
+        appBar: AppBar(
+          title: TextField(autofocus: true, decoration: InputDecoration(hintText: 'Mesajlarda ara'), onChanged: _onChanged),
+        ),
+        body: NotificationListener<ScrollNotification>(
+          onNotification: (notification) {
+            if (notification.metrics.extentAfter < 400) _loadMore();
+            return false;
+          },
+          child: ListView.builder(
+            itemCount: _hits.length,
+            itemBuilder: (_, i) {
+              final hit = _hits[i];
+              final time = DateTime.fromMillisecondsSinceEpoch(hit.timestamp).toString().substring(0, 16);
+              return ListTile(
+                key: ValueKey('${hit.conversation}/${hit.messageId}'),
+                title: Text(hit.snippet),
+                subtitle: Text('${hit.sender} · $time'),
+              );
+            },
+          ),
+        ),
+      );
+}
+
+/// Socket olaylarını biriktirip kare başına (veya [interval] aralıklarla)
+/// tek seferde teslim eder; yoğun trafikte yeniden çizim sayısı sınırlı kalır.
+class IngestBuffer<T> {
+  final void Function(List<T> batch) onFlush;
+  final Duration? interval;
+  final List<T> _pending = [];
+  Timer? _timer;
+  bool _scheduled = false;
+
+  IngestBuffer({required this.onFlush, this.interval});
+
+  void add(T item) {
+    _pending.add(item);
+    if (_scheduled) return;
+    _scheduled = true;
+    if (interval != null) {
+      _timer = Timer(interval!, flush);
+    } else {
+      SchedulerBinding.instance.scheduleFrameCallback((_) => flush());
+    }
+  }
+
+  void flush() {
+    _scheduled = false;
+    _timer?.cancel();
+    _timer = null;
+    if (_pending.isEmpty) return;
+    final batch = List<T>.of(_pending);
+    _pending.clear();
+    onFlush(batch);
+  }
+
+  /// Bekleyenleri teslim eder ve zamanlayıcıyı durdurur.
+  void dispose() => flush();
+}
+
+class ReceiptCount {
+  final int delivered;
+  final int read;
+  final int total;
+
+  const ReceiptCount(this.delivered, this.read, this.total);
+
+  String get label => 'İletildi $delivered/$total · Okundu $read';
+}
+
+/// Bir grubun iletim ve okunma bildirimleri.
+///
+/// Alıcı taraf iletilen ve görüntülenen mesaj id'lerini biriktirip
+/// [flushInterval]'da bir tek `receipts` olayıyla gönderir. Sunucu bildirimleri
+/// üye başına iletmez; her zaman penceresinde değişen mesajlar için toplam
+/// sayıları gönderene tek bir `receiptSummary` ile yollar. Sayılar yalnızca
+/// artar, bu yüzden geç veya tekrar gelen özetler güvenle uygulanır. Son
+/// [maxTracked] mesajın sayıları `receipts/<grup>.json`'da tutulur.
+class DeliveryReceipts extends ChangeNotifier {
+  static const int maxTracked = 2000;
+  static const Duration flushInterval = Duration(milliseconds: 500);
+  static final Map<String, DeliveryReceipts> _receipts = {};
+  static bool _listening = false;
+
+  final String groupId;
+  final Map<String, ReceiptCount> _counts = {};
+  final Set<String> _reported = {};
+  final Set<String> _delivered = {};
+  final Set<String> _read = {};
+  String? _user;
+  Timer? _flushTimer;
+  Timer? _saveTimer;
+
+  DeliveryReceipts._(this.groupId) {
+    _load();
+  }
+
+  factory DeliveryReceipts.of(String groupId) {
+    if (!_listening) {
+      _listening = true;
+      ConnectionManager.instance.socket.on('receiptSummary', (data) => _receipts[data['group']]?._apply(data['updates']));
+    }
+    return _receipts.putIfAbsent(groupId, () => DeliveryReceipts._(groupId));
+  }
+
+  ReceiptCount? operator [](String id) => _counts[id];
+
+  Future<File> get _file async =>
+      File('${(await AppStorage.dir('receipts')).path}/${groupId.replaceAll(RegExp(r'[^\w-]'), '_')}.json');
+
+  Future<void> _load() async {
+    final file = await _file;
+    if (!await file.exists()) return;
+    final saved = Map<String, dynamic>.from(jsonDecode(await file.readAsString()));
+    saved.forEach((id, c) => _counts.putIfAbsent(id, () => ReceiptCount(c[0], c[1], c[2])));
+    notifyListeners();
+  }
+
+  void _scheduleSave() {
+    _saveTimer ??= Timer(Duration(seconds: 2), () async {
+      _saveTimer = null;
+      await (await _file).writeAsString(jsonEncode(_counts.map((id, c) => MapEntry(id, [c.delivered, c.read, c.total]))));
+    });
+  }
+
+  void markDelivered(String id, String user) => _queue(_delivered, id, user);
+
+  /// Mesaj ekranda görüntülendiğinde çağrılır; aynı mesaj bir kez bildirilir.
+  void markRead(String id, String user) {
+    if (!_reported.add(id)) return;
+    if (_reported.length > maxTracked) _reported.remove(_reported.first);
+    _queue(_read, id, user);
+  }
+
+  void _queue(Set<String> pending, String id, String user) {
+    _user = user;
+    pending.add(id);
+    _flushTimer ??= Timer(flushInterval, _flush);
+  }
+
+  void _flush() {
+    _flushTimer = null;
+    if (_delivered.isEmpty && _read.isEmpty) return;
+    ConnectionManager.instance.socket.emit('receipts', {
+      'group': groupId,
+      'user': _user,
+      'delivered': _delivered.toList(),
+      'read': _read.toList(),
+    });
+    _delivered.clear();
+    _read.clear();
+  }
+
+  void _apply(dynamic updates) {
+    for (final update in updates) {
+      final id = update['id'] as String;
+      final old = _counts.remove(id);
+      _counts[id] = ReceiptCount(
+        max(old?.delivered ?? 0, update['delivered']),
+        max(old?.read ?? 0, update['read']),
+        update['total'],
+      );
+    }
+    while (_counts.length > maxTracked) {
+      _counts.remove(_counts.keys.first);
+    }
+    notifyListeners();
+    _scheduleSave();
+  }
+}
+
+class GroupMessageTile extends StatelessWidget {
+  final ChatMessage message;
+  final String userId;
+  final ReceiptCount? receipt;
+
+  const GroupMessageTile({Key? key, required this.message, required this.userId, this.receipt}) : super(key: key);
+
+  @override
+  Widget build(BuildContext context) {
+    final Widget content;
+    if (message.isImage) {
+      content = MediaThumbnail(message: message);
+    } else if (message.isVideo) {
+      content = Text(message.sender == userId ? "Video gönderildi" : "Video alındı");
+    } else {
+      content = Text(message.sender == userId ? "Ben: ${message.displayText}" : "${message.sender}: ${message.displayText}");
+    }
+    if (message.sender != userId || receipt == null) return content;
+    return Column(crossAxisAlignment: CrossAxisAlignment.start, children: [
+      content,
+      Text(receipt!.label, style: TextStyle(fontSize: 11, color: Colors.grey)),
+    ]);
+  }
+}
+
+/// Yalnızca görünen satırları kuran, ters sıralı mesaj listesi.
+///
+/// En yeni mesaj index 0'dadır; böylece yeni mesaj eklemek mevcut satırları
+/// kaydırmaz ve anahtarlar sayesinde eski satırların durumu korunur. Listenin
+/// uçlarına yaklaşıldığında [onReachOldest] / [onReachNewest] çağrılır.
+///
+/// Sayfa yüklenip pencere kırpıldığında görünüme en yakın satır çapa olarak
+/// kullanılır: değişiklikten sonraki ilk karede çapanın içerikteki konumu ne
+/// kadar kaydıysa kaydırma konumu o kadar düzeltilir, görünüm yerinde kalır ve
+/// eşik denetimleri arka arkaya sayfa yüklemez. Liste en altta ve pencere
+/// en yeni mesajdaysa ([atNewest]) gelen mesajlar görünür, düzeltme yapılmaz.
+/// [onVisible], her yerleşimden ve kaydırma bitişinden sonra yalnızca
+/// görünüm alanıyla kesişen (önbellek alanında kurulanlar hariç) ve daha önce
+/// bildirilmemiş mesajlarla çağrılır.
+class MessageListView extends StatefulWidget {
+  final MessageWindow window;
+  final Widget Function(ChatMessage message) tileBuilder;
+  final ScrollController? controller;
+  final VoidCallback? onReachOldest;
+  final VoidCallback? onReachNewest;
+  final void Function(List<ChatMessage> messages)? onVisible;
+  final bool atNewest;
+
+  const MessageListView({
+    Key? key,
+    required this.window,
+    required this.tileBuilder,
+    this.controller,
+    this.onReachOldest,
+    this.onReachNewest,
+    this.onVisible,
+    this.atNewest = true,
+  }) : super(key: key);
+
+  @override
+  State<MessageListView> createState() => _MessageListViewState();
+}
+
+class _MessageListViewState extends State<MessageListView> {
+  final Map<String, GlobalKey> _keys = {};
+  ScrollController? _ownController;
+  final Set<String> _seen = {};
+  String? _anchorId;
+  double _anchorOffset = 0;
+  bool _followNewest = true;
+
+  ScrollController get _controller => widget.controller ?? (_ownController ??= ScrollController());
+
+  @override
+  void dispose() {
+    _ownController?.dispose();
+    super.dispose();
+  }
+
+  /// Satırın görünüm başına hizalandığı kaydırma konumu; kurulmamışsa null.
+  double? _revealOffset(String id) {
+    final box = _keys[id]?.currentContext?.findRenderObject();
+    if (box == null || !box.attached) return null;
+    return RenderAbstractViewport.of(box).getOffsetToReveal(box, 0).offset;
+  }
+
+  void _captureAnchor() {
+    if (!_controller.hasClients) return;
+    final pixels = _controller.position.pixels;
+    _keys.removeWhere((id, _) => !widget.window.contains(id));
+    _anchorId = null;
+    var nearest = double.infinity;
+    for (final id in _keys.keys) {
+      final offset = _revealOffset(id);
+      if (offset == null || (offset - pixels).abs() >= nearest) continue;
+      nearest = (offset - pixels).abs();
+      _anchorId = id;
+      _anchorOffset = offset;
+    }
+    _followNewest = widget.atNewest && pixels <= _controller.position.minScrollExtent + 1;
+  }
+
+  void _reportVisible() {
+    final onVisible = widget.onVisible;
+    if (onVisible == null || !_controller.hasClients) return;
+    final position = _controller.position;
+    final visible = <ChatMessage>[];
+    for (final id in _keys.keys) {
+      if (_seen.contains(id)) continue;
+      final box = _keys[id]!.currentContext?.findRenderObject();
+      final offset = _revealOffset(id);
+      if (box is! RenderBox || offset == null) continue;
+      final start = offset - position.pixels;
+      if (start + box.size.height <= 0 || start >= position.viewportDimension) continue;
+      _seen.add(id);
+      visible.add(widget.window[widget.window.indexOf(id)!]);
+    }
+    _seen.removeWhere((id) => !widget.window.contains(id));
+    if (visible.isNotEmpty) onVisible(visible);
+  }
+
+  void _afterLayout(Duration _) {
+    if (!mounted || !_controller.hasClients) return;
+    final id = _anchorId;
+    final offset = id == null ? null : _revealOffset(id);
+    if (offset != null && !_followNewest && (offset - _anchorOffset).abs() > 0.5) {
+      final position = _controller.position;
+      position.jumpTo((position.pixels + offset - _anchorOffset).clamp(position.minScrollExtent, position.maxScrollExtent));
+    }
+    _captureAnchor();
+    _reportVisible();
+  }
+
+  @override
+  Widget build(BuildContext context) {
+    final window = widget.window;
+    WidgetsBinding.instance.addPostFrameCallback(_afterLayout);
+    return NotificationListener<ScrollNotification>(
+      onNotification: (notification) {
+        if (notification is ScrollEndNotification) {
+          _captureAnchor();
+          _reportVisible();
+        }
+        if (notification.metrics.extentAfter < 600) widget.onReachOldest?.call();
+        if (notification.metrics.extentBefore < 200) widget.onReachNewest?.call();
+        return false;
+      },
+      child: ListView.builder(
+        controller: _controller,
+        reverse: true,
+        padding: EdgeInsets.all(8),
+        itemCount: window.length,
+        findChildIndexCallback: (key) {
+          final index = window.indexOf((key as ValueKey<String>).value);
+          return index == null ? null : window.length - 1 - index;
+        },
+        itemBuilder: (_, i) {
+          final message = window[window.length - 1 - i];
+          return KeyedSubtree(
+            key: ValueKey(message.id),
+            child: KeyedSubtree(key: _keys.putIfAbsent(message.id, () => GlobalKey()), child: widget.tileBuilder(message)),
+          );
+        },
+      ),
+    );
+  }
+}
+
+class GroupChatPage extends StatefulWidget {
+  final String groupId;
+  final String userId;
+
+  const GroupChatPage({required this.groupId, required this.userId});
+
+
+  @override
+  State<GroupChatPage> createState() => _GroupChatPageState();
+}
+
+class _GroupChatPageState extends State<GroupChatPage> {
+  static const int inlineMediaLimit = 256 * 1024;
+
+  final TextEditingController _controller = TextEditingController();
+  late final MessageRepository _messages;
+  late final IngestBuffer<ChatMessage> _ingest;
+  final ImagePicker _picker = ImagePicker();
+  /// Açılışı sürerken de kayıtlıdır; yeniden gönderilen başlangıç ikinci bir
+  /// yazıcı açmaz.
+  final Map<String, Future<MediaChunkWriter>> _incoming = {};
+  late final ChannelSubscription _channel;
+  late final MembershipIndex _members;
+  late final DeliveryReceipts _receipts;
+
+
+  @override
+  void initState() {
+    super.initState();
+    _messages = MessageRepository.of('group:${widget.groupId}')..addListener(_onMessagesChanged);
+    _members = MembershipIndex.of(widget.groupId)..addListener(_onMessagesChanged);
+    _receipts = DeliveryReceipts.of(widget.groupId)..addListener(_onMessagesChanged);
+    _ingest = IngestBuffer(onFlush: _messages.addAll);
+
+    // Mesajlar tipli ikili zarflarla, büyük medya parçalar halinde taşınır
+    _channel = ConnectionManager.instance.subscribe('group:${widget.groupId}', params: {'groupId': widget.groupId, 'userId': widget.userId});
+    _channel.onConnect((_) {
+      // Yarım kalan indirmeleri eksik parçadan devam ettir
+      for (final pending in _incoming.values) {
+        pending.then((writer) => _channel.emit('mediaFetch', {'id': writer.transferId, 'from': writer.nextMissing}), onError: (_) {});
+      }
+    });
+    _channel.onEnvelope(_onEnvelope);
+    SessionKeyManager.instance.attach(_channel, 'group:${widget.groupId}', widget.userId);
+    _channel.on('mediaBegin', _onMediaBegin);
+    _channel.on('mediaChunk', _onMediaChunk);
+    _channel.on('mediaEnd', _onMediaEnd);
+  }
+
+  void _onMessagesChanged() {
+    if (mounted) setState(() {});
+  }
+
+  // Liste tamamlanmadıysa yerelde olmamak üye olmadığımız anlamına gelmez
+  bool get _canSend => _members.contains(widget.userId) || !_members.isComplete;
+
+  void _onEnvelope(MessageEnvelope envelope) {
+    if (envelope.groupId != widget.groupId || envelope.sender == widget.userId) return;
+    switch (envelope.kind) {
+      case MessageKind.text:
+      case MessageKind.media:
+      case MessageKind.sealed:
+        _ingest.add(ChatMessage.fromEnvelope(envelope));
+        _receipts.markDelivered(envelope.id, widget.userId);
+        break;
+      default:
+        break;
+    }
+  }
+
+  Future<void> _onMediaBegin(dynamic data) async {
+    final begin = Map<String, dynamic>.from(data);
+    // Paylaşılan soket başka odaların aktarımlarını da getirir
+    if (begin['groupId'] != widget.groupId || begin['sender'] == widget.userId) return;
+    final id = begin['id'] as String;
+    if (_incoming.containsKey(id)) return;
+    final pending = _incoming[id] = AppStorage.dir('media').then((dir) => MediaChunkWriter.open(dir, begin));
+    try {
+      await pending;
+    } catch (e) {
+      _incoming.remove(id);
+      print("Medya alımı başlatılamadı: $e");
+    }
+  }
+
+  Future<void> _onMediaChunk(dynamic data) async {
+    final pending = _incoming[data['id']];
+    if (pending == null) return;
+    final writer = await pending;
+    final ok = await writer.write(data['seq'], toBytes(data['bytes']), data['sum']);
+    if (!ok) _channel.emit('mediaFetch', {'id': writer.transferId, 'from': writer.nextMissing});
+  }
+
+  Future<void> _onMediaEnd(dynamic data) async {
+    if (data['groupId'] != widget.groupId) return;
+    final pending = _incoming[data['id']];
+    if (pending == null) return;
+    final writer = await pending;
+    await writer.idle;
+    if (!writer.isComplete) {
+      _channel.emit('mediaFetch', {'id': writer.transferId, 'from': writer.nextMissing});
+      return;
+    }
+    final file = await writer.finish();
+    if (file == null) {
+      _channel.emit('mediaFetch', {'id': writer.transferId, 'from': 0});
+      return;
+    }
+    _incoming.remove(writer.transferId);
+    _receipts.markDelivered(writer.transferId, widget.userId);
+    _messages.add(ChatMessage(
+      id: writer.transferId,
+      sender: data['sender'] ?? '',
+      mediaPath: file.path,
+      isVideo: writer.contentType.startsWith('video/'),
+    ));
+  }
+
+  Future<void> _sendMessage() async {
+    final text = _controller.text.trim();
+    if (text.isEmpty) return;
+    _controller.clear();
+    final message = ChatMessage(id: const Uuid().v4(), sender: widget.userId, text: text);
+    final sealed = await SessionKeyManager.instance.seal('group:${widget.groupId}', message);
+    _channel.sendEnvelope(MessageEnvelope.sealed(widget.groupId, sealed));
+    _messages.add(sealed.opened(text));
+  }
+
+  // Medya seçme işlemi
+  Future<void> _pickMedia() async {
+    final pickedFile = await _picker.pickImage(source: ImageSource.gallery);
+    if (pickedFile != null) {
+      _sendImage(File(pickedFile.path));
+    }
+  }
+
+  // Video seçme işlemi
+  Future<void> _pickVideo() async {
+    final pickedFile = await _picker.pickVideo(source: ImageSource.gallery);
+    if (pickedFile != null) {
+      _sendVideo(pickedFile.path);
+    }
+  }
+
+
+  // Video gönderme işlemi
+  Future<void> _sendVideo(String videoPath) async {
+    await _upload(videoPath, 'video/mp4', isVideo: true);
+  }
+
+
+  // Resim gönderme işlemi
+  Future<void> _sendImage(File image) async {
+    await _upload(image.path, 'image/jpeg');
+  }
+
+  Future<void> _upload(String path, String contentType, {bool isVideo = false}) async {
+    final file = File(path);
+    if (await file.length() <= inlineMediaLimit) {
+      // Küçük dosyalar tek zarfta ham bayt olarak gider
+      final envelope = MessageEnvelope(
+        kind: MessageKind.media,
+        groupId: widget.groupId,
+        sender: widget.userId,
+        contentType: contentType,
+        payload: await file.readAsBytes(),
+      );
+      _channel.sendEnvelope(envelope);
+      _messages.add(ChatMessage(id: envelope.id, sender: widget.userId, mediaPath: path, isVideo: isVideo));
+      return;
+    }
+    final uploader = MediaUploader(
+      socket: _channel.socket,
+      path: path,
+      groupId: widget.groupId,
+      sender: widget.userId,
+      contentType: contentType,
+    );
+    try {
+      await uploader.upload();
+      _messages.add(ChatMessage(id: uploader.transferId, sender: widget.userId, mediaPath: path, isVideo: isVideo));
+    } catch (e) {
+      print("Medya gönderilemedi: $e");
+    }
+  }
+
+  @override
+  void dispose() {
+    for (final pending in _incoming.values) {
+      pending.then((writer) => writer.close(), onError: (_) {});
+    }
+    _ingest.dispose();
+    _messages.removeListener(_onMessagesChanged);
+    _members.removeListener(_onMessagesChanged);
+    _receipts.removeListener(_onMessagesChanged);
+    SessionKeyManager.instance.detach('group:${widget.groupId}');
+    _channel.cancel();
+    super.dispose();
+  }
+
+  
+  @override
+  Widget build(BuildContext context) {
+    return Scaffold(
+      appBar: AppBar(
+        title: Text('Grup Mesajları · ${_members.count} üye'),
+        actions: [
+          IconButton(
+            icon: Icon(Icons.search),
+            onPressed: () => Navigator.push(
+              context,
+              MaterialPageRoute(builder: (_) => MessageSearchScreen(conversation: 'group:${widget.groupId}')),
+            ),
+          ),
+        ],
+      ),
+      body: Column(
+        children: [
+          Expanded(
+            child: MessageListView(
+              window: _messages.window,
+              tileBuilder: (message) => GroupMessageTile(message: message, userId: widget.userId, receipt: _receipts[message.id]),
+              onVisible: (messages) {
+                for (final message in messages) {
+                  if (message.sender != widget.userId) _receipts.markRead(message.id, widget.userId);
+                }
+              },
+              onReachOldest: _messages.loadOlder,
+              onReachNewest: _messages.loadNewer,
+              atNewest: _messages.atTail,
+            ),
+          ),
+          if (_canSend)
+            Row(
+              children: [
+                Expanded(child: TextField(controller: _controller)),
+                IconButton(icon: Icon(Icons.send), onPressed: _sendMessage),
+                IconButton(icon: Icon(Icons.image), onPressed: _pickMedia), // Medya seçme butonu
+                IconButton(icon: Icon(Icons.video_library), onPressed: _pickVideo), // Video seçme butonu
+              ],
+            )
+          else
+            Padding(padding: EdgeInsets.all(12), child: Text('Mesaj göndermek için gruba katılın')),
+        ],
+      ),
+    );
+  }
+}
+
+/// Sıralı bir listeden yüzdelik değer (p: 0-100).
+double percentile(List<double> sorted, double p) {
+  if (sorted.isEmpty) return 0;
+  final rank = (p / 100 * (sorted.length - 1)).round();
+  return sorted[rank];
+}
+
+/// Ölçüm raporları için p50/p90/p99/max özeti.
+Map<String, double> summarize(List<double> values) {
+  final sorted = List<double>.of(values)..sort();
+  return {
+    'p50': percentile(sorted, 50),
+    'p90': percentile(sorted, 90),
+    'p99': percentile(sorted, 99),
+    'max': sorted.isEmpty ? 0 : sorted.last,
+  };
+}
+
+/// MessageListView için kare süresi ölçümü: 10k, 100k ve 1M mesajla listeyi
+/// kaydırır, arada mesaj ekler ve build/raster sürelerini raporlar.
+/// Anlamlı sonuç için profile modunda çalıştırın.
+class GroupChatBenchmarkScreen extends StatefulWidget {
+  static const List<int> sizes = [10000, 100000, 1000000];
+
+  @override
+  _GroupChatBenchmarkScreenState createState() => _GroupChatBenchmarkScreenState();
+}
+
+class _GroupChatBenchmarkScreenState extends State<GroupChatBenchmarkScreen> {
+  static const int frames = 240;
+
+  final _scroll = ScrollController();
+  MessageWindow _window = MessageWindow();
+  final List<Map<String, dynamic>> _results = [];
+  bool _running = false;
+
+  Future<void> _run() async {
+    setState(() {
+      _running = true;
+      _results.clear();
+    });
+    for (final size in GroupChatBenchmarkScreen.sizes) {
+      _results.add(await _measure(size));
+      setState(() {});
+    }
+    print(jsonEncode({'benchmark': 'group_chat_frames', 'results': _results}));
+    setState(() => _running = false);
+  }
+
+  Future<Map<String, dynamic>> _measure(int size) async {
+    final window = MessageWindow();
+    for (var i = 0; i < size; i++) {
+      window.append(ChatMessage(id: 'm$i', sender: 'u${i % 50}', text: 'Mesaj $i'), i);
+    }
+    setState(() => _window = window);
+    await SchedulerBinding.instance.endOfFrame;
+    _scroll.jumpTo(0);
+
+    final timings = <FrameTiming>[];
+    void collect(List<FrameTiming> batch) => timings.addAll(batch);
+    SchedulerBinding.instance.addTimingsCallback(collect);
+    for (var frame = 0; frame < frames; frame++) {
+      if (frame % 4 == 0) {
+        setState(() => _window.append(ChatMessage(id: 'new$size-$frame', sender: 'u0', text: 'Yeni mesaj $frame'), _window.end));
+      } else {
+        _scroll.jumpTo(_scroll.offset + 40);
+      }
+      SchedulerBinding.instance.scheduleFrame();
+      await SchedulerBinding.instance.endOfFrame;
+    }
+    // Zamanlamalar motor tarafından toplu bildirilir
+    await Future.delayed(Duration(seconds: 2));
+    SchedulerBinding.instance.removeTimingsCallback(collect);
+
+    double ms(Duration d) => d.inMicroseconds / 1000;
+    return {
+      'messages': size,
+      'frames': timings.length,
+      'build_ms': summarize(timings.map((t) => ms(t.buildDuration)).toList()),
+      'raster_ms': summarize(timings.map((t) => ms(t.rasterDuration)).toList()),
+    };
+  }
+
+  @override
+  void dispose() {
+    _scroll.dispose();
+    super.dispose();
+  }
+
+  @override
+  Widget build(BuildContext context) => Scaffold(
+        appBar: AppBar(title: Text('Grup Listesi Ölçümü')),
+        body: Column(children: [
+          ElevatedButton(onPressed: _running ? null : _run, child: Text('Ölçümü Başlat')),
+          for (final r in _results)
+            ListTile(
+              title: Text('${r['messages']} mesaj, ${r['frames']} kare'),
+              subtitle: Text('build p50/p90/p99: ${r['build_ms']['p50']}/${r['build_ms']['p90']}/${r['build_ms']['p99']} ms\n'
+                  'raster p50/p90/p99: ${r['raster_ms']['p50']}/${r['raster_ms']['p90']}/${r['raster_ms']['p99']} ms'),
+            ),
+          Expanded(
+            child: MessageListView(
+              window: _window,
+              controller: _scroll,
+              tileBuilder: (message) => GroupMessageTile(message: message, userId: 'u0'),
+            ),
+          ),
+        ]),
+      );
+}
+
+class _ReceiptTally {
+  final String group;
+  final String sender;
+  final Set<String> delivered = {};
+  final Set<String> read = {};
+
+  _ReceiptTally(this.group, this.sender);
+}
+
+/// Ölçüm ve çevrimdışı deneme için süreç içi socket.io sunucusu.
+///
+/// Engine.IO v4 / Socket.IO v5 protokolünün websocket taşımasını (varsayılan
+/// ad alanı, ack ve ikili ekler dahil) `dart:io` ile uygular. Varsayılan
+/// işleyiciler gerçek sunucunun sohbet davranışını taklit eder: oda
+/// aboneliği, `sendMessage(s)` yayını, `typing`, `envelope` ve `e2e` aktarımı,
+/// medya parçalarının ack'lenip odaya iletilmesi, grupların revizyon
+/// günlüğüyle delta eşitlenmesi, sayfalı üye listesi, [receiptWindow]
+/// başına toplanan iletim bildirimleri, özetlenmiş numaralarla kişi
+/// eşleştirme ([registerPhone]), süreli durum akışı, canlı konum
+/// paketlerinin yalnızca izleyenlere dağıtılması ve arama sinyallerinin
+/// (`call`) alıcıya yönlendirilmesi. Ek olaylar [on] ile eklenebilir.
+class LocalSocketServer {
+  final Duration pingInterval;
+  final Duration receiptWindow;
+  final Map<String, void Function(StandInClient client, dynamic data, void Function(dynamic)? ack)> _handlers = {};
+  final Set<StandInClient> clients = {};
+  final Map<String, Set<StandInClient>> rooms = {};
+  final Set<String> _seenIds = {};
+  final Map<String, Set<int>> _transfers = {};
+  final Map<String, Map<String, dynamic>> groups = {};
+  final List<Map<String, dynamic>> _groupLog = [];
+  int _revision = 0;
+  final Map<String, String> _phoneUsers = {};
+  final Map<String, Map<String, dynamic>> _statuses = {};
+  final Map<String, dynamic> _lastLocations = {};
+  final List<Map<String, dynamic>> _statusLog = [];
+  int _statusRevision = 0;
+  final Map<String, _ReceiptTally> _tallies = {};
+  final Set<String> _dirtyTallies = {};
+  Timer? _receiptTimer;
+  HttpServer? _http;
+
+  LocalSocketServer({this.pingInterval = const Duration(seconds: 25), this.receiptWindow = const Duration(seconds: 1)}) {
+    on('subscribe', (client, data, ack) {
+      client.join(data['room']);
+      client.user ??= data['username'] ?? data['userId'];
+    });
+    on('unsubscribe', (client, data, ack) => client.leave(data['room']));
+    on('sendMessage', (client, data, ack) {
+      if (_seenIds.add('${data['id']}')) broadcast('receiveMessage', data, except: client);
+      ack?.call({'ok': [data['id']]});
+    });
+    on('sendMessages', (client, data, ack) {
+      final ids = [];
+      for (final message in data['messages']) {
+        if (_seenIds.add('${message['id']}')) broadcast('receiveMessage', message, except: client);
+        ids.add(message['id']);
+      }
+      ack?.call({'ok': ids});
+    });
+    on('typing', (client, data, ack) => broadcast('typing', data, except: client));
+    on('envelope', (client, data, ack) {
+      try {
+        final envelope = MessageEnvelope.decode(data);
+        _tallies.putIfAbsent(envelope.id, () => _ReceiptTally(envelope.groupId, envelope.sender));
+      } on FormatException {
+        // Çözülemeyen zarf yine de aktarılır, yalnızca bildirimi sayılmaz
+      }
+      _relay(client, 'envelope', data);
+    });
+    on('receipts', (client, data, ack) {
+      final user = data['user'];
+      final read = Set<String>.from(data['read']);
+      for (final id in {...List<String>.from(data['delivered']), ...read}) {
+        final tally = _tallies[id];
+        if (tally == null || tally.sender == user) continue;
+        tally.delivered.add(user);
+        if (read.contains(id)) tally.read.add(user);
+        _dirtyTallies.add(id);
+      }
+      _receiptTimer ??= Timer(receiptWindow, _flushReceipts);
+    });
+    on('call', (client, data, ack) {
+      for (final peer in clients) {
+        if (peer != client && peer.user == data['to']) peer.emit('call', data);
+      }
+    });
+    on('e2e', (client, data, ack) {
+      final to = data['to'];
+      if (to == null) {
+        broadcast('e2e', data, room: rooms.containsKey(data['conversation']) ? data['conversation'] : null, except: client);
+        return;
+      }
+      for (final peer in clients) {
+        if (peer != client && peer.user == to) peer.emit('e2e', data);
+      }
+    });
+    on('mediaBegin', (client, data, ack) {
+      _tallies.putIfAbsent(data['id'], () => _ReceiptTally(data['groupId'], data['sender']));
+      final received = _transfers.putIfAbsent(data['id'], () => {});
+      var next = 0;
+      while (received.contains(next)) {
+        next++;
+      }
+      _relay(client, 'mediaBegin', data);
+      ack?.call({'next': next});
+    });
+    on('mediaChunk', (client, data, ack) {
+      _transfers[data['id']]?.add(data['seq']);
+      _relay(client, 'mediaChunk', data);
+      ack?.call({'ok': true});
+    });
+    on('mediaEnd', (client, data, ack) {
+      _relay(client, 'mediaEnd', data);
+      ack?.call({'ok': true});
+    });
+    on('groupCreate', (client, data, ack) {
+      final group = Map<String, dynamic>.from(data);
+      final members = List<String>.from(group['members'] ?? const []);
+      groups[group['id']] = group..['members'] = <String>[];
+      _logGroup(group['id']);
+      for (final user in members) {
+        _logMember(group['id'], user, true);
+      }
+      ack?.call({'revision': _revision});
+    });
+    on('groupSync', (client, data, ack) {
+      final since = data['since'] ?? 0;
+      final refresh = Set<String>.from(data['refresh'] ?? const []);
+      final changed = <String>{};
+      final members = [];
+      for (final entry in _groupLog) {
+        if (entry['rev'] <= since) continue;
+        if (entry.containsKey('user')) {
+          members.add(entry);
+        } else {
+          changed.add(entry['group']);
+        }
+      }
+      ack?.call({
+        'cursor': _revision,
+        'groups': [
+          for (final id in {...changed, ...refresh})
+            if (groups[id] != null) {...groups[id]!, 'memberCount': groups[id]!['members'].length}..remove('members')
+        ],
+        'removed': [for (final id in refresh) if (!groups.containsKey(id)) id],
+        'members': members,
+      });
+    });
+    on('statusPublish', (client, data, ack) {
+      final status = Map<String, dynamic>.from(data);
+      if (!_statuses.containsKey(status['id'])) {
+        _statuses[status['id']] = status;
+        _statusLog.add({'rev': ++_statusRevision, 'id': status['id']});
+        broadcast('statusChanged', {'cursor': _statusRevision}, except: client);
+      }
+      ack?.call({'cursor': _statusRevision});
+    });
+    on('statusSync', (client, data, ack) {
+      final now = DateTime.now().millisecondsSinceEpoch;
+      // Süresi dolan durumlar günlükten ve tablodan atılır
+      _statusLog.removeWhere((entry) {
+        final status = _statuses[entry['id']];
+        if (status != null && status['expiresAt'] > now) return false;
+        _statuses.remove(entry['id']);
+        return true;
+      });
+      final since = data['since'] ?? 0;
+      ack?.call({
+        'cursor': _statusRevision,
+        'statuses': [
+          for (final entry in _statusLog)
+            if (entry['rev'] > since) _statuses[entry['id']]
+        ],
+      });
+    });
+    on('locationBatch', (client, data, ack) {
+      _lastLocations[data['user']] = data;
+      broadcast('locationBatch', data, room: 'location:${data['user']}', except: client);
+    });
+    on('locationStop', (client, data, ack) {
+      _lastLocations.remove(data['user']);
+      broadcast('locationStop', data, room: 'location:${data['user']}', except: client);
+    });
+    on('locationWatch', (client, data, ack) => ack?.call(_lastLocations[data['user']]));
+    on('discoverContacts', (client, data, ack) {
+      final hashes = toBytes(data['hashes']);
+      const size = ContactDiscovery.hashLength;
+      final matches = [];
+      for (var i = 0; i * size < hashes.length; i++) {
+        final user = _phoneUsers[base64Encode(Uint8List.sublistView(hashes, i * size, (i + 1) * size))];
+        if (user != null) matches.add([i, user]);
+      }
+      ack?.call({'matches': matches});
+    });
+    on('groupJoin', (client, data, ack) => _changeMember(data, true, ack));
+    on('groupLeave', (client, data, ack) => _changeMember(data, false, ack));
+    on('groupMembers', (client, data, ack) {
+      final members = groups[data['group']]?['members'] as List<String>? ?? const <String>[];
+      final from = min(int.tryParse(data['after'] ?? '') ?? 0, members.length);
+      final to = min(from + (data['limit'] as int), members.length);
+      ack?.call({'members': members.sublist(from, to), 'next': '$to', 'count': members.length, 'done': to == members.length});
+    });
+  }
+
+  /// Pencere boyunca değişen sayıları gönderen başına tek özet olarak yollar.
+  void _flushReceipts() {
+    _receiptTimer = null;
+    final bySender = <String, List<Map<String, dynamic>>>{};
+    for (final id in _dirtyTallies) {
+      final tally = _tallies[id]!;
+      final members = groups[tally.group]?['members'] as List<String>?;
+      final total = (members?.length ?? rooms['group:${tally.group}']?.length ?? 1) - 1;
+      bySender.putIfAbsent('${tally.group}\n${tally.sender}', () => []).add({
+        'id': id,
+        'delivered': tally.delivered.length,
+        'read': tally.read.length,
+        'total': max(total, tally.delivered.length),
+      });
+    }
+    _dirtyTallies.clear();
+    bySender.forEach((key, updates) {
+      final parts = key.split('\n');
+      for (final client in clients) {
+        if (client.user == parts[1]) client.emit('receiptSummary', {'group': parts[0], 'updates': updates});
+      }
+    });
+  }
+
+  /// Eşleştirme denemeleri için bir numarayı kullanıcıya bağlar.
+  void registerPhone(String e164, String user) => _phoneUsers[base64Encode(ContactDiscovery.hashPhone(e164))] = user;
+
+  void _changeMember(dynamic data, bool joined, void Function(dynamic)? ack) {
+    if (!groups.containsKey(data['group'])) {
+      ack?.call({'error': 'Grup bulunamadı'});
+      return;
+    }
+    _logMember(data['group'], data['user'], joined);
+    ack?.call({'count': groups[data['group']]!['members'].length});
+  }
+
+  void _logGroup(String id) {
+    final group = groups[id]!;
+    group['revision'] = ++_revision;
+    group['updatedAt'] = DateTime.now().millisecondsSinceEpoch;
+    _groupLog.add({'rev': _revision, 'group': id});
+    broadcast('groupChanged', {'cursor': _revision});
+  }
+
+  void _logMember(String id, String user, bool joined) {
+    final members = groups[id]!['members'] as List<String>;
+    members.remove(user);
+    if (joined) members.add(user);
+    final change = {'rev': ++_revision, 'group': id, 'user': user, 'joined': joined, 'count': members.length};
+    _groupLog.add(change);
+    broadcast('memberChanged', change, room: 'group:$id');
+    broadcast('groupChanged', {'cursor': _revision});
+  }
+
+  int get port => _http!.port;
+  String get url => 'http://127.0.0.1:$port';
+
+  void on(String event, void Function(StandInClient client, dynamic data, void Function(dynamic)? ack) handler) {
+    _handlers[event] = handler;
+  }
+
+  Future<void> start({int port = 0}) async {
+    _http = await HttpServer.bind(InternetAddress.loopbackIPv4, port);
+    _http!.listen((request) async {
+      if (request.uri.path.startsWith('/socket.io') && WebSocketTransformer.isUpgradeRequest(request)) {
+        final socket = await WebSocketTransformer.upgrade(request);
+        clients.add(StandInClient._(this, socket));
+      } else {
+        request.response.statusCode = HttpStatus.badRequest;
+        await request.response.close();
+      }
+    });
+  }
+
+  /// Odaya (oda yoksa tüm istemcilere) olay gönderir.
+  void broadcast(String event, dynamic data, {String? room, StandInClient? except}) {
+    for (final client in room == null ? clients : (rooms[room] ?? const <StandInClient>{})) {
+      if (client != except) client.emit(event, data);
+    }
+  }
+
+  /// Gönderenin bulunduğu odalara aktarır; odası yoksa herkese.
+  void _relay(StandInClient from, String event, dynamic data) {
+    if (from.rooms.isEmpty) {
+      broadcast(event, data, except: from);
+      return;
+    }
+    final targets = <StandInClient>{};
+    for (final room in from.rooms) {
+      targets.addAll(rooms[room] ?? const {});
+    }
+    for (final client in targets) {
+      if (client != from) client.emit(event, data);
+    }
+  }
+
+  void _dispatch(StandInClient client, List args, int? ackId) {
+    final handler = _handlers[args[0]];
+    if (handler == null) return;
+    handler(client, args.length > 1 ? args[1] : null, ackId == null ? null : (res) => client._sendPacket(3, ackId, [res]));
+  }
+
+  void _remove(StandInClient client) {
+    clients.remove(client);
+    for (final room in client.rooms) {
+      rooms[room]?.remove(client);
+    }
+  }
+
+  /// Tüm bağlantıları aynı anda koparır (yeniden bağlanma fırtınası).
+  Future<void> dropAll() async {
+    for (final client in clients.toList()) {
+      await client.close();
+    }
+  }
+
+  Future<void> stop() async {
+    _receiptTimer?.cancel();
+    await dropAll();
+    await _http?.close(force: true);
+  }
+}
+
+/// Yerel sunucuya bağlı tek bir istemci.
+class StandInClient {
+  final LocalSocketServer _server;
+  final WebSocket _socket;
+  final String sid = const Uuid().v4();
+  final Set<String> rooms = {};
+  String? user;
+  late final Timer _ping;
+  List? _binaryArgs;
+  int? _binaryAckId;
+  int _binaryExpected = 0;
+  final List<Uint8List> _buffers = [];
+
+  StandInClient._(this._server, this._socket) {
+    _socket.add('0${jsonEncode({
+      'sid': sid,
+      'upgrades': [],
+      'pingInterval': _server.pingInterval.inMilliseconds,
+      'pingTimeout': 20000,
+      'maxPayload': 16 * 1024 * 1024,
+    })}');
+    _ping = Timer.periodic(_server.pingInterval, (_) => _socket.add('2'));
+    _socket.listen(_onFrame, onDone: () {
+      _ping.cancel();
+      _server._remove(this);
+    });
+  }
+
+  void join(String room) {
+    rooms.add(room);
+    _server.rooms.putIfAbsent(room, () => {}).add(this);
+  }
+
+  void leave(String room) {
+    rooms.remove(room);
+    _server.rooms[room]?.remove(this);
+  }
+
+  void emit(String event, dynamic data) => _sendPacket(2, null, [event, data]);
+
+  Future<void> close() async {
+    _ping.cancel();
+    await _socket.close(WebSocketStatus.goingAway);
+  }
+
+  void _sendPacket(int type, int? id, List args) {
+    final buffers = <Uint8List>[];
+    final json = jsonEncode(_deconstruct(args, buffers));
+    if (buffers.isEmpty) {
+      _socket.add('4$type${id ?? ''}$json');
+      return;
+    }
+    // EVENT/ACK -> BINARY_EVENT/BINARY_ACK, ekler ayrı ikili çerçevelerde
+    _socket.add('4${type + 3}${buffers.length}-${id ?? ''}$json');
+    buffers.forEach(_socket.add);
+  }
+
+  void _onFrame(dynamic frame) {
+    if (frame is! String) {
+      _buffers.add(toBytes(frame));
+      if (_buffers.length == _binaryExpected) {
+        final args = _reconstruct(_binaryArgs, _buffers) as List;
+        _buffers.clear();
+        _binaryExpected = 0;
+        _server._dispatch(this, args, _binaryAckId);
+      }
+      return;
+    }
+    if (frame.isEmpty || frame[0] != '4') return; // '3' pong, '1' close
+    final packet = frame.substring(1);
+    final type = int.parse(packet[0]);
+    var i = 1;
+    var attachments = 0;
+    if (type == 5 || type == 6) {
+      final dash = packet.indexOf('-', i);
+      attachments = int.parse(packet.substring(i, dash));
+      i = dash + 1;
+    }
+    final idStart = i;
+    while (i < packet.length && packet.codeUnitAt(i) >= 48 && packet.codeUnitAt(i) <= 57) {
+      i++;
+    }
+    final ackId = i > idStart ? int.parse(packet.substring(idStart, i)) : null;
+    final payload = i < packet.length ? jsonDecode(packet.substring(i)) : null;
+    switch (type) {
+      case 0:
+        _socket.add('40${jsonEncode({'sid': sid})}');
+        break;
+      case 1:
+        close();
+        break;
+      case 2:
+        _server._dispatch(this, payload as List, ackId);
+        break;
+      case 5:
+        _binaryArgs = payload as List;
+        _binaryAckId = ackId;
+        _binaryExpected = attachments;
+        break;
+    }
+  }
+
+  static dynamic _deconstruct(dynamic data, List<Uint8List> buffers) {
+    if (data is Uint8List || data is ByteBuffer) {
+      buffers.add(toBytes(data));
+      return {'_placeholder': true, 'num': buffers.length - 1};
+    }
+    if (data is List) return data.map((e) => _deconstruct(e, buffers)).toList();
+    if (data is Map) return data.map((k, v) => MapEntry(k, _deconstruct(v, buffers)));
+    return data;
+  }
+
+  static dynamic _reconstruct(dynamic data, List<Uint8List> buffers) {
+    if (data is Map && data['_placeholder'] == true) return buffers[data['num']];
+    if (data is List) return data.map((e) => _reconstruct(e, buffers)).toList();
+    if (data is Map) return data.map((k, v) => MapEntry(k, _reconstruct(v, buffers)));
+    return data;
+  }
+}
+
+class LoadBenchmarkConfig {
+  final int clients;
+  final double messagesPerSecond;
+  final Duration duration;
+  final int mediaBurstClients;
+  final int mediaBurstCount;
+  final int mediaBurstBytes;
+  final bool reconnectStorm;
+
+  const LoadBenchmarkConfig({
+    this.clients = 20,
+    this.messagesPerSecond = 5,
+    this.duration = const Duration(seconds: 20),
+    this.mediaBurstClients = 5,
+    this.mediaBurstCount = 5,
+    this.mediaBurstBytes = 256 * 1024,
+    this.reconnectStorm = true,
+  });
+
+  Map<String, dynamic> toJson() {
+    return {
+      'clients': clients,
+      'messagesPerSecond': messagesPerSecond,
+      'durationMs': duration.inMilliseconds,
+      'mediaBurstClients': mediaBurstClients,
+      'mediaBurstCount': mediaBurstCount,
+      'mediaBurstBytes': mediaBurstBytes,
+      'reconnectStorm': reconnectStorm,
+    };
+  }
+}
+
+/// Yerel sunucuya karşı yük üreten ölçüm düzeneği.
+///
+/// N istemci saniyede M `sendMessage` ve ara ara `typing` gönderir; çalışmanın
+/// üçte birinde medya patlaması (ikili zarflar), yarısında tüm bağlantıların
+/// koparıldığı bir yeniden bağlanma fırtınası yaşanır. Sonuç, sürümler arası
+/// karşılaştırma için JSON olarak yazılır. UI gerektirmez; bir ekran varsa
+/// [onObserved] ile ilk istemcinin aldığı mesajlar izlenebilir. Kare süreleri
+/// yalnızca bir Flutter binding'i çalışıyorsa toplanır ([collectFrames]);
+/// başsız çalıştırmada rapordaki `frames.collected` false olur.
+class LoadBenchmark {
+  static const int schemaVersion = 1;
+
+  final LoadBenchmarkConfig config;
+  final void Function(ChatMessage message)? onObserved;
+  final bool collectFrames;
+
+  LoadBenchmark({this.config = const LoadBenchmarkConfig(), this.onObserved, bool? collectFrames})
+      : collectFrames = collectFrames ?? _binding != null;
+
+  /// Çalışan binding; başsız (ör. `dart run`) ortamda null.
+  static SchedulerBinding? get _binding {
+    try {
+      return SchedulerBinding.instance;
+    } catch (_) {
+      return null;
+    }
+  }
+
+  Future<Map<String, dynamic>> run() async {
+    final server = LocalSocketServer();
+    await server.start();
+    final startedAt = DateTime.now();
+    final messageLatency = <double>[];
+    final mediaLatency = <double>[];
+    final reconnectLatency = <double>[];
+    final frames = <FrameTiming>[];
+    final rss = <int>[];
+    var sent = 0;
+    var mediaSent = 0;
+    var typingReceived = 0;
+    DateTime? stormAt;
+
+    void onTimings(List<FrameTiming> batch) => frames.addAll(batch);
+    final binding = collectFrames ? _binding : null;
+    binding?.addTimingsCallback(onTimings);
+    final memory = Timer.periodic(Duration(milliseconds: 250), (_) => rss.add(ProcessInfo.currentRss));
+
+    final sockets = <IO.Socket>[];
+    final connected = <Future<void>>[];
+    for (var i = 0; i < config.clients; i++) {
+      final socket = IO.io(server.url, {
+        'transports': ['websocket'],
+        'forceNew': true,
+        'autoConnect': true,
+        'reconnectionDelay': 100,
+        'reconnectionDelayMax': 2000,
+      });
+      final ready = Completer<void>();
+      socket.onConnect((_) {
+        if (!ready.isCompleted) {
+          ready.complete();
+        } else if (stormAt != null) {
+          reconnectLatency.add(DateTime.now().difference(stormAt!).inMicroseconds / 1000);
+        }
+      });
+      socket.on('receiveMessage', (data) {
+        messageLatency.add(DateTime.now().millisecondsSinceEpoch - (data['sentAt'] as num).toDouble());
+        if (i == 0) onObserved?.call(ChatMessage(id: data['id'], sender: data['username'], text: data['msg']));
+      });
+      socket.on('typing', (_) => typingReceived++);
+      socket.on('envelope', MessageEnvelope.handler((envelope) {
+        mediaLatency.add((DateTime.now().millisecondsSinceEpoch - envelope.timestamp).toDouble());
+      }));
+      sockets.add(socket);
+      connected.add(ready.future);
+    }
+    await Future.wait(connected).timeout(Duration(seconds: 30));
+
+    final interval = Duration(microseconds: (1000000 / config.messagesPerSecond).round());
+    final senders = <Timer>[];
+    for (var i = 0; i < sockets.length; i++) {
+      var n = 0;
+      senders.add(Timer.periodic(interval, (_) {
+        final username = 'bench$i';
+        sockets[i].emit('sendMessage', {
+          'id': const Uuid().v4(),
+          'username': username,
+          'msg': 'Mesaj ${n++}',
+          'sentAt': DateTime.now().millisecondsSinceEpoch,
+        });
+        sent++;
+        if (n % 10 == 0) sockets[i].emit('typing', {'conversation': 'bench', 'username': username, 'typing': true});
+      }));
+    }
+
+    final third = config.duration ~/ 3;
+    await Future.delayed(third);
+    final payload = Uint8List(config.mediaBurstBytes);
+    for (var i = 0; i < min(config.mediaBurstClients, sockets.length); i++) {
+      for (var k = 0; k < config.mediaBurstCount; k++) {
+        sockets[i].sendEnvelope(MessageEnvelope(
+          kind: MessageKind.media,
+          groupId: 'bench',
+          sender: 'bench$i',
+          contentType: 'image/jpeg',
+          payload: payload,
+        ));
+        mediaSent++;
+      }
+    }
+
+    await Future.delayed(config.duration ~/ 2 - third);
+    if (config.reconnectStorm) {
+      stormAt = DateTime.now();
+      await server.dropAll();
+    }
+
+    await Future.delayed(config.duration - config.duration ~/ 2);
+    for (final timer in senders) {
+      timer.cancel();
+    }
+    // Yoldaki mesajların ve kare zamanlamalarının gelmesini bekle
+    await Future.delayed(Duration(seconds: 2));
+    memory.cancel();
+    binding?.removeTimingsCallback(onTimings);
+    for (final socket in sockets) {
+      socket.dispose();
+    }
+    await server.stop();
+
+    double ms(Duration d) => d.inMicroseconds / 1000;
+    return {
+      'schema': schemaVersion,
+      'benchmark': 'chat_load',
+      'startedAt': startedAt.toIso8601String(),
+      'config': config.toJson(),
+      'messages': {
+        'sent': sent,
+        'delivered': messageLatency.length,
+        'expectedDeliveries': sent * (config.clients - 1),
+        'latency_ms': summarize(messageLatency),
+      },
+      'typing': {'received': typingReceived},
+      'media': {
+        'sent': mediaSent,
+        'delivered': mediaLatency.length,
+        'latency_ms': summarize(mediaLatency),
+      },
+      'reconnect': {
+        'reconnected': reconnectLatency.length,
+        'latency_ms': summarize(reconnectLatency),
+      },
+      'frames': {
+        'collected': binding != null,
+        'count': frames.length,
+        'build_ms': summarize(frames.map((t) => ms(t.buildDuration)).toList()),
+        'raster_ms': summarize(frames.map((t) => ms(t.rasterDuration)).toList()),
+      },
+      'memory': {
+        'rss_peak_mb': (rss.fold<int>(0, max) / (1 << 20)),
+        'rss_end_mb': ProcessInfo.currentRss / (1 << 20),
+      },
+    };
+  }
 
+  /// Sonucu `bench/` altına (veya [directory]'ye) zaman damgalı bir JSON
+  /// dosyası olarak yazar. Başsız çalıştırmada uygulama dizini bulunamayacağı
+  /// için [directory] verilmelidir.
+  static Future<File> save(Map<String, dynamic> report, {Directory? directory}) async {
+    final dir = directory ?? await AppStorage.dir('bench');
+    final file = File('${dir.path}/chat_load_${DateTime.now().millisecondsSinceEpoch}.json');
+    return file.writeAsString(JsonEncoder.withIndent('  ').convert(report));
+  }
+}
 
+class LoadBenchmarkScreen extends StatefulWidget {
   @override
-  State<GroupChatPage> createState() => _GroupChatPageState();
+  _LoadBenchmarkScreenState createState() => _LoadBenchmarkScreenState();
 }
 
-class _GroupChatPageState extends State<GroupChatPage> {
-  final TextEditingController _controller = TextEditingController();
-  final List<String> _messages = [];
-  final ImagePicker _picker = ImagePicker();
-  File? _selectedImage;
-  String? _selectedVideo;
-
+class _LoadBenchmarkScreenState extends State<LoadBenchmarkScreen> {
+  final MessageWindow _window = MessageWindow();
+  late final IngestBuffer<ChatMessage> _ingest;
+  String _report = '';
+  bool _running = false;
 
   @override
   void initState() {
     super.initState();
-    SocketService().init(widget.groupId, widget.userId);
-    SocketService().onMessage((data) {
+    _ingest = IngestBuffer(onFlush: (batch) {
+      if (!mounted) return;
       setState(() {
-        // Gelen mesajı kontrol et ve uygun şekilde işle
-        if (data['text'].startsWith("data:image")) {
-          _messages.add("Resim: " + data['text']);
-        } else if (data['text'].startsWith("data:video")) {
-          _messages.add("Video: " + data['text']);
-        } else {
-          _messages.add(data['text']);
-        }
+        _window.appendAll(batch, _window.end);
+        if (_window.length > MessageRepository.windowSize) _window.trimStart(_window.length - MessageRepository.windowSize);
       });
     });
   }
 
-  void _sendMessage() {
-    final text = _controller.text.trim();
-    if (text.isNotEmpty) {
-      SocketService().sendMessage(text);
-      setState(() {
-        _messages.add("Ben: $text");
+  Future<void> _run() async {
+    setState(() => _running = true);
+    final report = await LoadBenchmark(onObserved: _ingest.add).run();
+    final file = await LoadBenchmark.save(report);
+    print(jsonEncode(report));
+    if (!mounted) return;
+    setState(() {
+      _running = false;
+      _report = '${file.path}\n${JsonEncoder.withIndent('  ').convert(report)}';
+    });
+  }
+
+  @override
+  void dispose() {
+    _ingest.dispose();
+    super.dispose();
+  }
+
+  @override
+  Widget build(BuildContext context) => Scaffold(
+        appBar: AppBar(title: Text('Yük Ölçümü')),
+        body: Column(children: [
+          ElevatedButton(onPressed: _running ? null : _run, child: Text(_running ? 'Çalışıyor...' : 'Ölçümü Başlat')),
+          Expanded(
+            child: MessageListView(
+              window: _window,
+              tileBuilder: (m) => ListTile(dense: true, title: Text('${m.sender}: ${m.text}')),
+            ),
+          ),
+          if (_report.isNotEmpty) Expanded(child: SingleChildScrollView(child: SelectableText(_report))),
+        ]),
+      );
+}
+
+/// Bir istatistik okumasının özeti.
+class CallStats {
+  /// Milisaniye.
+  final double roundTripTime;
+  final double jitter;
+  /// Gönderilen videoda karşı tarafın bildirdiği kayıp oranı (0-1).
+  final double sendLoss;
+  /// Alınan videoda kayıp oranı (0-1).
+  final double receiveLoss;
+  /// kbps.
+  final double sendBitrate;
+  final double receiveBitrate;
+  final double sendFrameRate;
+  final double receiveFrameRate;
+  final int sendHeight;
+  final int receiveHeight;
+
+  const CallStats({
+    this.roundTripTime = 0,
+    this.jitter = 0,
+    this.sendLoss = 0,
+    this.receiveLoss = 0,
+    this.sendBitrate = 0,
+    this.receiveBitrate = 0,
+    this.sendFrameRate = 0,
+    this.receiveFrameRate = 0,
+    this.sendHeight = 0,
+    this.receiveHeight = 0,
+  });
+
+  Map<String, dynamic> toJson() => {
+        'rttMs': roundTripTime,
+        'jitterMs': jitter,
+        'sendLoss': sendLoss,
+        'receiveLoss': receiveLoss,
+        'sendKbps': sendBitrate,
+        'receiveKbps': receiveBitrate,
+        'sendFps': sendFrameRate,
+        'receiveFps': receiveFrameRate,
+        'sendHeight': sendHeight,
+        'receiveHeight': receiveHeight,
+      };
+}
+
+enum CallState { idle, calling, ringing, connecting, connected, ended }
+
+/// Bire bir WebRTC araması.
+///
+/// Teklif, yanıt ve ICE adayları paylaşılan socket üzerinden `to` alanıyla
+/// yönlendirilen tek bir `call` olayıyla gider. Uzak açıklama gelmeden önce
+/// ulaşan adaylar sıraya alınır. Bağlantı kurulunca [statsInterval]'da bir
+/// `getStats` okunur; RTT, jitter, kayıp, bit hızı ve kare hızı önceki okumayla
+/// farktan hesaplanıp [stats]'a yazılır. Kayıp %5'i veya RTT 400 ms'yi aşınca
+/// video göndericisinin bit hızı tavanı %30 düşürülür ve [minBitrate] civarında
+/// çözünürlük yarıya indirilir; üç okuma boyunca bağlantı temizse bit hızı
+/// %15 artırılır ve çözünürlük geri alınır.
+class CallSession extends ChangeNotifier {
+  static const Map<String, dynamic> configuration = {
+    'iceServers': [
+      {'urls': 'stun:stun.l.google.com:19302'},
+    ],
+    'sdpSemantics': 'unified-plan',
+  };
+
+  final IO.Socket socket;
+  final String user;
+  final Duration statsInterval;
+  final int minBitrate;
+  final int maxBitrate;
+  CallState state = CallState.idle;
+  String? peer;
+  String? callId;
+  MediaStream? localStream;
+  MediaStream? remoteStream;
+  CallStats stats = const CallStats();
+  /// Video göndericisinin bit hızı tavanı (bps) ve çözünürlük bölüneni.
+  int targetBitrate;
+  double scaleDown = 1;
+  RTCPeerConnection? _pc;
+  RTCSessionDescription? _pendingOffer;
+  final List<RTCIceCandidate> _pendingCandidates = [];
+  bool _remoteSet = false;
+  Timer? _statsTimer;
+  Map<String, Map<dynamic, dynamic>> _previous = {};
+  DateTime? _previousAt;
+  int _cleanReadings = 0;
+
+  CallSession({
+    required this.socket,
+    required this.user,
+    this.statsInterval = const Duration(seconds: 2),
+    this.minBitrate = 150000,
+    this.maxBitrate = 2500000,
+  }) : targetBitrate = maxBitrate {
+    socket.on('call', _onSignal);
+  }
+
+  static Future<MediaStream> openMedia({bool video = true}) =>
+      navigator.mediaDevices.getUserMedia({'audio': true, 'video': video ? {'facingMode': 'user'} : false});
+
+  void _setState(CallState next) {
+    state = next;
+    notifyListeners();
+  }
+
+  void _signal(String type, Map<String, dynamic> data) =>
+      socket.emit('call', {'type': type, 'callId': callId, 'from': user, 'to': peer, ...data});
+
+  Future<void> _open(MediaStream stream) async {
+    localStream = stream;
+    final pc = _pc = await createPeerConnection(configuration);
+    pc.onIceCandidate = (candidate) {
+      if (candidate.candidate == null) return;
+      _signal('candidate', {
+        'candidate': {'candidate': candidate.candidate, 'sdpMid': candidate.sdpMid, 'sdpMLineIndex': candidate.sdpMLineIndex},
       });
-      _controller.clear();
+    };
+    pc.onTrack = (event) {
+      if (event.streams.isEmpty) return;
+      remoteStream = event.streams.first;
+      notifyListeners();
+    };
+    pc.onConnectionState = (connectionState) {
+      switch (connectionState) {
+        case RTCPeerConnectionState.RTCPeerConnectionStateConnected:
+          _setState(CallState.connected);
+          _statsTimer ??= Timer.periodic(statsInterval, (_) => _pollStats());
+          break;
+        case RTCPeerConnectionState.RTCPeerConnectionStateFailed:
+          hangup();
+          break;
+        default:
+          break;
+      }
+    };
+    for (final track in stream.getTracks()) {
+      await pc.addTrack(track, stream);
     }
   }
 
-  // Medya seçme işlemi
-  Future<void> _pickMedia() async {
-    final pickedFile = await _picker.pickImage(source: ImageSource.gallery);
-    if (pickedFile != null) {
-      setState(() {
-        _selectedImage = File(pickedFile.path);
-      });
-      _sendImage(_selectedImage!);
+  /// [to] kullanıcısını arar; [stream] verilmezse kamera ve mikrofon açılır.
+  Future<void> call(String to, {MediaStream? stream}) async {
+    if (state != CallState.idle && state != CallState.ended) throw StateError('Zaten bir arama var');
+    peer = to;
+    callId = const Uuid().v4();
+    _reset();
+    _setState(CallState.calling);
+    await _open(stream ?? await openMedia());
+    final offer = await _pc!.createOffer({});
+    await _pc!.setLocalDescription(offer);
+    _signal('offer', {'sdp': offer.sdp});
+  }
+
+  /// Gelen aramayı yanıtlar.
+  Future<void> accept({MediaStream? stream}) async {
+    final offer = _pendingOffer;
+    if (state != CallState.ringing || offer == null) return;
+    _pendingOffer = null;
+    _setState(CallState.connecting);
+    await _open(stream ?? await openMedia());
+    await _pc!.setRemoteDescription(offer);
+    await _flushCandidates();
+    final answer = await _pc!.createAnswer({});
+    await _pc!.setLocalDescription(answer);
+    _signal('answer', {'sdp': answer.sdp});
+  }
+
+  Future<void> _flushCandidates() async {
+    _remoteSet = true;
+    for (final candidate in _pendingCandidates) {
+      await _pc!.addCandidate(candidate);
     }
+    _pendingCandidates.clear();
   }
 
-  // Video seçme işlemi
-  Future<void> _pickVideo() async {
-    final pickedFile = await _picker.pickVideo(source: ImageSource.gallery);
-    if (pickedFile != null) {
-      setState(() {
-        _selectedVideo = pickedFile.path;
-      });
-      _sendVideo(_selectedVideo!);
+  void _onSignal(dynamic data) async {
+    if (data['to'] != user) return;
+    final type = data['type'];
+    if (type == 'offer') {
+      if (state != CallState.idle && state != CallState.ended) {
+        // Meşgul; yalnızca arayana bildirilir
+        socket.emit('call', {'type': 'hangup', 'callId': data['callId'], 'from': user, 'to': data['from'], 'reason': 'busy'});
+        return;
+      }
+      _reset();
+      peer = data['from'];
+      callId = data['callId'];
+      _pendingOffer = RTCSessionDescription(data['sdp'], 'offer');
+      _setState(CallState.ringing);
+      return;
+    }
+    if (data['callId'] != callId) return;
+    switch (type) {
+      case 'answer':
+        await _pc?.setRemoteDescription(RTCSessionDescription(data['sdp'], 'answer'));
+        await _flushCandidates();
+        if (state == CallState.calling) _setState(CallState.connecting);
+        break;
+      case 'candidate':
+        final json = data['candidate'];
+        final candidate = RTCIceCandidate(json['candidate'], json['sdpMid'], json['sdpMLineIndex']);
+        if (_remoteSet && _pc != null) {
+          await _pc!.addCandidate(candidate);
+        } else {
+          _pendingCandidates.add(candidate);
+        }
+        break;
+      case 'hangup':
+        await _close();
+        break;
     }
   }
 
+  void _reset() {
+    _pendingCandidates.clear();
+    _remoteSet = false;
+    _previous = {};
+    _previousAt = null;
+    _cleanReadings = 0;
+    stats = const CallStats();
+    targetBitrate = maxBitrate;
+    scaleDown = 1;
+  }
 
-  // Resim olarak gönderme işlemi
-  void _sendVideo(String videoPath) {
-    final videoBytes = File(videoPath).readAsBytesSync();
-    final base64Video = base64Encode(videoBytes);
-    SocketService().sendMessage(base64Video);
-    setState(() {
-      _messages.add("Ben: Video gönderildi");
-    });
-}
+  Future<void> hangup() async {
+    if (state == CallState.idle || state == CallState.ended) return;
+    _signal('hangup', {});
+    await _close();
+  }
 
+  Future<void> _close() async {
+    _statsTimer?.cancel();
+    _statsTimer = null;
+    _pendingOffer = null;
+    final pc = _pc;
+    _pc = null;
+    await pc?.close();
+    localStream?.getTracks().forEach((track) => track.stop());
+    localStream = null;
+    remoteStream = null;
+    _setState(CallState.ended);
+  }
 
-  // Resim gönderme işlemi
-  void _sendImage(File image) {
-    final base64Image = base64Encode(image.readAsBytesSync());
-    SocketService().sendMessage(base64Image); // Media message (image in base64)
-    setState(() {
-      _messages.add("Ben: Resim gönderildi!");
-    });
+  static double _num(Map<dynamic, dynamic>? values, String key) {
+    final value = values?[key];
+    if (value is num) return value.toDouble();
+    if (value is String) return double.tryParse(value) ?? 0;
+    return 0;
+  }
+
+  Future<void> _pollStats() async {
+    final pc = _pc;
+    if (pc == null) return;
+    final reports = await pc.getStats();
+    if (!identical(_pc, pc)) return;
+    final now = DateTime.now();
+    final seconds = _previousAt == null ? 0.0 : now.difference(_previousAt!).inMilliseconds / 1000;
+    final current = <String, Map<dynamic, dynamic>>{};
+    Map<dynamic, dynamic>? inbound, outbound, remoteInbound, pair;
+    for (final report in reports) {
+      final values = report.values;
+      current[report.id] = values;
+      final video = values['kind'] == 'video' || values['mediaType'] == 'video';
+      switch (report.type) {
+        case 'inbound-rtp':
+          if (video) inbound = values..['id'] = report.id;
+          break;
+        case 'outbound-rtp':
+          if (video) outbound = values..['id'] = report.id;
+          break;
+        case 'remote-inbound-rtp':
+          if (video) remoteInbound = values;
+          break;
+        case 'candidate-pair':
+          if (values['nominated'] == true || values['state'] == 'succeeded') pair = values;
+          break;
+      }
+    }
+    double rate(Map<dynamic, dynamic>? values, String key) {
+      if (values == null || seconds <= 0) return 0;
+      final delta = _num(values, key) - _num(_previous[values['id']], key);
+      return max(delta, 0) * 8 / seconds / 1000;
+    }
+
+    var receiveLoss = 0.0;
+    if (inbound != null) {
+      final before = _previous[inbound!['id']];
+      final lost = _num(inbound, 'packetsLost') - _num(before, 'packetsLost');
+      final received = _num(inbound, 'packetsReceived') - _num(before, 'packetsReceived');
+      if (lost + received > 0) receiveLoss = max(lost, 0) / (lost + received);
+    }
+    final rtt = remoteInbound != null && remoteInbound!.containsKey('roundTripTime')
+        ? _num(remoteInbound, 'roundTripTime')
+        : _num(pair, 'currentRoundTripTime');
+    stats = CallStats(
+      roundTripTime: rtt * 1000,
+      jitter: _num(inbound, 'jitter') * 1000,
+      sendLoss: _num(remoteInbound, 'fractionLost'),
+      receiveLoss: receiveLoss,
+      sendBitrate: rate(outbound, 'bytesSent'),
+      receiveBitrate: rate(inbound, 'bytesReceived'),
+      sendFrameRate: _num(outbound, 'framesPerSecond'),
+      receiveFrameRate: _num(inbound, 'framesPerSecond'),
+      sendHeight: _num(outbound, 'frameHeight').round(),
+      receiveHeight: _num(inbound, 'frameHeight').round(),
+    );
+    _previous = current;
+    _previousAt = now;
+    notifyListeners();
+    if (seconds > 0) await adapt(stats);
+  }
+
+  /// Bağlantı durumuna göre video göndericisinin bit hızını ve çözünürlüğünü ayarlar.
+  Future<void> adapt(CallStats sample) async {
+    final degraded = sample.sendLoss > 0.05 || sample.roundTripTime > 400;
+    final clean = sample.sendLoss < 0.02 && sample.roundTripTime < 250;
+    var bitrate = targetBitrate;
+    var scale = scaleDown;
+    if (degraded) {
+      _cleanReadings = 0;
+      bitrate = max((bitrate * 0.7).round(), minBitrate);
+      if (bitrate <= minBitrate * 2 && scale < 4) scale *= 2;
+    } else if (clean && ++_cleanReadings >= 3) {
+      _cleanReadings = 0;
+      bitrate = min((bitrate * 1.15).round(), maxBitrate);
+      if (bitrate >= minBitrate * 4 && scale > 1) scale /= 2;
+    }
+    if (bitrate == targetBitrate && scale == scaleDown) return;
+    targetBitrate = bitrate;
+    scaleDown = scale;
+    notifyListeners();
+    await _applyEncoding();
+  }
+
+  Future<void> _applyEncoding() async {
+    final pc = _pc;
+    if (pc == null) return;
+    for (final sender in await pc.getSenders()) {
+      if (sender.track?.kind != 'video') continue;
+      final parameters = sender.parameters;
+      final encodings = parameters.encodings;
+      if (encodings == null || encodings.isEmpty) {
+        parameters.encodings = [RTCRtpEncoding(maxBitrate: targetBitrate, scaleResolutionDownBy: scaleDown)];
+      } else {
+        for (final encoding in encodings) {
+          encoding.maxBitrate = targetBitrate;
+          encoding.scaleResolutionDownBy = scaleDown;
+        }
+      }
+      await sender.setParameters(parameters);
+    }
   }
 
   @override
   void dispose() {
-    SocketService().disconnect();
+    socket.off('call', _onSignal);
+    if (state != CallState.idle && state != CallState.ended) _signal('hangup', {});
+    _statsTimer?.cancel();
+    _pc?.close();
+    _pc = null;
+    localStream?.getTracks().forEach((track) => track.stop());
     super.dispose();
   }
+}
 
-  
-  @override
-  Widget build(BuildContext context) {
-    return Scaffold(
-      appBar: AppBar(title: Text('Grup Mesajları')),
-      body: Column(
-        children: [
-          Expanded(
-            child: ListView(
-              padding: EdgeInsets.all(8),
-              children: _messages.map((msg) {
-                if (msg.startsWith("Ben: Resim")) {
-                  return Image.memory(base64Decode(msg.split(":")[1].trim()));
-                } else if (msg.startsWith("Ben: Video")) {
-                  return Text("Video gönderildi");
-                } else {
-                  return Text(msg);
-                }
-              }).toList(),
-            ),
-          ),
-          Row(
-            children: [
-              Expanded(child: TextField(controller: _controller)),
-              IconButton(icon: Icon(Icons.send), onPressed: _sendMessage),
-              IconButton(icon: Icon(Icons.image), onPressed: _pickMedia), // Medya seçme butonu
-              IconButton(icon: Icon(Icons.video_library), onPressed: _pickVideo), // Video seçme butonu
-            ],
-          ),
-        ],
-      ),
-    );
+/// Yerel sinyal sunucusu ve iki yerel eşle uçtan uca arama denemesi.
+///
+/// [LocalSocketServer] üzerinde iki istemci açılır, biri diğerini arar ve
+/// karşı taraf yanıtlar. Bağlantı süresi, [duration] boyunca okunan
+/// istatistikler ve yapay bir kötüleşmeye uyarlamanın tepkisi (bit hızı
+/// düşüp çözünürlük küçülüyor mu, temiz okumalarda geri geliyor mu) rapor
+/// edilir.
+class CallLoopbackTest {
+  final Duration duration;
+  final void Function(CallSession caller, CallSession callee)? onSessions;
+
+  CallLoopbackTest({this.duration = const Duration(seconds: 10), this.onSessions});
+
+  Future<Map<String, dynamic>> run() async {
+    final server = LocalSocketServer();
+    await server.start();
+    final sockets = <IO.Socket>[];
+    final sessions = <CallSession>[];
+    try {
+      for (final name in ['loopA', 'loopB']) {
+        final socket = IO.io(server.url, {'transports': ['websocket'], 'forceNew': true, 'autoConnect': true});
+        final ready = Completer<void>();
+        socket.onConnect((_) {
+          socket.emit('subscribe', {'room': 'call:$name', 'username': name});
+          if (!ready.isCompleted) ready.complete();
+        });
+        await ready.future.timeout(Duration(seconds: 10));
+        sockets.add(socket);
+        sessions.add(CallSession(socket: socket, user: name, statsInterval: Duration(seconds: 1)));
+      }
+      final caller = sessions[0], callee = sessions[1];
+      onSessions?.call(caller, callee);
+      final stream = await CallSession.openMedia();
+      callee.addListener(() {
+        if (callee.state == CallState.ringing) callee.accept(stream: stream);
+      });
+      final connected = Completer<void>();
+      caller.addListener(() {
+        if (caller.state == CallState.connected && !connected.isCompleted) connected.complete();
+      });
+      final startedAt = DateTime.now();
+      await caller.call('loopB', stream: stream);
+      await connected.future.timeout(Duration(seconds: 20));
+      final connectMs = DateTime.now().difference(startedAt).inMilliseconds;
+
+      final samples = <Map<String, dynamic>>[];
+      void record() => samples.add(caller.stats.toJson());
+      caller.addListener(record);
+      await Future.delayed(duration);
+      caller.removeListener(record);
+
+      final bad = CallStats(sendLoss: 0.12, roundTripTime: 600);
+      for (var i = 0; i < 6; i++) {
+        await caller.adapt(bad);
+      }
+      final degraded = {'bitrate': caller.targetBitrate, 'scale': caller.scaleDown};
+      final good = CallStats(roundTripTime: 40);
+      for (var i = 0; i < 60; i++) {
+        await caller.adapt(good);
+      }
+      final recovered = {'bitrate': caller.targetBitrate, 'scale': caller.scaleDown};
+
+      await caller.hangup();
+      stream.getTracks().forEach((track) => track.stop());
+      return {
+        'connectMs': connectMs,
+        'calleeState': callee.state.name,
+        'samples': samples,
+        'summary': {
+          for (final key in ['rttMs', 'jitterMs', 'receiveLoss', 'sendKbps', 'receiveKbps', 'receiveFps'])
+            key: summarize([for (final sample in samples) (sample[key] as num).toDouble()]),
+        },
+        'adaptation': {
+          'degraded': degraded,
+          'recovered': recovered,
+          'ok': (degraded['bitrate'] as int) < caller.maxBitrate && (degraded['scale'] as double) > 1 && recovered['bitrate'] == caller.maxBitrate && recovered['scale'] == 1.0,
+        },
+      };
+    } finally {
+      for (final session in sessions) {
+        session.dispose();
+      }
+      for (final socket in sockets) {
+        socket.dispose();
+      }
+      await server.stop();
+    }
   }
 }
 
 /// 9) Video Call
 class VideoCallScreen extends StatefulWidget {
-  const VideoCallScreen({Key? key}) : super(key: key);
+  final String username;
+
+  const VideoCallScreen({Key? key, required this.username}) : super(key: key);
 
   @override
   _VideoCallScreenState createState() => _VideoCallScreenState();
@@ -918,12 +7439,19 @@ class VideoCallScreen extends StatefulWidget {
 class _VideoCallScreenState extends State<VideoCallScreen> {
   final _localRenderer = RTCVideoRenderer();
   final _remoteRenderer = RTCVideoRenderer();
-  bool _inCalling = false;
+  final _peerCtrl = TextEditingController();
+  late final ChannelSubscription _channel;
+  late final CallSession _session;
+
+  bool get _inCalling => _session.state != CallState.idle && _session.state != CallState.ended;
 
   @override
   void initState() {
     super.initState();
     initRenderers();
+    // Sunucu gelen aramaları bu odadaki kullanıcıya yönlendirir
+    _channel = ConnectionManager.instance.subscribe('call:${widget.username}', params: {'username': widget.username});
+    _session = CallSession(socket: _channel.socket, user: widget.username)..addListener(_onCallChanged);
   }
 
   Future<void> initRenderers() async {
@@ -931,33 +7459,63 @@ class _VideoCallScreenState extends State<VideoCallScreen> {
     await _remoteRenderer.initialize();
   }
 
-  Future<void> startCall() async {
-    final mediaConstraints = {'audio': true, 'video': {'facingMode': 'user'}};
-    MediaStream stream = await navigator.mediaDevices.getUserMedia(mediaConstraints);
-    _localRenderer.srcObject = stream;
-    _remoteRenderer.srcObject = stream;
-    setState(() => _inCalling = true);
+  void _onCallChanged() {
+    _localRenderer.srcObject = _session.localStream;
+    _remoteRenderer.srcObject = _session.remoteStream;
+    if (mounted) setState(() {});
   }
 
-  Future<void> endCall() async {
-    _localRenderer.srcObject?.getTracks().forEach((t) => t.stop());
-    _remoteRenderer.srcObject?.getTracks().forEach((t) => t.stop());
-    setState(() => _inCalling = false);
+  Future<void> startCall() async {
+    final peer = _peerCtrl.text.trim();
+    if (peer.isEmpty || peer == widget.username) return;
+    try {
+      await _session.call(peer);
+    } catch (e) {
+      print("Arama başlatılamadı: $e");
+      await _session.hangup();
+    }
   }
 
+  Future<void> endCall() => _session.hangup();
+
   @override
   void dispose() {
+    _session
+      ..removeListener(_onCallChanged)
+      ..dispose();
+    _channel.cancel();
+    _peerCtrl.dispose();
     _localRenderer.dispose();
     _remoteRenderer.dispose();
     super.dispose();
   }
 
+  String _describeStats() {
+    final stats = _session.stats;
+    return 'RTT ${stats.roundTripTime.round()} ms · jitter ${stats.jitter.round()} ms · '
+        'kayıp %${(stats.receiveLoss * 100).toStringAsFixed(1)}/%${(stats.sendLoss * 100).toStringAsFixed(1)}\n'
+        '↑ ${stats.sendBitrate.round()} kbps ${stats.sendHeight}p ${stats.sendFrameRate.round()} fps · '
+        '↓ ${stats.receiveBitrate.round()} kbps ${stats.receiveHeight}p ${stats.receiveFrameRate.round()} fps\n'
+        'Tavan ${_session.targetBitrate ~/ 1000} kbps · ölçek 1/${_session.scaleDown.round()}';
+  }
+
   @override
   Widget build(BuildContext context) => Scaffold(
         appBar: AppBar(title: Text('Görüntülü Arama')),
         body: Column(children: [
           Expanded(child: RTCVideoView(_localRenderer, mirror: true)),
           Expanded(child: RTCVideoView(_remoteRenderer)),
+          if (_session.state == CallState.connected) Text(_describeStats(), textAlign: TextAlign.center),
+          if (_session.state == CallState.ringing)
+            ListTile(
+              leading: Icon(Icons.call),
+              title: Text('${_session.peer} arıyor'),
+              trailing: Row(mainAxisSize: MainAxisSize.min, children: [
+                IconButton(icon: Icon(Icons.call, color: Colors.green), onPressed: () => _session.accept()),
+                IconButton(icon: Icon(Icons.call_end, color: Colors.red), onPressed: endCall),
+              ]),
+            ),
+          if (!_inCalling) TextField(controller: _peerCtrl, decoration: InputDecoration(labelText: 'Aranacak kullanıcı')),
           Row(mainAxisAlignment: MainAxisAlignment.center, children: [
             ElevatedButton(onPressed: _inCalling ? null : startCall, child: Text('Aramayı Başlat')),
             SizedBox(width: 20),
@@ -967,6 +7525,69 @@ class _VideoCallScreenState extends State<VideoCallScreen> {
       );
 }
 
+class CallLoopbackScreen extends StatefulWidget {
+  @override
+  State<CallLoopbackScreen> createState() => _CallLoopbackScreenState();
+}
+
+class _CallLoopbackScreenState extends State<CallLoopbackScreen> {
+  final _callerRenderer = RTCVideoRenderer();
+  final _calleeRenderer = RTCVideoRenderer();
+  String _report = '';
+  bool _running = false;
+
+  @override
+  void initState() {
+    super.initState();
+    _callerRenderer.initialize();
+    _calleeRenderer.initialize();
+  }
+
+  Future<void> _run() async {
+    setState(() => _running = true);
+    String report;
+    try {
+      final result = await CallLoopbackTest(onSessions: (caller, callee) {
+        // Her iki eşin aldığı uzak görüntü gösterilir
+        caller.addListener(() => _callerRenderer.srcObject = caller.remoteStream);
+        callee.addListener(() => _calleeRenderer.srcObject = callee.remoteStream);
+      }).run();
+      report = JsonEncoder.withIndent('  ').convert(result);
+    } catch (e) {
+      report = 'Başarısız: $e';
+    }
+    print(report);
+    if (!mounted) return;
+    setState(() {
+      _running = false;
+      _report = report;
+    });
+  }
+
+  @override
+  void dispose() {
+    _callerRenderer.dispose();
+    _calleeRenderer.dispose();
+    super.dispose();
+  }
+
+  @override
+  Widget build(BuildContext context) => Scaffold(
+        appBar: AppBar(title: Text('Arama Döngü Testi')),
+        body: Column(children: [
+          ElevatedButton(onPressed: _running ? null : _run, child: Text(_running ? 'Çalışıyor...' : 'Testi Başlat')),
+          SizedBox(
+            height: 160,
+            child: Row(children: [
+              Expanded(child: RTCVideoView(_callerRenderer)),
+              Expanded(child: RTCVideoView(_calleeRenderer)),
+            ]),
+          ),
+          if (_report.isNotEmpty) Expanded(child: SingleChildScrollView(child: SelectableText(_report))),
+        ]),
+      );
+}
+
 class GroupDetailPage extends StatefulWidget {
   final String groupId;
   final String groupName;
@@ -979,12 +7600,46 @@ class GroupDetailPage extends StatefulWidget {
 }
 
 class _GroupDetailPageState extends State<GroupDetailPage> {
-  bool isMember = false;
+  late final MembershipIndex _members;
+  final ScrollController _scroll = ScrollController();
+  int _limit = 50;
 
-  void _toggleMembership() {
-    setState(() {
-      isMember = !isMember;
-    });
+  bool get isMember => _members.contains(widget.userId);
+
+  @override
+  void initState() {
+    super.initState();
+    _members = MembershipIndex.of(widget.groupId)..addListener(_onMembersChanged);
+    _members.fetchMore();
+    _scroll.addListener(_onScroll);
+  }
+
+  void _onMembersChanged() {
+    if (mounted) setState(() {});
+  }
+
+  void _onScroll() {
+    if (_scroll.position.extentAfter > 400) return;
+    if (_members.page(limit: _limit).members.length < _limit) {
+      // Yerelde gösterilecek üye kalmadı; sıradaki sayfa sunucudan gelir
+      _members.fetchMore();
+      return;
+    }
+    setState(() => _limit += 50);
+  }
+
+  Future<void> _toggleMembership() async {
+    try {
+      if (isMember) {
+        await _members.leave(widget.userId);
+      } else {
+        await _members.join(widget.userId);
+      }
+    } on TimeoutException {
+      if (mounted) ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text('İşlem tamamlanamadı')));
+    } on StateError catch (e) {
+      if (mounted) ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text(e.message)));
+    }
   }
 
   void _openChat() {
@@ -1001,15 +7656,23 @@ class _GroupDetailPageState extends State<GroupDetailPage> {
     }
   }
 
+  @override
+  void dispose() {
+    _members.removeListener(_onMembersChanged);
+    _scroll.dispose();
+    super.dispose();
+  }
+
   @override
   Widget build(BuildContext context) {
+    final page = _members.page(limit: _limit).members;
     return Scaffold(
       appBar: AppBar(title: Text(widget.groupName)),
       body: Column(
         children: [
           ListTile(
             title: Text('Grup: ${widget.groupName}'),
-            subtitle: Text('Katılımcı: ??? kişi'),
+            subtitle: Text('Katılımcı: ${_members.count} kişi'),
           ),
           ElevatedButton(
             onPressed: _toggleMembership,
@@ -1021,12 +7684,213 @@ class _GroupDetailPageState extends State<GroupDetailPage> {
               icon: Icon(Icons.chat),
               label: Text('Sohbete Git'),
             ),
+          if (isMember)
+            ElevatedButton.icon(
+              onPressed: () => Navigator.push(
+                context,
+                MaterialPageRoute(builder: (_) => NearbySharingPage(groupId: widget.groupId, userId: widget.userId)),
+              ),
+              icon: Icon(Icons.near_me),
+              label: Text('Yakındakiler'),
+            ),
+          Expanded(
+            child: ListView.builder(
+              controller: _scroll,
+              itemCount: page.length,
+              itemBuilder: (_, i) => ListTile(key: ValueKey(page[i]), dense: true, title: Text(page[i])),
+            ),
+          ),
         ],
       ),
     );
   }
 }
 
+/// Grup üyelerinin paylaştığı canlı konumlar: kümelenmiş harita ve yakındakiler.
+///
+/// Yüklü üye sayfalarındaki en fazla [maxWatched] üye izlenir.
+class NearbySharingPage extends StatefulWidget {
+  static const int maxWatched = 500;
+
+  final String groupId;
+  final String userId;
+
+  const NearbySharingPage({required this.groupId, required this.userId});
+
+  @override
+  State<NearbySharingPage> createState() => _NearbySharingPageState();
+}
+
+class _NearbySharingPageState extends State<NearbySharingPage> {
+  static const double _radius = 1000;
+
+  late final MembershipIndex _members;
+  late final SharedLocationMap _map;
+  final LiveLocationWatcher _watcher = LiveLocationWatcher.instance;
+  /// Bu sayfanın izlemeye aldığı kullanıcılar; çıkarken yalnızca bunlar bırakılır.
+  final Set<String> _added = {};
+  double? _latitude;
+  double? _longitude;
+  int _zoom = 14;
+
+  @override
+  void initState() {
+    super.initState();
+    _members = MembershipIndex.of(widget.groupId)..addListener(_watchMembers);
+    _map = SharedLocationMap(_watcher, filter: _members.contains)..addListener(_onMapChanged);
+    _watchMembers();
+  }
+
+  void _watchMembers() {
+    final watching = _watcher.watching.toSet();
+    for (final user in _members.page(limit: NearbySharingPage.maxWatched).members) {
+      if (user == widget.userId || watching.contains(user)) continue;
+      _added.add(user);
+      _watcher.watch(user);
+    }
+  }
+
+  void _onMapChanged() {
+    if (mounted) setState(() {});
+  }
+
+  @override
+  void dispose() {
+    _members.removeListener(_watchMembers);
+    _map
+      ..removeListener(_onMapChanged)
+      ..dispose();
+    _added.forEach(_watcher.unwatch);
+    super.dispose();
+  }
+
+  /// Harita merkezi: seçilen nokta, yoksa kendi konumum, yoksa ilk paylaşan.
+  List<double> get _center {
+    if (_latitude != null) return [_latitude!, _longitude!];
+    final own = LiveLocationSharer.instance.latest;
+    if (own != null) return [own.latitude, own.longitude];
+    if (_map.index.length > 0) {
+      final point = _map.index[_map.index.ids.first]!;
+      return [point.latitude, point.longitude];
+    }
+    return [41.0082, 28.9784];
+  }
+
+  void _pan(Offset delta, List<double> center) {
+    final x = _ClusterPainter.worldX(center[1], _zoom) - delta.dx;
+    final y = _ClusterPainter.worldY(center[0], _zoom) - delta.dy;
+    setState(() {
+      _latitude = _ClusterPainter.latitudeAt(y, _zoom);
+      _longitude = _ClusterPainter.longitudeAt(x, _zoom);
+    });
+  }
+
+  @override
+  Widget build(BuildContext context) {
+    final center = _center;
+    final nearby = _map.index.within(center[0], center[1], _radius);
+    return Scaffold(
+      appBar: AppBar(title: Text('Yakında Paylaşanlar (${_map.index.length})')),
+      body: Column(children: [
+        Expanded(
+          child: LayoutBuilder(builder: (context, constraints) {
+            final size = constraints.biggest;
+            final clusters = _map.index.clusters(_ClusterPainter.viewport(center, _zoom, size), _zoom);
+            return GestureDetector(
+              onPanUpdate: (details) => _pan(details.delta, center),
+              child: ClipRect(child: CustomPaint(size: size, painter: _ClusterPainter(clusters, center, _zoom))),
+            );
+          }),
+        ),
+        Slider(
+          value: _zoom.toDouble(),
+          min: 2,
+          max: 18,
+          divisions: 16,
+          label: 'Yakınlaştırma $_zoom',
+          onChanged: (value) => setState(() => _zoom = value.round()),
+        ),
+        SizedBox(
+          height: 160,
+          child: nearby.isEmpty
+              ? Center(child: Text('${_radius.round()} m içinde kimse yok'))
+              : ListView.builder(
+                  itemCount: nearby.length,
+                  itemBuilder: (_, i) {
+                    final point = _map.index[nearby[i]]!;
+                    final distance = distanceMeters(center[0], center[1], point.latitude, point.longitude);
+                    return ListTile(
+                      key: ValueKey(nearby[i]),
+                      dense: true,
+                      leading: Icon(Icons.location_on),
+                      title: Text(nearby[i]),
+                      trailing: Text('${distance.round()} m'),
+                    );
+                  },
+                ),
+        ),
+      ]),
+    );
+  }
+}
+
+/// Kümeleri Web Mercator izdüşümünde, merkez tuvalin ortasında olacak şekilde çizer.
+class _ClusterPainter extends CustomPainter {
+  final List<LocationCluster> clusters;
+  final List<double> center;
+  final int zoom;
+
+  _ClusterPainter(this.clusters, this.center, this.zoom);
+
+  static double worldX(double longitude, int zoom) => (longitude + 180) / 360 * 256 * (1 << zoom);
+
+  static double worldY(double latitude, int zoom) {
+    final lat = latitude.clamp(-85.05112878, 85.05112878) * pi / 180;
+    return (1 - log(tan(lat) + 1 / cos(lat)) / pi) / 2 * 256 * (1 << zoom);
+  }
+
+  static double longitudeAt(double x, int zoom) => x / (256 * (1 << zoom)) * 360 - 180;
+
+  static double latitudeAt(double y, int zoom) {
+    final n = pi - 2 * pi * y / (256 * (1 << zoom));
+    return atan(0.5 * (exp(n) - exp(-n))) * 180 / pi;
+  }
+
+  /// [size] boyutundaki tuvalde görünen alan.
+  static GeoBounds viewport(List<double> center, int zoom, Size size) {
+    final x = worldX(center[1], zoom), y = worldY(center[0], zoom);
+    return GeoBounds(
+      south: latitudeAt(y + size.height / 2, zoom),
+      west: max(longitudeAt(x - size.width / 2, zoom), -180),
+      north: latitudeAt(y - size.height / 2, zoom),
+      east: min(longitudeAt(x + size.width / 2, zoom), 180),
+    );
+  }
+
+  @override
+  void paint(Canvas canvas, Size size) {
+    canvas.drawRect(Offset.zero & size, Paint()..color = Colors.blueGrey.shade50);
+    final originX = worldX(center[1], zoom) - size.width / 2;
+    final originY = worldY(center[0], zoom) - size.height / 2;
+    final fill = Paint()..color = Colors.teal;
+    for (final cluster in clusters) {
+      final offset = Offset(worldX(cluster.longitude, zoom) - originX, worldY(cluster.latitude, zoom) - originY);
+      final radius = cluster.count == 1 ? 6.0 : 10 + 4 * log(cluster.count);
+      canvas.drawCircle(offset, radius, fill);
+      final label = TextPainter(
+        text: TextSpan(text: cluster.user ?? '${cluster.count}', style: TextStyle(color: cluster.count == 1 ? Colors.black87 : Colors.white, fontSize: 11)),
+        textDirection: TextDirection.ltr,
+      )..layout();
+      final at = cluster.count == 1 ? offset + Offset(8, -label.height / 2) : offset - Offset(label.width / 2, label.height / 2);
+      label.paint(canvas, at);
+    }
+    canvas.drawCircle(Offset(size.width / 2, size.height / 2), 3, Paint()..color = Colors.red);
+  }
+
+  @override
+  bool shouldRepaint(_ClusterPainter old) => old.clusters != clusters || old.zoom != zoom || old.center != center;
+}
+
 class FriendlyRequests extends StatefulWidget {
   @override
   _FriendlyRequestsState createState() => _FriendlyRequestsState();